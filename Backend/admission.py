@@ -0,0 +1,215 @@
+# Admission control per deployment: max in-flight, bounded FIFO queue, RPM/TPM token buckets
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    """The deployment's wait queue is full; retry after `retry_after` seconds."""
+
+    def __init__(self, deployment: Optional[str], retry_after: float):
+        super().__init__(f"deployment {deployment!r} is overloaded")
+        self.deployment = deployment
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Refills `rate_per_minute` units per minute up to one minute's worth."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay_for(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (0 when available now)."""
+        self._refill()
+        # A single request larger than the bucket is admitted once the bucket is full
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+
+class Ticket:
+    """One request's place in a deployment's queue, then its in-flight slot."""
+
+    def __init__(self, limiter: "DeploymentLimiter", tokens: int, requests: int):
+        self.limiter = limiter
+        self.tokens = tokens
+        self.requests = requests
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.released = False
+        self._admitted = asyncio.Event()
+
+    @property
+    def admitted(self) -> bool:
+        return self._admitted.is_set()
+
+    @property
+    def position(self) -> int:
+        """1-based position in the queue (0 once admitted)."""
+        if self.admitted:
+            return 0
+        try:
+            return self.limiter._queue.index(self) + 1
+        except ValueError:
+            return 0
+
+    @property
+    def waited(self) -> float:
+        return (self.admitted_at or time.monotonic()) - self.enqueued_at
+
+    async def wait(self, interval: float = 1.0) -> AsyncIterator[int]:
+        """Wait for admission, yielding the queue position whenever it changes (polled every `interval`)."""
+        last_position = None
+        while not self.admitted:
+            position = self.position
+            if position != last_position:
+                last_position = position
+                yield position
+            try:
+                await asyncio.wait_for(self._admitted.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self) -> None:
+        """Free the slot (or leave the queue if never admitted); safe to call twice."""
+        if self.released:
+            return
+        self.released = True
+        self.limiter._release(self)
+
+
+class DeploymentLimiter:
+    def __init__(self, name: Optional[str], *, max_in_flight: int, max_queue: int, rpm: float = 0, tpm: float = 0):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.requests_bucket = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens_bucket = TokenBucket(tpm) if tpm > 0 else None
+        self.in_flight = 0
+        self._queue: Deque[Ticket] = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Moving average of how long a request holds its slot, for Retry-After
+        self._avg_hold = 5.0
+        self.admitted = 0
+        self.rejected = 0
+
+    def enqueue(self, tokens: int, requests: int = 1) -> Ticket:
+        """Take a place in line (admitted right away when possible); raises AdmissionRejected when it would have to wait in a full queue."""
+        ticket = Ticket(self, tokens, requests)
+        admissible = not self._queue and self.in_flight < self.max_in_flight and self._bucket_delay(ticket) == 0
+        if not admissible and len(self._queue) >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(self.name, self.retry_after())
+        self._queue.append(ticket)
+        self._pump()
+        return ticket
+
+    def retry_after(self) -> float:
+        """Rough time until a newly queued request would be admitted."""
+        waves = (len(self._queue) + 1) / max(self.max_in_flight, 1)
+        estimate = waves * self._avg_hold
+        if self.requests_bucket is not None:
+            queued_requests = sum(ticket.requests for ticket in self._queue) + 1
+            estimate = max(estimate, self.requests_bucket.delay_for(queued_requests))
+        return max(1.0, math.ceil(estimate))
+
+    def _bucket_delay(self, ticket: Ticket) -> float:
+        delay = 0.0
+        if self.requests_bucket is not None:
+            delay = max(delay, self.requests_bucket.delay_for(ticket.requests))
+        if self.tokens_bucket is not None:
+            delay = max(delay, self.tokens_bucket.delay_for(ticket.tokens))
+        return delay
+
+    def _pump(self) -> None:
+        """Admit queued tickets in FIFO order while slots and rate budget allow."""
+        while self._queue and self.in_flight < self.max_in_flight:
+            ticket = self._queue[0]
+            delay = self._bucket_delay(ticket)
+            if delay > 0:
+                if self._timer is None:
+                    loop = asyncio.get_running_loop()
+                    self._timer = loop.call_later(delay, self._on_timer)
+                return
+            self._queue.popleft()
+            if self.requests_bucket is not None:
+                self.requests_bucket.take(ticket.requests)
+            if self.tokens_bucket is not None:
+                self.tokens_bucket.take(ticket.tokens)
+            self.in_flight += 1
+            self.admitted += 1
+            ticket.admitted_at = time.monotonic()
+            ticket._admitted.set()
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._pump()
+
+    def _release(self, ticket: Ticket) -> None:
+        if ticket.admitted:
+            self.in_flight -= 1
+            held = time.monotonic() - ticket.admitted_at
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+        else:
+            try:
+                self._queue.remove(ticket)
+            except ValueError:
+                pass
+        self._pump()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": len(self._queue),
+            "max_queue": self.max_queue,
+            "rpm": self.requests_bucket.capacity if self.requests_bucket else None,
+            "tpm": self.tokens_bucket.capacity if self.tokens_bucket else None,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_hold_seconds": round(self._avg_hold, 3),
+        }
+
+
+class AdmissionController:
+    """
+    One limiter per Azure OpenAI deployment.
+
+    `defaults` applies to every deployment; `overrides` maps a deployment name to
+    any of max_in_flight / max_queue / rpm / tpm.
+    """
+
+    def __init__(self, defaults: dict, overrides: Optional[Dict[str, dict]] = None):
+        self.defaults = defaults
+        self.overrides = overrides or {}
+        self._limiters: Dict[Optional[str], DeploymentLimiter] = {}
+
+    def limiter(self, deployment: Optional[str]) -> DeploymentLimiter:
+        limiter = self._limiters.get(deployment)
+        if limiter is None:
+            settings = {**self.defaults, **self.overrides.get(deployment or "", {})}
+            limiter = self._limiters[deployment] = DeploymentLimiter(deployment, **settings)
+        return limiter
+
+    def enqueue(self, deployment: Optional[str], tokens: int, requests: int = 1) -> Ticket:
+        return self.limiter(deployment).enqueue(tokens, requests)
+
+    def stats(self) -> dict:
+        return {name or "": limiter.stats() for name, limiter in self._limiters.items()}
@@ -0,0 +1,210 @@
+# Prebuilt agent/workflow templates keyed by (flow, deployment, language, tone)
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from agent_framework import ChatAgent
+
+from translations import get_text
+
+logger = logging.getLogger(__name__)
+
+TONES = ("formal", "balanced", "casual", "concise", "detailed")
+
+
+@dataclass(frozen=True)
+class AgentSpec:
+    """Declarative description of one agent in a flow."""
+
+    name: str
+    instructions_key: str
+    description: Optional[str] = None
+    tools: Tuple[Callable, ...] = ()
+    # Let the model request several tool calls in one turn; the framework runs them concurrently
+    parallel_tool_calls: bool = False
+    # Chat/agent middleware instances; shared by every agent built from the spec
+    middleware: Tuple[Any, ...] = ()
+
+
+@dataclass
+class FlowDefinition:
+    agents: List[AgentSpec]
+    # Builds a fresh workflow from the (shared) agents and a per-instance state dict
+    build_workflow: Optional[Callable[[Dict[str, ChatAgent], dict], Any]] = None
+    uses_tone: bool = False
+
+
+@dataclass
+class FlowInstance:
+    """Agents plus a never-run workflow, handed out to exactly one request."""
+
+    agents: Dict[str, ChatAgent]
+    workflow: Any = None
+    state: dict = field(default_factory=dict)
+
+
+class AgentTemplateRegistry:
+    """
+    Precomputes instruction strings and ChatAgent objects per (flow, deployment,
+    language, tone) and keeps a small pool of prebuilt workflows per key.
+
+    ChatAgent objects hold no per-run state, so one set is shared by all requests
+    for a key. Workflows cannot be run concurrently and keep executor state between
+    runs, so each request gets a never-used instance from the pool. The replacement
+    is built off the request path: checkout() only queues the key, and a loop
+    callback rebuilds one workflow per tick so pending requests run in between.
+    A request only builds its own workflow when a burst empties the pool.
+    """
+
+    def __init__(self, language: str, pool_size: int = 2):
+        self.language = language
+        self.pool_size = pool_size
+        self._flows: Dict[str, FlowDefinition] = {}
+        self._tone_suffixes = {tone: get_text(f'tone_{tone}', language) for tone in TONES}
+        self._agents: Dict[Tuple, Tuple[Any, Dict[str, ChatAgent]]] = {}
+        self._pools: Dict[Tuple, Deque[FlowInstance]] = {}
+        # Keys waiting for one replacement workflow each
+        self._refills: Deque[Tuple] = deque()
+        self._refill_scheduled = False
+
+        self.agent_builds = 0
+        self.agent_hits = 0
+        self.workflow_builds = 0
+        self.pool_hits = 0
+        self.pool_misses = 0
+        self.refills = 0
+        self._agent_build_ms = 0.0
+        self._workflow_build_ms = 0.0
+
+    def register(self, flow: str, definition: FlowDefinition) -> None:
+        self._flows[flow] = definition
+
+    def tone_suffix(self, tone: Optional[str]) -> str:
+        return self._tone_suffixes.get(tone or "balanced", self._tone_suffixes["balanced"])
+
+    def _key(self, flow: str, deployment: Optional[str], tone: Optional[str]) -> Tuple:
+        definition = self._flows[flow]
+        if definition.uses_tone:
+            tone = tone if tone in self._tone_suffixes else "balanced"
+        else:
+            tone = None
+        return (flow, deployment, self.language, tone)
+
+    def agents(self, flow: str, deployment: Optional[str], chat_client: Any, tone: Optional[str] = None) -> Dict[str, ChatAgent]:
+        """Return the shared agents for a key, building them on first use."""
+        key = self._key(flow, deployment, tone)
+        cached = self._agents.get(key)
+        if cached is not None and cached[0] is chat_client:
+            self.agent_hits += 1
+            return cached[1]
+
+        start = time.perf_counter()
+        definition = self._flows[flow]
+        tone_suffix = self.tone_suffix(key[3]) if definition.uses_tone else None
+        agents: Dict[str, ChatAgent] = {}
+        for spec in definition.agents:
+            if tone_suffix is not None:
+                instructions = get_text(spec.instructions_key, self.language, tone_suffix=tone_suffix)
+            else:
+                instructions = get_text(spec.instructions_key, self.language)
+            agents[spec.name] = ChatAgent(
+                name=spec.name,
+                chat_client=chat_client,
+                description=spec.description,
+                instructions=instructions,
+                tools=list(spec.tools) or None,
+                middleware=list(spec.middleware) or None,
+                default_options={"allow_multiple_tool_calls": True} if spec.tools and spec.parallel_tool_calls else None,
+            )
+        self._agent_build_ms = (time.perf_counter() - start) * 1000
+        self.agent_builds += 1
+        self._agents[key] = (chat_client, agents)
+        # A new chat client invalidates any workflows prebuilt for the old one
+        self._pools.pop(key, None)
+        return agents
+
+    def _build_instance(self, key: Tuple, agents: Dict[str, ChatAgent]) -> FlowInstance:
+        definition = self._flows[key[0]]
+        instance = FlowInstance(agents=agents)
+        if definition.build_workflow is not None:
+            start = time.perf_counter()
+            instance.workflow = definition.build_workflow(agents, instance.state)
+            self._workflow_build_ms = (time.perf_counter() - start) * 1000
+            self.workflow_builds += 1
+        return instance
+
+    def checkout(self, flow: str, deployment: Optional[str], chat_client: Any, tone: Optional[str] = None) -> FlowInstance:
+        """Hand out a fresh instance: a prebuilt one when left, else one built now."""
+        key = self._key(flow, deployment, tone)
+        agents = self.agents(flow, deployment, chat_client, tone)
+        if self._flows[flow].build_workflow is None:
+            return FlowInstance(agents=agents)
+
+        pool = self._pools.setdefault(key, deque())
+        if pool:
+            self.pool_hits += 1
+            instance = pool.popleft()
+        else:
+            self.pool_misses += 1
+            instance = self._build_instance(key, agents)
+        self._refills.append(key)
+        self._schedule_refill()
+        return instance
+
+    def _schedule_refill(self) -> None:
+        if self._refill_scheduled or not self._refills:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No loop (startup, scripts): prewarm() fills the pools instead
+            return
+        self._refill_scheduled = True
+        loop.call_soon(self._refill_one)
+
+    def _refill_one(self) -> None:
+        """Build at most one replacement workflow, then yield the loop before the next."""
+        self._refill_scheduled = False
+        while self._refills:
+            key = self._refills.popleft()
+            cached = self._agents.get(key)
+            pool = self._pools.setdefault(key, deque())
+            if cached is None or len(pool) >= self.pool_size:
+                continue
+            pool.append(self._build_instance(key, cached[1]))
+            self.refills += 1
+            break
+        self._schedule_refill()
+
+    def prewarm(self, flow: str, deployment: Optional[str], chat_client: Any, tones: Optional[List[str]] = None) -> None:
+        """Build agents and `pool_size` workflows ahead of the first request (default tone unless `tones`)."""
+        for tone in (tones if self._flows[flow].uses_tone else None) or [None]:
+            key = self._key(flow, deployment, tone)
+            agents = self.agents(flow, deployment, chat_client, tone)
+            if self._flows[flow].build_workflow is None:
+                continue
+            pool = self._pools.setdefault(key, deque())
+            while len(pool) < self.pool_size:
+                pool.append(self._build_instance(key, agents))
+
+    def stats(self) -> dict:
+        # Only shared-agent hits skip a build; a pooled workflow was still built, just off the request path
+        saved_ms = self.agent_hits * self._agent_build_ms
+        return {
+            "pool_size": self.pool_size,
+            "keys": len(self._agents),
+            "pooled_workflows": sum(len(pool) for pool in self._pools.values()),
+            "agent_builds": self.agent_builds,
+            "agent_hits": self.agent_hits,
+            "workflow_builds": self.workflow_builds,
+            "pool_hits": self.pool_hits,
+            "pool_misses": self.pool_misses,
+            "refills": self.refills,
+            "last_agent_build_ms": round(self._agent_build_ms, 3),
+            "last_workflow_build_ms": round(self._workflow_build_ms, 3),
+            "agent_build_time_saved_ms": round(saved_ms, 3),
+        }
@@ -1,24 +1,48 @@
 import os
+import json
 import time
+import math
+import traceback
+import asyncio
 import logging
+from contextlib import aclosing, asynccontextmanager
 from typing import AsyncGenerator, Optional
 from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
-from agent_framework import ConcurrentBuilder, AgentRunUpdateEvent, WorkflowOutputEvent, GroupChatBuilder
-from agent_framework.azure import AzureOpenAIChatClient
-from azure.identity import DefaultAzureCredential
+from agent_framework import ConcurrentBuilder, AgentRunUpdateEvent, WorkflowOutputEvent, GroupChatBuilder, ChatMessage, ExecutorCompletedEvent
 
-from agent_framework import ChatAgent
 # from agent_framework.azure import AzureAISearchContextProvider
 from typing import Annotated
 from pydantic import Field
-from azure.search.documents import SearchClient
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents.models import VectorizedQuery, QueryType
 from translations import get_text
+from client_pool import ChatClientRegistry
+from failover import DeploymentUnavailableError, FailoverRouter, failure_reason, recovery_marker
+from hedging import Hedger
+from mock_client import MockChatClient, MockProfile
+from search_backend import AzureSearchBackend
+from local_search import LocalSearchBackend
+from cache import TTLCache, normalize_text
+from response_cache import ResponseCache, capture_stream
+from similarity_cache import SimilarityCache
+from urllib.parse import quote
+from synthesis_pipeline import PipelinedSynthesis
+from token_budget import TokenBudget, estimate_tokens
+from agent_templates import AgentSpec, AgentTemplateRegistry, FlowDefinition
+import metrics
+from stream_coalescer import coalesce_events, coalesce_text
+from stream_protocol import encode_stream, negotiate
+from stream_resume import StreamBufferRegistry
+from admission import AdmissionController, AdmissionRejected
+from speaker_selection import SpeakerSelector, make_policy
+from context_window import CondenseReport, RollingSummary
+from dag_workflow import build_dag_workflow
+from workflow_defs import load_definitions
+from batch_jobs import BatchItem, BatchRejected, BatchRunner
+from stream_recording import PASSTHROUGH, StreamRecorder, StreamReplayer
+import cancellation
 
 load_dotenv()
 
@@ -30,7 +54,27 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Lets a disconnected stream cancel the tasks it started (e.g. workflow supersteps)
+    cancellation.install(asyncio.get_running_loop())
+    if client_registry is not None and AZURE_OPENAI_POOL_WARMUP:
+        await client_registry.warmup(AZURE_OPENAI_POOL_WARMUP_CONNECTIONS)
+    if client_registry is not None and AGENT_TEMPLATE_PREWARM:
+        _prewarm_agent_templates()
+    if SEARCH_BACKEND == "local":
+        search_backend.warmup()
+    yield
+    if client_registry is not None:
+        await client_registry.aclose()
+    await stream_buffers.aclose()
+    await batch_runner.aclose()
+    await search_backend.aclose()
+    search_cache.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS configuration
 app.add_middleware(
@@ -45,12 +89,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _env_bool(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "y", "on"}
+
+
 # Language setting
 LANGUAGE = os.getenv("LANGUAGE", "ja")  # Default: Japanese
 
 AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+# Offline mode for load tests: every deployment is served by mock_client.MockChatClient (no Azure calls)
+MOCK_LLM = _env_bool("MOCK_LLM", False)
+AZURE_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT") or ("mock" if MOCK_LLM else None)
 
 # Model name to Azure OpenAI deployment mapping
 # Read from environment variables or use defaults
@@ -67,20 +120,448 @@ SEARCH_ENDPOINT = os.getenv("SEARCH_ENDPOINT")
 SEARCH_API_KEY = os.getenv("SEARCH_API_KEY")
 SEARCH_INDEX_NAME = os.getenv("SEARCH_INDEX_NAME")
 SEARCH_SEMANTIC_CONFIG = os.getenv("SEARCH_SEMANTIC_CONFIG", "default")
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "10"))
+SEARCH_MAX_CONNECTIONS = int(os.getenv("SEARCH_MAX_CONNECTIONS", "20"))
+
+# search_tool backend: Azure AI Search ("azure") or the in-process BM25 index over SEARCH_LOCAL_DIR ("local")
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "azure").lower()
+SEARCH_LOCAL_DIR = os.getenv("SEARCH_LOCAL_DIR", "")
+
+if SEARCH_BACKEND == "local":
+    search_backend = LocalSearchBackend(
+        documents_dir=SEARCH_LOCAL_DIR,
+        index_path=os.getenv("SEARCH_LOCAL_INDEX_PATH") or None,
+        top=int(os.getenv("SEARCH_LOCAL_TOP", "3")),
+        chunk_chars=int(os.getenv("SEARCH_LOCAL_CHUNK_CHARS", "800")),
+        refresh_interval=float(os.getenv("SEARCH_LOCAL_REFRESH_INTERVAL", "10")),
+        timeout=SEARCH_TIMEOUT,
+        language=LANGUAGE,
+    )
+else:
+    # Long-lived async search client shared by all search_tool calls
+    search_backend = AzureSearchBackend(
+        endpoint=SEARCH_ENDPOINT,
+        index_name=SEARCH_INDEX_NAME,
+        api_key=SEARCH_API_KEY,
+        semantic_config=SEARCH_SEMANTIC_CONFIG,
+        timeout=SEARCH_TIMEOUT,
+        max_connections=SEARCH_MAX_CONNECTIONS,
+    )
+# Identifies the searched corpus in cache keys
+SEARCH_SCOPE = f"local:{os.path.abspath(SEARCH_LOCAL_DIR)}" if SEARCH_BACKEND == "local" else SEARCH_INDEX_NAME
+
+# Cache of formatted search_tool results (memory LRU + optional on-disk tier);
+# off by default for the local index, which answers faster than a cache round trip pays off
+SEARCH_CACHE_ENABLED = _env_bool("SEARCH_CACHE_ENABLED", SEARCH_BACKEND != "local")
+search_cache = TTLCache(
+    max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024")),
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", "600")),
+    disk_path=os.getenv("SEARCH_CACHE_DISK_PATH") or None,
+)
+
+# Shared HTTP connection pool for Azure OpenAI (one client per deployment)
+AZURE_OPENAI_POOL_MAX_CONNECTIONS = int(os.getenv("AZURE_OPENAI_POOL_MAX_CONNECTIONS", "100"))
+AZURE_OPENAI_POOL_MAX_KEEPALIVE = int(os.getenv("AZURE_OPENAI_POOL_MAX_KEEPALIVE", "20"))
+AZURE_OPENAI_POOL_KEEPALIVE_EXPIRY = float(os.getenv("AZURE_OPENAI_POOL_KEEPALIVE_EXPIRY", "60"))
+AZURE_OPENAI_HTTP2 = _env_bool("AZURE_OPENAI_HTTP2", False)
+AZURE_OPENAI_POOL_WARMUP = _env_bool("AZURE_OPENAI_POOL_WARMUP", True)
+AZURE_OPENAI_POOL_WARMUP_CONNECTIONS = int(os.getenv("AZURE_OPENAI_POOL_WARMUP_CONNECTIONS", "2"))
+
+# Hedged streaming (opt-in): a request with no first token after HEDGE_DELAY seconds (default: the
+# deployment's running HEDGE_QUANTILE TTFT) is also sent to its alternate; the first to produce a token wins
+HEDGE_ENABLED = _env_bool("HEDGE_ENABLED", False)
+# Model or deployment names -> alternates, e.g. {"gpt-4.1-mini": ["gpt-4.1"]}
+HEDGE_ALTERNATES = json.loads(os.getenv("HEDGE_ALTERNATES") or "{}")
+hedger = None
+if HEDGE_ENABLED:
+    hedger = Hedger(
+        {
+            MODEL_DEPLOYMENT_MAP.get(name, name): [MODEL_DEPLOYMENT_MAP.get(alt, alt) for alt in alts]
+            for name, alts in HEDGE_ALTERNATES.items()
+        },
+        get_client=lambda deployment: client_registry.get(deployment),
+        delay=float(os.getenv("HEDGE_DELAY")) if os.getenv("HEDGE_DELAY") else None,
+        quantile=float(os.getenv("HEDGE_QUANTILE", "0.9")),
+        min_delay=float(os.getenv("HEDGE_MIN_DELAY", "0.5")),
+        max_delay=float(os.getenv("HEDGE_MAX_DELAY", "5")),
+        language=LANGUAGE,
+        on_fired=lambda deployment, alternate: metrics.HEDGE_FIRED.labels(deployment, alternate).inc(),
+        on_won=lambda deployment, alternate: metrics.HEDGE_WON.labels(deployment, alternate).inc(),
+    )
+
+# Deployment failover: a call failing with 429/5xx/timeout before its first token is retried with
+# exponential backoff and jitter, on FAILOVER_FALLBACKS when configured, and one that breaks mid-stream
+# is continued from its partial answer; per-deployment circuit breakers stop sending calls to a
+# deployment whose recent failure rate is too high
+FAILOVER_ENABLED = _env_bool("FAILOVER_ENABLED", False)
+# Model or deployment names -> fallbacks, e.g. {"gpt-4.1": ["gpt-4.1-mini"]}
+FAILOVER_FALLBACKS = json.loads(os.getenv("FAILOVER_FALLBACKS") or "{}")
+failover_router = None
+if FAILOVER_ENABLED:
+    failover_router = FailoverRouter(
+        {
+            MODEL_DEPLOYMENT_MAP.get(name, name): [MODEL_DEPLOYMENT_MAP.get(alt, alt) for alt in alts]
+            for name, alts in FAILOVER_FALLBACKS.items()
+        },
+        get_client=lambda deployment: client_registry.get(deployment),
+        max_attempts=int(os.getenv("FAILOVER_MAX_ATTEMPTS", "3")),
+        backoff=float(os.getenv("FAILOVER_BACKOFF", "0.25")),
+        max_backoff=float(os.getenv("FAILOVER_MAX_BACKOFF", "4")),
+        breaker={
+            "window": float(os.getenv("BREAKER_WINDOW", "60")),
+            "min_calls": int(os.getenv("BREAKER_MIN_CALLS", "5")),
+            "failure_rate": float(os.getenv("BREAKER_FAILURE_RATE", "0.5")),
+            "open_seconds": float(os.getenv("BREAKER_OPEN_SECONDS", "30")),
+            "half_open_probes": int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1")),
+        },
+        # A stream that breaks after producing text is continued from its partial answer (0 = off)
+        recover_attempts=int(os.getenv("FAILOVER_RECOVER_ATTEMPTS", "1")),
+        recovery_prompt=get_text('stream_recovery_instructions', LANGUAGE),
+        language=LANGUAGE,
+        on_state_change=lambda deployment, state: metrics.BREAKER_STATE.labels(deployment).set(metrics.BREAKER_STATES[state]),
+        on_retry=lambda deployment, reason: metrics.FAILOVER_RETRIES.labels(deployment, reason).inc(),
+        on_failover=lambda deployment, fallback: metrics.FAILOVER_ROUTED.labels(deployment, fallback).inc(),
+        on_recovered=lambda deployment, target: metrics.STREAM_RECOVERED.labels(deployment, target).inc(),
+    )
 
 # Initialize Agent Framework Chat Client
 chat_client = None
+client_registry = None
+
+mock_client_factory = None
+if MOCK_LLM:
+    mock_profile = MockProfile(
+        ttft_ms=float(os.getenv("MOCK_LLM_TTFT_MS", "400")),
+        ttft_sigma=float(os.getenv("MOCK_LLM_TTFT_SIGMA", "0.5")),
+        tokens_per_second=float(os.getenv("MOCK_LLM_TOKENS_PER_SECOND", "60")),
+        jitter=float(os.getenv("MOCK_LLM_JITTER", "0.3")),
+        response_tokens=int(os.getenv("MOCK_LLM_RESPONSE_TOKENS", "200")),
+        rate_limit_rate=float(os.getenv("MOCK_LLM_RATE_LIMIT_RATE", "0")),
+        error_rate=float(os.getenv("MOCK_LLM_ERROR_RATE", "0")),
+        break_rate=float(os.getenv("MOCK_LLM_BREAK_RATE", "0")),
+    )
+    # Per-deployment overrides, e.g. {"gpt-4.1": {"ttft_ms": 1500, "rate_limit_rate": 0.2}}
+    mock_overrides = json.loads(os.getenv("MOCK_LLM_DEPLOYMENTS") or "{}")
+    mock_seed = int(os.getenv("MOCK_LLM_SEED")) if os.getenv("MOCK_LLM_SEED") else None
+    mock_client_factory = lambda deployment: MockChatClient(
+        deployment,
+        MockProfile.from_dict(mock_overrides.get(deployment, {}), mock_profile),
+        language=LANGUAGE,
+        seed=mock_seed,
+    )
+    logger.warning(get_text('log_mock_llm_enabled', LANGUAGE))
 
-if AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_DEPLOYMENT:
-    chat_client = AzureOpenAIChatClient(
+if MOCK_LLM or (AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT):
+    client_registry = ChatClientRegistry(
         api_key=AZURE_OPENAI_API_KEY,
         endpoint=AZURE_OPENAI_ENDPOINT,
-        deployment_name=AZURE_OPENAI_DEPLOYMENT,
+        deployments=[AZURE_OPENAI_DEPLOYMENT, *MODEL_DEPLOYMENT_MAP.values()],
+        max_connections=AZURE_OPENAI_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=AZURE_OPENAI_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=AZURE_OPENAI_POOL_KEEPALIVE_EXPIRY,
+        http2=AZURE_OPENAI_HTTP2,
+        language=LANGUAGE,
+        hedger=hedger,
+        router=failover_router,
+        client_factory=mock_client_factory,
+    )
+    if AZURE_OPENAI_DEPLOYMENT:
+        chat_client = client_registry.get(AZURE_OPENAI_DEPLOYMENT)
+
+# Exact-match response cache for /api/stream (opt-in)
+RESPONSE_CACHE_ENABLED = _env_bool("RESPONSE_CACHE_ENABLED", False)
+RESPONSE_CACHE_REPLAY = os.getenv("RESPONSE_CACHE_REPLAY", "instant")  # instant | timed
+response_cache = ResponseCache(
+    max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    max_entry_bytes=int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(256 * 1024))),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+)
+
+
+# Near-duplicate prompt cache for /api/stream and /api/rag/stream (opt-in)
+SIMILAR_CACHE_ENABLED = _env_bool("SIMILAR_CACHE_ENABLED", False)
+similar_cache = None
+if SIMILAR_CACHE_ENABLED:
+    # The signature matrix is preallocated, so only build the index when enabled
+    similar_cache = SimilarityCache(
+        max_entries=int(os.getenv("SIMILAR_CACHE_MAX_ENTRIES", "100000")),
+        threshold=float(os.getenv("SIMILAR_CACHE_THRESHOLD", "0.85")),
+        ttl=float(os.getenv("SIMILAR_CACHE_TTL", "3600")),
+        # Character bigrams suit Japanese prompts, trigrams suit space-separated languages
+        ngram=int(os.getenv("SIMILAR_CACHE_NGRAM") or ("2" if LANGUAGE == "ja" else "3")),
     )
 
+
+# Pipelined synthesis for /api/multi-agent-stream (opt-in; request body "pipeline" overrides)
+MULTI_AGENT_PIPELINE = _env_bool("MULTI_AGENT_PIPELINE", False)
+MULTI_AGENT_PIPELINE_MIN_CHARS = int(os.getenv("MULTI_AGENT_PIPELINE_MIN_CHARS", "400"))
+MULTI_AGENT_PIPELINE_MAX_WAIT = float(os.getenv("MULTI_AGENT_PIPELINE_MAX_WAIT", "3"))
+
+
+# Token cap for the perspectives pasted into the synthesis prompt (0 disables)
+SYNTHESIS_MAX_INPUT_TOKENS = int(os.getenv("SYNTHESIS_MAX_INPUT_TOKENS", "3000"))
+synthesis_budget = TokenBudget(SYNTHESIS_MAX_INPUT_TOKENS)
+
+
+# Record the agent/workflow streams of every request (RECORD_DIR), or replay recorded ones in place
+# of the live runs (REPLAY_DIR, at REPLAY_SPEED times the recorded pace; 0 = no waiting)
+RECORD_DIR = os.getenv("RECORD_DIR", "")
+REPLAY_DIR = os.getenv("REPLAY_DIR", "")
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", "1"))
+stream_recorder = StreamRecorder(RECORD_DIR, language=LANGUAGE) if RECORD_DIR else None
+stream_replayer = StreamReplayer(REPLAY_DIR, speed=REPLAY_SPEED, language=LANGUAGE) if REPLAY_DIR else None
+
+
+def _valid_replay_speed(body: dict) -> bool:
+    """Whether the request's optional "replay_speed" is a finite number >= 0; checked before a stream starts."""
+    speed = body.get("replay_speed")
+    if speed is None:
+        return True
+    if isinstance(speed, bool):
+        return False
+    try:
+        return math.isfinite(float(speed)) and float(speed) >= 0
+    except (TypeError, ValueError):
+        return False
+
+
+def _stream_session(request_id: str, endpoint: str, variant: str, model_name: str, prompt: str, body: dict):
+    """Replay session when a recording fits the request, else a recording session when recording, else passthrough."""
+    if stream_replayer is not None:
+        speed = body.get("replay_speed")
+        session = stream_replayer.session(
+            endpoint, variant, prompt, recording_id=body.get("replay"), speed=None if speed is None else float(speed)
+        )
+        if session is not None:
+            logger.info(f"[{request_id}] {get_text('log_replay_session', LANGUAGE, id=session.recording_id, speed=session.speed)}")
+            return session
+    if stream_recorder is not None:
+        return stream_recorder.session(endpoint, variant, model_name, prompt)
+    return PASSTHROUGH
+
+
+# Coalescing of streamed chunks: flush every STREAM_COALESCE_MS or STREAM_COALESCE_MAX_BYTES (0 ms disables)
+STREAM_COALESCE_MS = float(os.getenv("STREAM_COALESCE_MS", "40"))
+STREAM_COALESCE_MAX_BYTES = int(os.getenv("STREAM_COALESCE_MAX_BYTES", "2048"))
+
+
+def coalesced_text(stream):
+    return coalesce_text(stream, STREAM_COALESCE_MS / 1000, STREAM_COALESCE_MAX_BYTES)
+
+
+def coalesced_events(stream):
+    return coalesce_events(stream, STREAM_COALESCE_MS / 1000, STREAM_COALESCE_MAX_BYTES)
+
+
+# Resumable SSE mode: recent events of each stream are kept so clients can reconnect with Last-Event-ID
+stream_buffers = StreamBufferRegistry(
+    ttl=float(os.getenv("SSE_BUFFER_TTL", "300")),
+    max_events=int(os.getenv("SSE_BUFFER_MAX_EVENTS", "5000")),
+    max_stream_bytes=int(os.getenv("SSE_BUFFER_MAX_STREAM_BYTES", str(1024 * 1024))),
+    max_total_bytes=int(os.getenv("SSE_BUFFER_MAX_BYTES", str(64 * 1024 * 1024))),
+    orphan_timeout=float(os.getenv("SSE_ORPHAN_TIMEOUT", "30")),
+)
+
+
+def _wants_sse(request: Request) -> bool:
+    return (
+        "text/event-stream" in request.headers.get("accept", "")
+        or request.query_params.get("transport") == "sse"
+    )
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that frees its admission ticket when the response ends. The
+    stream's own release in admitted() never runs when the client disconnects
+    before the body is first read; Ticket.release() is idempotent.
+    """
+
+    def __init__(self, content, *, ticket=None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.ticket is not None:
+                self.ticket.release()
+
+
+def stream_response(
+    request: Request, stream, media_type: str = "text/plain", headers: Optional[dict] = None, ndjson: bool = False, ticket=None
+) -> StreamingResponse:
+    """
+    Plain streaming response, or (when the client asks for text/event-stream) a
+    resumable SSE stream whose events are buffered under an X-Stream-Id.
+    `ticket` is the admission ticket behind `stream`: a plain response frees it when
+    it ends, while an SSE stream keeps it until generation ends (it outlives the client).
+    """
+    if not _wants_sse(request):
+        return AdmittedStreamingResponse(stream, media_type=media_type, headers=headers, ticket=ticket)
+    buffer = stream_buffers.start(stream, ndjson=ndjson)
+    return StreamingResponse(
+        stream_buffers.sse(buffer),
+        media_type="text/event-stream",
+        headers={
+            **(headers or {}),
+            "X-Stream-Id": buffer.stream_id,
+            "Content-Location": f"/api/streams/{buffer.stream_id}",
+            "Cache-Control": "no-cache",
+        },
+    )
+
+
+# NDJSON agent streams: v1 (default) or compact v2, negotiated per request; debug fields are opt-in
+STREAM_DEBUG_FIELDS = _env_bool("STREAM_DEBUG_FIELDS", False)
+
+
+def _stream_debug(body: dict) -> bool:
+    return bool(body.get("debug", STREAM_DEBUG_FIELDS))
+
+
+def _ndjson_response(request: Request, body: dict, events, agents: list, ticket=None) -> StreamingResponse:
+    """Coalesce and encode an agent event stream in the protocol version the client asked for."""
+    version = body.get("protocol") or request.headers.get("X-Stream-Protocol") or 1
+    encoder = negotiate(version, agents, debug=_stream_debug(body))
+    return stream_response(
+        request,
+        encode_stream(coalesced_events(events), encoder),
+        media_type=encoder.media_type,
+        headers={"X-Stream-Protocol": str(encoder.version)},
+        ndjson=True,
+        ticket=ticket,
+    )
+
+
+# Admission control per deployment: max in-flight LLM streams, a bounded FIFO queue and optional RPM/TPM buckets
+ADMISSION_ENABLED = _env_bool("ADMISSION_ENABLED", True)
+admission = AdmissionController(
+    defaults={
+        "max_in_flight": int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32")),
+        "max_queue": int(os.getenv("ADMISSION_MAX_QUEUE", "128")),
+        "rpm": float(os.getenv("ADMISSION_RPM", "0")),
+        "tpm": float(os.getenv("ADMISSION_TPM", "0")),
+    },
+    # e.g. {"gpt-4.1": {"max_in_flight": 8, "tpm": 150000}}
+    overrides=json.loads(os.getenv("ADMISSION_LIMITS") or "{}"),
+) if ADMISSION_ENABLED else None
+
+
+def _admit(request_id: str, deployment: Optional[str], prompt: str, calls: int = 1, extra_tokens: int = 0):
+    """
+    Take a place in the deployment's queue for a request making `calls` LLM calls.
+
+    Returns a Ticket (None when admission control is off), or a 429 response with
+    Retry-After when the queue is full.
+    """
+    if admission is None:
+        return None
+    tokens = estimate_tokens(prompt) * calls + extra_tokens
+    try:
+        return admission.enqueue(deployment, tokens, calls)
+    except AdmissionRejected as e:
+        metrics.ADMISSION_REJECTED.labels(deployment or "").inc()
+        logger.warning(f"[{request_id}] {get_text('log_admission_rejected', LANGUAGE, deployment=deployment, retry_after=int(e.retry_after))}")
+        return JSONResponse(
+            {"error": get_text('error_overloaded', LANGUAGE), "retry_after": int(e.retry_after)},
+            status_code=429,
+            headers={"Retry-After": str(int(e.retry_after))},
+        )
+
+
+async def admitted(request_id: str, ticket, stream, events: bool = False):
+    """
+    Hold `stream` until the ticket is admitted, then pass it through and free the slot.
+    NDJSON streams get `{"type": "queued", "position": n}` events while waiting.
+    """
+    if ticket is None:
+        async for item in stream:
+            yield item
+        return
+    try:
+        async for position in ticket.wait():
+            logger.info(f"[{request_id}] {get_text('log_admission_queued', LANGUAGE, position=position)}")
+            if events:
+                yield {"type": "queued", "position": position}
+        metrics.ADMISSION_WAIT.labels(ticket.limiter.name or "").observe(ticket.waited)
+        async for item in stream:
+            yield item
+    finally:
+        ticket.release()
+        await stream.aclose()
+
+
+def supervised(request_id: str, stream_metrics: metrics.StreamMetrics, ticket, stream, events: bool = False):
+    """
+    Run an endpoint's generator behind admission control, with metrics, and cancel
+    the agent / workflow work behind it as soon as the client disconnects.
+    """
+    return stream_metrics.observe(
+        cancellation.cancel_on_exit(admitted(request_id, ticket, stream, events), on_cancel=stream_metrics.tasks_cancelled)
+    )
+
+
+def _error_event(request_id: str, stream_metrics: metrics.StreamMetrics, exc: Exception, debug: bool = False) -> dict:
+    """NDJSON error event for a failed stream; the traceback is only added when the request asked for debug fields."""
+    logger.error(f"[{request_id}] ❌ {exc}", exc_info=exc)
+    stream_metrics.error(type(exc).__name__)
+    event = {
+        "type": "error",
+        "message": str(exc),
+        # Overload and outages (429/5xx/timeouts, open circuits) are worth retrying later
+        "retryable": isinstance(exc, DeploymentUnavailableError) or failure_reason(exc) is not None,
+    }
+    if debug:
+        event["traceback"] = "".join(traceback.format_exception(exc))
+    return event
+
+# Prebuilt agents and workflows per (flow, deployment, language, tone)
+AGENT_TEMPLATE_POOL_SIZE = int(os.getenv("AGENT_TEMPLATE_POOL_SIZE", "2"))
+AGENT_TEMPLATE_PREWARM = _env_bool("AGENT_TEMPLATE_PREWARM", True)
+agent_templates = AgentTemplateRegistry(LANGUAGE, pool_size=AGENT_TEMPLATE_POOL_SIZE)
+
+
+def _header_bool(request: Request, name: str) -> bool:
+    value = request.headers.get(name)
+    return value is not None and value.strip().lower() in {"1", "true", "yes", "y", "on"}
+
+
+def _similar_cache_response(request: Request, request_id: str, scope: int, prompt: str) -> Optional[StreamingResponse]:
+    """Replay the answer of a near-duplicate prompt, or return None on a miss."""
+    match = similar_cache.lookup(scope, prompt)
+    if match is None:
+        return None
+    logger.info(f"[{request_id}] {get_text('log_similar_cache_hit', LANGUAGE, similarity=f'{match.similarity:.3f}', prompt=match.prompt[:80])}")
+    replay_mode = request.headers.get("X-Cache-Replay", RESPONSE_CACHE_REPLAY)
+    return stream_response(
+        request,
+        coalesced_text(ResponseCache.replay(match.value, timed=replay_mode == "timed")),
+        media_type="text/plain",
+        headers={
+            "X-Cache": "SIMILAR",
+            "X-Cache-Similarity": f"{match.similarity:.3f}",
+            "X-Cache-Matched-Prompt": quote(match.prompt[:200]),
+        },
+    )
+
+
+def resolve_deployment(model_name: str = None) -> Optional[str]:
+    """Return the Azure OpenAI deployment name a model request is routed to."""
+    if not model_name or model_name not in MODEL_DEPLOYMENT_MAP:
+        return AZURE_OPENAI_DEPLOYMENT
+    return MODEL_DEPLOYMENT_MAP.get(model_name, AZURE_OPENAI_DEPLOYMENT)
+
+
+def metrics_model(model_name: Optional[str]) -> str:
+    """`model` metrics label: a known model name, else "other" (clients cannot mint new series)."""
+    return model_name if model_name in MODEL_DEPLOYMENT_MAP else "other"
+
+
 def get_chat_client_for_model(model_name: str = None):
     """Return a chat client for the requested model."""
-    if not AZURE_OPENAI_API_KEY or not AZURE_OPENAI_ENDPOINT:
+    if client_registry is None:
         return None
     
     if not model_name or model_name not in MODEL_DEPLOYMENT_MAP:
@@ -90,36 +571,29 @@ def get_chat_client_for_model(model_name: str = None):
     deployment_name = MODEL_DEPLOYMENT_MAP.get(model_name, AZURE_OPENAI_DEPLOYMENT)
     logger.info(get_text('log_model_selected', LANGUAGE, model=model_name, deployment=deployment_name))
     
-    return AzureOpenAIChatClient(
-        api_key=AZURE_OPENAI_API_KEY,
-        endpoint=AZURE_OPENAI_ENDPOINT,
-        deployment_name=deployment_name,
-    )
+    # Reuse the pooled, already-warm client instead of building one per request
+    return client_registry.get(deployment_name)
 
 
-def search_tool(
+async def search_tool(
     query: Annotated[str, Field(description="Search query")],
 ) -> str:
     """Tool to search for guidelines in the financial sector"""
     try:
         if not query or not query.strip():
             return get_text('search_empty_query', LANGUAGE)
+        if not search_backend.configured:
+            return get_text('search_not_configured', LANGUAGE)
         
-        # Initialize Azure AI Search client
-        search_client = SearchClient(
-            endpoint=SEARCH_ENDPOINT,
-            index_name=SEARCH_INDEX_NAME,
-            credential=AzureKeyCredential(SEARCH_API_KEY)
-        )
+        cache_key = (SEARCH_SCOPE, SEARCH_SEMANTIC_CONFIG, LANGUAGE, normalize_text(query))
+        if SEARCH_CACHE_ENABLED:
+            cached = await search_cache.aget(cache_key)
+            if cached is not None:
+                logger.info(get_text('log_search_cache_hit', LANGUAGE))
+                return cached
         
-        # Execute semantic search
-        results = search_client.search(
-            search_text=query,
-            query_type=QueryType.SEMANTIC,
-            semantic_configuration_name=SEARCH_SEMANTIC_CONFIG,
-            top=3,
-            select=["content", "metadata_storage_name"]
-        )
+        # Semantic search on the shared async client, or BM25 on the local index (neither blocks the event loop)
+        results = await search_backend.search(query)
         
         # Format results
         formatted_results = []
@@ -134,16 +608,193 @@ def search_tool(
         
         if formatted_results:
             logger.info(get_text('log_search_success', LANGUAGE, count=len(formatted_results)))
-            return "\n---\n".join(formatted_results)
+            formatted = "\n---\n".join(formatted_results)
+            if SEARCH_CACHE_ENABLED:
+                await search_cache.aset(cache_key, formatted)
+            return formatted
         else:
             return get_text('search_no_results', LANGUAGE, query=query)
-            
+    
+    except asyncio.TimeoutError:
+        error_msg = get_text('search_timeout', LANGUAGE, timeout=SEARCH_TIMEOUT)
+        logger.error(error_msg)
+        return error_msg
     except Exception as e:
         error_msg = get_text('search_error', LANGUAGE, error=str(e))
         logger.error(error_msg)
         return error_msg
 
 
+BOARD_SEQUENCE = [
+    "CEO",
+    "CTO",
+    "CFO",
+    "COO",
+]
+
+
+def _pick_participant_name(*candidates: Optional[str]) -> Optional[str]:
+    """Return the first candidate that matches a known participant name."""
+    for candidate in candidates:
+        if not candidate:
+            continue
+        value = str(candidate).strip()
+        if value in BOARD_SEQUENCE:
+            return value
+    return None
+
+
+# Board speaker selection (round_robin / dag / priority); the meeting ends at PLAN_READY: or BOARD_MAX_ROUNDS turns
+BOARD_SPEAKER_POLICY = os.getenv("BOARD_SPEAKER_POLICY", "round_robin")
+BOARD_MAX_ROUNDS = int(os.getenv("BOARD_MAX_ROUNDS", "10"))
+# Who has to have spoken before whom (dag policy)
+BOARD_DEPENDENCIES = {
+    "CTO": ["CEO"],
+    "CFO": ["CEO"],
+    "COO": ["CTO", "CFO"],
+}
+# Relative share of turns (priority policy), e.g. {"CEO": 2, "CTO": 1, "CFO": 1, "COO": 1}
+BOARD_SPEAKER_WEIGHTS = json.loads(os.getenv("BOARD_SPEAKER_WEIGHTS") or "{}") or None
+# group_chat: one speaker at a time; dag: everyone speaks once, concurrently where BOARD_DEPENDENCIES allows
+# (request body "mode" overrides)
+BOARD_MODE = os.getenv("BOARD_MODE", "group_chat")
+
+
+def _make_planning_selector(selector_state: dict) -> SpeakerSelector:
+    """Build the CxO speaker selector; selector_state is per workflow instance and carries the request_id."""
+    selector_state.update(request_id=None)
+
+    def on_stop(reason: str) -> None:
+        request_id = selector_state["request_id"]
+        if reason == "completed":
+            logger.info(f"[{request_id}] {get_text('log_plan_ready', LANGUAGE)}")
+        elif reason == "max_rounds":
+            logger.warning(f"[{request_id}] {get_text('warning_max_rounds', LANGUAGE, max=BOARD_MAX_ROUNDS)}")
+        else:
+            logger.info(f"[{request_id}] {get_text('log_speakers_exhausted', LANGUAGE)}")
+
+    policy = make_policy(
+        BOARD_SPEAKER_POLICY, BOARD_SEQUENCE, dependencies=BOARD_DEPENDENCIES, weights=BOARD_SPEAKER_WEIGHTS
+    )
+    return SpeakerSelector(
+        BOARD_SEQUENCE, policy, completion_marker="PLAN_READY:", max_rounds=BOARD_MAX_ROUNDS, on_stop=on_stop
+    )
+
+
+def _build_board_workflow(agents: dict, state: dict):
+    selector = _make_planning_selector(state)
+    return (
+        GroupChatBuilder()
+        .participants([agents[name] for name in BOARD_SEQUENCE])
+        .with_select_speaker_func(selector, orchestrator_name="PlanningOrchestrator")
+        .with_termination_condition(selector.should_terminate)
+        .build()
+    )
+
+
+# Rolling-summary context for the board: the latest BOARD_CONTEXT_KEEP_TURNS turns go verbatim,
+# older turns are condensed into at most BOARD_CONTEXT_SUMMARY_TOKENS tokens (0 sends the full history)
+BOARD_CONTEXT_KEEP_TURNS = int(os.getenv("BOARD_CONTEXT_KEEP_TURNS", "4"))
+BOARD_CONTEXT_SUMMARY_TOKENS = int(os.getenv("BOARD_CONTEXT_SUMMARY_TOKENS", "600"))
+# Model that writes the summary (a MODEL_DEPLOYMENT_MAP name, e.g. gpt-4.1-mini); empty keeps it extractive
+BOARD_CONTEXT_SUMMARY_MODEL = os.getenv("BOARD_CONTEXT_SUMMARY_MODEL", "")
+BOARD_CONTEXT_SUMMARY_TIMEOUT = float(os.getenv("BOARD_CONTEXT_SUMMARY_TIMEOUT", "10"))
+
+
+async def _summarize_board_context(summary: str, turns: list, max_tokens: int) -> str:
+    """Fold new board turns into the running summary with the configured summary model."""
+    if client_registry is None:
+        raise RuntimeError(get_text('error_config_missing', LANGUAGE))
+    client = client_registry.get(resolve_deployment(BOARD_CONTEXT_SUMMARY_MODEL))
+    transcript = "\n\n".join(f"{speaker}:\n{text}" for speaker, text in turns)
+    response = await client.get_response([
+        ChatMessage(role="system", text=get_text('context_summary_instructions', LANGUAGE, max_tokens=max_tokens)),
+        ChatMessage(role="user", text=f"{summary}\n\n---\n\n{transcript}" if summary else transcript),
+    ])
+    return response.text
+
+
+def _log_board_context(report: CondenseReport) -> None:
+    metrics.CONTEXT_PROMPT_TOKENS.labels("full").observe(report.tokens_before)
+    metrics.CONTEXT_PROMPT_TOKENS.labels("sent").observe(report.tokens_after)
+    logger.info(get_text(
+        'log_context_condensed', LANGUAGE,
+        turns=report.turns_condensed, kept=report.turns_kept,
+        before=report.tokens_before, after=report.tokens_after, source=report.source,
+    ))
+
+
+# One instance shared by the board agents; its summary cache is keyed by conversation content
+board_context = RollingSummary(
+    keep_turns=BOARD_CONTEXT_KEEP_TURNS,
+    max_summary_tokens=BOARD_CONTEXT_SUMMARY_TOKENS,
+    label=get_text('context_summary_label', LANGUAGE),
+    language=LANGUAGE,
+    summarize=_summarize_board_context if BOARD_CONTEXT_SUMMARY_MODEL else None,
+    summarize_timeout=BOARD_CONTEXT_SUMMARY_TIMEOUT,
+    on_condense=_log_board_context,
+)
+board_middleware = (board_context,) if BOARD_CONTEXT_SUMMARY_TOKENS > 0 else ()
+
+
+agent_templates.register("simple", FlowDefinition(agents=[
+    AgentSpec("SimpleAgent", "agent_simple_instructions"),
+]))
+agent_templates.register("rag", FlowDefinition(agents=[
+    AgentSpec("SearchAgent", "agent_guideline_instructions", tools=(search_tool,), parallel_tool_calls=True),
+]))
+agent_templates.register("multi_agent", FlowDefinition(
+    agents=[
+        AgentSpec("CriticalAnalyst", "agent_critical_instructions"),
+        AgentSpec("PositiveAdvocate", "agent_positive_instructions"),
+        AgentSpec("Synthesizer", "agent_synthesizer_instructions"),
+    ],
+    build_workflow=lambda agents, state: ConcurrentBuilder().participants(
+        [agents["CriticalAnalyst"], agents["PositiveAdvocate"]]
+    ).build(),
+))
+BOARD_AGENTS = [
+    AgentSpec("CEO", "agent_board_ceo_instructions", "CEO leading the management meeting and presenting strategic direction", middleware=board_middleware),
+    AgentSpec("CTO", "agent_board_cto_instructions", "Evaluates technical strategy and feasibility", middleware=board_middleware),
+    AgentSpec("CFO", "agent_board_cfo_instructions", "Evaluates financial viability and business potential", middleware=board_middleware),
+    AgentSpec("COO", "agent_board_coo_instructions", "Integrates CxO opinions and creates execution plan", middleware=board_middleware),
+]
+agent_templates.register("board", FlowDefinition(
+    agents=BOARD_AGENTS,
+    build_workflow=_build_board_workflow,
+    uses_tone=True,
+))
+agent_templates.register("board_dag", FlowDefinition(
+    agents=BOARD_AGENTS,
+    build_workflow=lambda agents, state: build_dag_workflow(agents, BOARD_SEQUENCE, BOARD_DEPENDENCIES),
+    uses_tone=True,
+))
+
+
+# Declarative flows (*.json / *.yaml in WORKFLOW_DEFINITIONS_DIR), served at /api/flows/{name}/stream
+WORKFLOW_DEFINITIONS_DIR = os.getenv("WORKFLOW_DEFINITIONS_DIR") or os.path.join(os.path.dirname(__file__), "workflows")
+# Tools a definition may give its stages, by name
+FLOW_TOOLS = {"search": search_tool}
+workflow_definitions = load_definitions(WORKFLOW_DEFINITIONS_DIR, LANGUAGE, FLOW_TOOLS)
+for _definition in workflow_definitions.values():
+    agent_templates.register(f"flow:{_definition.name}", _definition.flow_definition(LANGUAGE, FLOW_TOOLS))
+if workflow_definitions:
+    logger.info(get_text('log_flows_loaded', LANGUAGE, names=", ".join(workflow_definitions)))
+
+
+def _prewarm_agent_templates() -> None:
+    """Build the default model's agents and a few workflows (default tone) before the first request."""
+    deployment = resolve_deployment("gpt-4.1-mini")
+    client = get_chat_client_for_model("gpt-4.1-mini")
+    if client is None:
+        return
+    board_flow = "board_dag" if BOARD_MODE == "dag" else "board"
+    for flow in ("simple", "rag", "multi_agent", board_flow):
+        agent_templates.prewarm(flow, deployment, client)
+    stats = agent_templates.stats()
+    logger.info(get_text('log_agent_templates_ready', LANGUAGE, keys=stats["keys"], workflows=stats["pooled_workflows"]))
+
+
 @app.post("/api/stream")
 async def api_stream(request: Request):
     start_time = time.time()
@@ -158,25 +809,55 @@ async def api_stream(request: Request):
     
     if not prompt:
         return JSONResponse({"error": "prompt required"}, status_code=400)
+    if not _valid_replay_speed(body):
+        return JSONResponse({"error": "invalid replay_speed"}, status_code=400)
     
     parse_time = time.time()
     logger.info(f"[{request_id}] {get_text('log_request_parsed', LANGUAGE, time=f'{(parse_time - start_time)*1000:.2f}')}")
 
+    instructions = get_text('agent_simple_instructions', LANGUAGE)
+    bypass_cache = _header_bool(request, "X-Cache-Bypass")
+    use_cache = RESPONSE_CACHE_ENABLED and not bypass_cache
+    use_similar_cache = SIMILAR_CACHE_ENABLED and not bypass_cache
+    deployment_name = resolve_deployment(model_name)
+    cache_key = ResponseCache.make_key(deployment_name, LANGUAGE, instructions, prompt)
+    cache_scope = SimilarityCache.scope_id("/api/stream", deployment_name, LANGUAGE, instructions)
+    if use_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"[{request_id}] {get_text('log_response_cache_hit', LANGUAGE, count=len(cached.chunks))}")
+            replay_mode = request.headers.get("X-Cache-Replay", RESPONSE_CACHE_REPLAY)
+            return stream_response(
+                request,
+                coalesced_text(response_cache.replay(cached, timed=replay_mode == "timed")),
+                media_type="text/plain",
+                headers={"X-Cache": "HIT"},
+            )
+    if use_similar_cache:
+        similar_response = _similar_cache_response(request, request_id, cache_scope, prompt)
+        if similar_response is not None:
+            return similar_response
+
+    ticket = _admit(request_id, deployment_name, instructions + prompt)
+    if isinstance(ticket, JSONResponse):
+        return ticket
+
+    outcome = {"completed": False}
+    stream_metrics = metrics.StreamMetrics("/api/stream", metrics_model(model_name), deployment_name)
+
     async def generator():
         # Get a chat client for the requested model
         model_chat_client = get_chat_client_for_model(model_name)
         if model_chat_client is None:
+            stream_metrics.error("config_missing")
             yield get_text('error_config_missing', LANGUAGE)
             return
         
         # Create a simple agent
         agent_start = time.time()
         logger.info(f"[{request_id}] {get_text('log_agent_creating', LANGUAGE)}")
-        simple_agent = ChatAgent(
-            name="SimpleAgent",
-            chat_client=model_chat_client,
-            instructions=get_text('agent_simple_instructions', LANGUAGE),
-        )
+        simple_agent = agent_templates.agents("simple", deployment_name, model_chat_client)["SimpleAgent"]
+        simple_agent = _stream_session(request_id, "/api/stream", "", model_name, prompt, body).wrap("SimpleAgent", simple_agent)
         logger.info(f"[{request_id}] {get_text('log_agent_created', LANGUAGE, time=f'{(time.time() - agent_start)*1000:.2f}')}")
         
         # Stream response
@@ -184,18 +865,43 @@ async def api_stream(request: Request):
         logger.info(f"[{request_id}] {get_text('log_streaming_start', LANGUAGE, length=len(prompt))}")
         first_chunk = True
         chunk_count = 0
-        async for update in simple_agent.run_stream(prompt):
-            if update.text:
-                if first_chunk:
-                    logger.info(f"[{request_id}] {get_text('log_first_chunk', LANGUAGE, time=f'{(time.time() - stream_start)*1000:.2f}')}")
-                    first_chunk = False
-                chunk_count += 1
-                yield update.text
-        
+        try:
+            async with aclosing(simple_agent.run_stream(prompt)) as updates:
+                async for update in updates:
+                    if update.text:
+                        if first_chunk:
+                            logger.info(f"[{request_id}] {get_text('log_first_chunk', LANGUAGE, time=f'{(time.time() - stream_start)*1000:.2f}')}")
+                            first_chunk = False
+                        chunk_count += 1
+                        stream_metrics.chunk("SimpleAgent")
+                        yield update.text
+        except Exception as e:
+            error_msg = get_text('error_stream_processing', LANGUAGE, error=str(e))
+            logger.error(f"[{request_id}] ❌ {error_msg}")
+            stream_metrics.error(type(e).__name__)
+            yield f"\n\n{error_msg}"
+            return
+
         total_time = time.time() - start_time
         logger.info(f"[{request_id}] {get_text('log_completed', LANGUAGE, time=f'{total_time:.2f}', count=chunk_count)}")
-
-    return StreamingResponse(generator(), media_type="text/plain")
+        outcome["completed"] = True
+
+    cache_sinks = []
+    if use_cache:
+        cache_sinks.append(lambda entry: response_cache.set(cache_key, entry))
+    if use_similar_cache:
+        cache_sinks.append(lambda entry: similar_cache.add(cache_scope, prompt, entry))
+    if cache_sinks:
+        return stream_response(
+            request,
+            coalesced_text(
+                capture_stream(supervised(request_id, stream_metrics, ticket, generator()), cache_sinks, cacheable=lambda: outcome["completed"])
+            ),
+            media_type="text/plain",
+            headers={"X-Cache": "MISS"},
+            ticket=ticket,
+        )
+    return stream_response(request, coalesced_text(supervised(request_id, stream_metrics, ticket, generator())), ticket=ticket)
 
 
 @app.post("/api/rag/stream")
@@ -214,14 +920,35 @@ async def api_guideline_stream(request: Request):
     
     if not prompt:
         return JSONResponse({"error": "prompt required"}, status_code=400)
+    if not _valid_replay_speed(body):
+        return JSONResponse({"error": "invalid replay_speed"}, status_code=400)
     
     parse_time = time.time()
     logger.info(f"[{request_id}] {get_text('log_request_parsed', LANGUAGE, time=f'{(parse_time - start_time)*1000:.2f}')}")
 
+    instructions = get_text('agent_guideline_instructions', LANGUAGE)
+    use_similar_cache = SIMILAR_CACHE_ENABLED and not _header_bool(request, "X-Cache-Bypass")
+    cache_scope = SimilarityCache.scope_id(
+        "/api/rag/stream", resolve_deployment(model_name), LANGUAGE, instructions, SEARCH_SCOPE
+    )
+    if use_similar_cache:
+        similar_response = _similar_cache_response(request, request_id, cache_scope, prompt)
+        if similar_response is not None:
+            return similar_response
+
+    # The search tool call adds a second model round trip
+    ticket = _admit(request_id, resolve_deployment(model_name), instructions + prompt, calls=2)
+    if isinstance(ticket, JSONResponse):
+        return ticket
+
+    outcome = {"completed": False}
+    stream_metrics = metrics.StreamMetrics("/api/rag/stream", metrics_model(model_name), resolve_deployment(model_name))
+
     async def generator():
         # Get a chat client for the requested model
         model_chat_client = get_chat_client_for_model(model_name)
         if model_chat_client is None:
+            stream_metrics.error("config_missing")
             yield get_text('error_config_missing', LANGUAGE)
             return
         
@@ -229,11 +956,8 @@ async def api_guideline_stream(request: Request):
             # Agent using Azure AI Search tool
             agent_start = time.time()
             logger.info(f"[{request_id}] {get_text('log_search_agent_creating', LANGUAGE)}")
-            search_agent = ChatAgent(
-                chat_client=model_chat_client,
-                instructions=get_text('agent_guideline_instructions', LANGUAGE),
-                tools=[search_tool],
-            )
+            search_agent = agent_templates.agents("rag", resolve_deployment(model_name), model_chat_client)["SearchAgent"]
+            search_agent = _stream_session(request_id, "/api/rag/stream", "", model_name, prompt, body).wrap("SearchAgent", search_agent)
             logger.info(f"[{request_id}] {get_text('log_search_agent_created', LANGUAGE, time=f'{(time.time() - agent_start)*1000:.2f}')}")
             
             # Stream response
@@ -241,23 +965,82 @@ async def api_guideline_stream(request: Request):
             logger.info(f"[{request_id}] {get_text('log_streaming_start', LANGUAGE, length=len(prompt))}")
             first_chunk = True
             chunk_count = 0
-            async for update in search_agent.run_stream(prompt):
-                if update.text:
-                    if first_chunk:
-                        logger.info(f"[{request_id}] {get_text('log_first_chunk', LANGUAGE, time=f'{(time.time() - stream_start)*1000:.2f}')}")
-                        first_chunk = False
-                    chunk_count += 1
-                    yield update.text
+            async with aclosing(search_agent.run_stream(prompt)) as updates:
+                async for update in updates:
+                    if update.text:
+                        if first_chunk:
+                            logger.info(f"[{request_id}] {get_text('log_first_chunk', LANGUAGE, time=f'{(time.time() - stream_start)*1000:.2f}')}")
+                            first_chunk = False
+                        chunk_count += 1
+                        stream_metrics.chunk("SearchAgent")
+                        yield update.text
             
             total_time = time.time() - start_time
             logger.info(f"[{request_id}] {get_text('log_completed', LANGUAGE, time=f'{total_time:.2f}', count=chunk_count)}")
+            outcome["completed"] = True
             
         except Exception as e:
             error_msg = get_text('error_search_processing', LANGUAGE, error=str(e))
             logger.error(f"[{request_id}] ❌ {error_msg}")
+            stream_metrics.error(type(e).__name__)
             yield get_text('error_retry_message', LANGUAGE, error=error_msg)
 
-    return StreamingResponse(generator(), media_type="text/plain")
+    if use_similar_cache:
+        return stream_response(
+            request,
+            coalesced_text(capture_stream(
+                supervised(request_id, stream_metrics, ticket, generator()),
+                [lambda entry: similar_cache.add(cache_scope, prompt, entry)],
+                cacheable=lambda: outcome["completed"],
+            )),
+            media_type="text/plain",
+            headers={"X-Cache": "MISS"},
+            ticket=ticket,
+        )
+    return stream_response(request, coalesced_text(supervised(request_id, stream_metrics, ticket, generator())), ticket=ticket)
+
+
+def _fit_synthesis_inputs(request_id: str, prompt: str, sections: dict) -> dict:
+    """Apply the synthesis token budget to the perspective texts and log what was dropped."""
+    fitted, reports = synthesis_budget.fit(sections, query=prompt)
+    for report in reports:
+        logger.info(f"[{request_id}] {get_text('log_budget_compressed', LANGUAGE, name=report.name, before=report.tokens_before, after=report.tokens_after, dropped=len(report.dropped))}")
+        for dropped in report.dropped:
+            logger.debug(f"[{request_id}] ✂️ {report.name}: {dropped}")
+    return fitted
+
+
+def _build_synthesis_prompt(prompt: str, critical_content: str, positive_content: str) -> str:
+    return f"""
+Integrate the following two perspectives to provide a balanced analysis.
+
+Original question: {prompt}
+
+Critical perspective:
+{critical_content}
+
+Positive perspective:
+{positive_content}
+"""
+
+
+def _perspective_args(texts: dict) -> dict:
+    return {"critical_content": texts["CriticalAnalyst"], "positive_content": texts["PositiveAdvocate"]}
+
+
+def _build_reconcile_prompt(critical_content: str, positive_content: str) -> str:
+    return f"""
+The two perspectives you integrated above were still being written, and parts of what you saw were
+left out to fit the length limit. Below is everything of each one you have not seen yet: the left-out
+sentences first, then the rest of the text. Continue your analysis: add or correct only what this
+content changes, without repeating what you have already written.
+
+Rest of the critical perspective:
+{critical_content or "(no further content)"}
+
+Rest of the positive perspective:
+{positive_content or "(no further content)"}
+"""
 
 
 @app.post("/api/multi-agent-stream")
@@ -269,60 +1052,98 @@ async def multi_agent_stream(request: Request):
     body = await request.json()
     prompt = body.get("prompt", "")
     model_name = body.get("model", "gpt-4.1-mini")  # Default model
+    pipeline = bool(body.get("pipeline", MULTI_AGENT_PIPELINE))
 
     logger.info(f"[{request_id}] {get_text('log_model_info', LANGUAGE, model=model_name)}")
     
     if not prompt:
         return JSONResponse({"error": "prompt required"}, status_code=400)
+    if not _valid_replay_speed(body):
+        return JSONResponse({"error": "invalid replay_speed"}, status_code=400)
     
     parse_time = time.time()
     logger.info(f"[{request_id}] {get_text('log_multi_agent_parsed', LANGUAGE, time=f'{(parse_time - start_time)*1000:.2f}')}")
 
-    async def generator():
-        import json
+    # Two perspectives plus a synthesis call over (at most) the budgeted perspective texts
+    ticket = _admit(request_id, resolve_deployment(model_name), prompt, calls=3, extra_tokens=SYNTHESIS_MAX_INPUT_TOKENS)
+    if isinstance(ticket, JSONResponse):
+        return ticket
+    stream_metrics = metrics.StreamMetrics("/api/multi-agent-stream", metrics_model(model_name), resolve_deployment(model_name))
 
+    async def generator():
         # Get a chat client for the requested model
         model_chat_client = get_chat_client_for_model(model_name)
         if model_chat_client is None:
-            yield json.dumps(
-                {"type": "error", "message": get_text('error_config_missing', LANGUAGE)},
-                ensure_ascii=False,
-            ) + "\n"
+            stream_metrics.error("config_missing")
+            yield {"type": "error", "message": get_text('error_config_missing', LANGUAGE)}
             return
         
-        # Create model-specific agents
-        model_critical_agent = ChatAgent(
-            name="CriticalAnalyst",
-            chat_client=model_chat_client,
-            instructions=get_text('agent_critical_instructions', LANGUAGE),
-        )
-
-        model_positive_agent = ChatAgent(
-            name="PositiveAdvocate",
-            chat_client=model_chat_client,
-            instructions=get_text('agent_positive_instructions', LANGUAGE),
-        )
-
-        model_synthesizer_agent = ChatAgent(
-            name="Synthesizer",
-            chat_client=model_chat_client,
-            instructions=get_text('agent_synthesizer_instructions', LANGUAGE),
-        )
+        # Model-specific agents are shared; the workflow instance is fresh for this request
+        template = agent_templates.checkout("multi_agent", resolve_deployment(model_name), model_chat_client)
+        session = _stream_session(request_id, "/api/multi-agent-stream", "pipeline" if pipeline else "sequential", model_name, prompt, body)
+        model_synthesizer_agent = session.wrap("Synthesizer", template.agents["Synthesizer"])
 
         try:
-            yield json.dumps(
-                {"type": "ui_message", "message": get_text('ui_multi_agent_start', LANGUAGE)},
-                ensure_ascii=False,
-            ) + "\n"
-            yield json.dumps({"type": "start"}, ensure_ascii=False) + "\n"
+            yield {"type": "ui_message", "message": get_text('ui_multi_agent_start', LANGUAGE)}
+            yield {"type": "start"}
             
-            # Use ConcurrentBuilder to create parallel workflow
+            # Parallel ConcurrentBuilder workflow, prebuilt by the template registry
             workflow_start = time.time()
             logger.info(f"[{request_id}] {get_text('log_workflow_building', LANGUAGE)}")
-            agents = [model_critical_agent, model_positive_agent]
-            workflow = ConcurrentBuilder().participants(agents).build()
+            workflow = session.wrap("workflow", template.workflow)
             logger.info(f"[{request_id}] {get_text('log_workflow_built', LANGUAGE, time=f'{(time.time() - workflow_start)*1000:.2f}')}")
             
+            if pipeline:
+                # Pipelined mode: synthesis overlaps the tail of the perspectives
+                workflow_exec_start = time.time()
+                logger.info(f"[{request_id}] {get_text('log_parallel_execution_start', LANGUAGE, length=len(prompt))}")
+                pipelined = PipelinedSynthesis(
+                    workflow=workflow,
+                    synthesizer=model_synthesizer_agent,
+                    perspectives=["CriticalAnalyst", "PositiveAdvocate"],
+                    build_prompt=lambda texts: _build_synthesis_prompt(prompt, **_perspective_args(texts)),
+                    build_reconcile_prompt=lambda remainders: _build_reconcile_prompt(**_perspective_args(remainders)),
+                    fit=lambda texts: _fit_synthesis_inputs(request_id, prompt, texts),
+                    min_chars=MULTI_AGENT_PIPELINE_MIN_CHARS,
+                    max_wait=MULTI_AGENT_PIPELINE_MAX_WAIT,
+                )
+                synthesis_start = None
+                async with aclosing(pipelined.run(prompt)) as items:
+                    async for item in items:
+                        kind = item["kind"]
+                        if kind in ("perspective", "synthesis"):
+                            stream_metrics.chunk(item.get("agent", "Synthesizer"))
+                            data = {
+                                "agent": item.get("agent", "Synthesizer"),
+                                "content": item["text"],
+                                "is_final": False
+                            }
+                            yield data
+                        elif kind == "synthesis_start":
+                            synthesis_start = time.time()
+                            if item["partial"]:
+                                logger.info(f"[{request_id}] {get_text('log_pipeline_synthesis_start', LANGUAGE, time=f'{synthesis_start - workflow_exec_start:.2f}', chars=sum(pipelined.seen_chars.values()))}")
+                            else:
+                                logger.info(f"[{request_id}] {get_text('log_synthesis_start', LANGUAGE)}")
+                            yield {"type": "synthesis_start"}
+                        elif kind == "agents_complete":
+                            agents_time = time.time() - workflow_exec_start
+                            logger.info(f"[{request_id}] {get_text('log_parallel_execution_complete', LANGUAGE, time=f'{agents_time:.2f}', count=item['event_count'])}")
+                            yield {"type": "agents_complete"}
+                        elif kind == "recovered":
+                            yield {"type": "recovered", "agent": item["agent"], **item["marker"]}
+                        elif kind == "reconcile_start":
+                            logger.info(f"[{request_id}] {get_text('log_pipeline_reconcile', LANGUAGE)}")
+                            yield {"type": "synthesis_reconcile"}
+                        elif kind == "synthesis_complete":
+                            synthesis_time = time.time() - synthesis_start
+                            logger.info(f"[{request_id}] {get_text('log_synthesis_complete', LANGUAGE, time=f'{synthesis_time:.2f}', count=item['chunks'])}")
+
+                total_time = time.time() - start_time
+                logger.info(f"[{request_id}] {get_text('log_overall_complete', LANGUAGE, time=f'{total_time:.2f}')}")
+                yield {"type": "complete"}
+                return
+
             # Store agent results
             agent_results = {}
             
@@ -330,84 +1151,83 @@ async def multi_agent_stream(request: Request):
             workflow_exec_start = time.time()
             logger.info(f"[{request_id}] {get_text('log_parallel_execution_start', LANGUAGE, length=len(prompt))}")
             event_count = 0
-            async for event in workflow.run_stream(prompt):
-                event_count += 1
-                # AgentRunUpdateEvent: Streaming updates from agents
-                if isinstance(event, AgentRunUpdateEvent):
-                    # Get agent name from executor_id
-                    agent_name = event.executor_id
+            async with aclosing(workflow.run_stream(prompt)) as events:
+                async for event in events:
+                    event_count += 1
+                    # AgentRunUpdateEvent: Streaming updates from agents
+                    if isinstance(event, AgentRunUpdateEvent):
+                        # Get agent name from executor_id
+                        agent_name = event.executor_id
+                        marker = recovery_marker(event.data)
+                        if marker:
+                            yield {"type": "recovered", "agent": agent_name, **marker}
                     
-                    # Get text from AgentRunResponseUpdate
-                    if event.data and hasattr(event.data, 'text') and event.data.text:
-                        data = {
-                            "agent": agent_name,
-                            "content": event.data.text,
-                            "is_final": False
-                        }
-                        yield json.dumps(data, ensure_ascii=False) + "\n"
+                        # Get text from AgentRunResponseUpdate
+                        if event.data and hasattr(event.data, 'text') and event.data.text:
+                            stream_metrics.chunk(agent_name)
+                            data = {
+                                "agent": agent_name,
+                                "content": event.data.text,
+                                "is_final": False
+                            }
+                            yield data
                 
-                # WorkflowOutputEvent: Final output from workflow
-                elif isinstance(event, WorkflowOutputEvent):
-                    # Collect results from concurrent agents
-                    # event.data is a list of ChatMessages
-                    if event.data:
-                        for msg in event.data:
-                            if hasattr(msg, 'author_name') and hasattr(msg, 'text'):
-                                agent_results[msg.author_name] = msg.text
+                    # WorkflowOutputEvent: Final output from workflow
+                    elif isinstance(event, WorkflowOutputEvent):
+                        # Collect results from concurrent agents
+                        # event.data is a list of ChatMessages
+                        if event.data:
+                            for msg in event.data:
+                                if hasattr(msg, 'author_name') and hasattr(msg, 'text'):
+                                    agent_results[msg.author_name] = msg.text
             
             agents_time = time.time() - workflow_exec_start
             logger.info(f"[{request_id}] {get_text('log_parallel_execution_complete', LANGUAGE, time=f'{agents_time:.2f}', count=event_count)}")
-            yield json.dumps({"type": "agents_complete"}, ensure_ascii=False) + "\n"
+            yield {"type": "agents_complete"}
             
             # Stream synthesis analysis
             synthesis_start = time.time()
             logger.info(f"[{request_id}] {get_text('log_synthesis_start', LANGUAGE)}")
-            yield json.dumps({"type": "synthesis_start"}, ensure_ascii=False) + "\n"
+            yield {"type": "synthesis_start"}
             
-            # Pass both results to the synthesizer agent
-            critical_content = agent_results.get("CriticalAnalyst", "")
-            positive_content = agent_results.get("PositiveAdvocate", "")
+            # Pass both results to the synthesizer agent (capped by the synthesis token budget)
+            perspectives = _fit_synthesis_inputs(request_id, prompt, {
+                "CriticalAnalyst": agent_results.get("CriticalAnalyst", ""),
+                "PositiveAdvocate": agent_results.get("PositiveAdvocate", ""),
+            })
             
-            synthesis_prompt = f"""
-Integrate the following two perspectives to provide a balanced analysis.
-
-Original question: {prompt}
-
-Critical perspective:
-{critical_content}
-
-Positive perspective:
-{positive_content}
-"""
+            synthesis_prompt = _build_synthesis_prompt(prompt, **_perspective_args(perspectives))
             
             # Stream synthesizer agent's response
             synthesis_chunk_count = 0
-            async for update in model_synthesizer_agent.run_stream(synthesis_prompt):
-                if update.text:
-                    synthesis_chunk_count += 1
-                    data = {
-                        "agent": "Synthesizer",
-                        "content": update.text,
-                        "is_final": False
-                    }
-                    yield json.dumps(data, ensure_ascii=False) + "\n"
+            async with aclosing(model_synthesizer_agent.run_stream(synthesis_prompt)) as updates:
+                async for update in updates:
+                    marker = recovery_marker(update)
+                    if marker:
+                        yield {"type": "recovered", "agent": "Synthesizer", **marker}
+                    if update.text:
+                        synthesis_chunk_count += 1
+                        stream_metrics.chunk("Synthesizer")
+                        data = {
+                            "agent": "Synthesizer",
+                            "content": update.text,
+                            "is_final": False
+                        }
+                        yield data
             
             synthesis_time = time.time() - synthesis_start
             total_time = time.time() - start_time
             logger.info(f"[{request_id}] {get_text('log_synthesis_complete', LANGUAGE, time=f'{synthesis_time:.2f}', count=synthesis_chunk_count)}")
             logger.info(f"[{request_id}] {get_text('log_overall_complete', LANGUAGE, time=f'{total_time:.2f}')}")
-            yield json.dumps({"type": "complete"}, ensure_ascii=False) + "\n"
+            yield {"type": "complete"}
             
         except Exception as e:
-            import traceback
-            error_data = {
-                "type": "error", 
-                "message": str(e),
-                "traceback": traceback.format_exc()
-            }
-            yield json.dumps(error_data, ensure_ascii=False) + "\n"
+            yield _error_event(request_id, stream_metrics, e, debug=_stream_debug(body))
 
-    return StreamingResponse(generator(), media_type="text/plain")
+    return _ndjson_response(
+        request, body, supervised(request_id, stream_metrics, ticket, generator(), events=True), ["CriticalAnalyst", "PositiveAdvocate", "Synthesizer"],
+        ticket=ticket,
+    )
 
 
 @app.post("/api/phase1/stream")
@@ -420,171 +1240,45 @@ async def phase1_planning_stream(request: Request):
     prompt = body.get("prompt", "")
     model_name = body.get("model", "gpt-4.1-mini")
     tone = body.get("tone", "balanced")
+    mode = "dag" if (body.get("mode") or BOARD_MODE) == "dag" else "group_chat"
 
     logger.info(f"[{request_id}] {get_text('log_model_info', LANGUAGE, model=model_name)}")
     logger.info(f"[{request_id}] {get_text('log_tone_setting', LANGUAGE, tone=tone)}")
+    logger.info(f"[{request_id}] {get_text('log_board_mode', LANGUAGE, mode=mode)}")
 
     if not prompt:
         return JSONResponse({"error": "prompt required"}, status_code=400)
+    if not _valid_replay_speed(body):
+        return JSONResponse({"error": "invalid replay_speed"}, status_code=400)
 
     parse_time = time.time()
     logger.info(f"[{request_id}] {get_text('log_request_parsed', LANGUAGE, time=f'{(parse_time - start_time)*1000:.2f}')}")
-    
-    # Tone-specific speaking style instructions
-    tone_instructions = {
-        "formal": get_text('tone_formal', LANGUAGE),
-        "balanced": get_text('tone_balanced', LANGUAGE),
-        "casual": get_text('tone_casual', LANGUAGE),
-        "concise": get_text('tone_concise', LANGUAGE),
-        "detailed": get_text('tone_detailed', LANGUAGE)
-    }
-    
-    tone_suffix = tone_instructions.get(tone, tone_instructions["balanced"])
+
+    # One model call per board turn (dag mode: one turn per participant)
+    calls = len(BOARD_SEQUENCE) if mode == "dag" else BOARD_MAX_ROUNDS
+    ticket = _admit(request_id, resolve_deployment(model_name), prompt, calls=calls)
+    if isinstance(ticket, JSONResponse):
+        return ticket
+    stream_metrics = metrics.StreamMetrics("/api/phase1/stream", metrics_model(model_name), resolve_deployment(model_name))
 
     async def generator():
         model_chat_client = get_chat_client_for_model(model_name)
         if model_chat_client is None:
-            yield get_text('error_config_missing', LANGUAGE) + "\n"
+            stream_metrics.error("config_missing")
+            yield {"type": "error", "message": get_text('error_config_missing', LANGUAGE)}
             return
 
-        import json
-
-        AGENT_SEQUENCE = [
-            "CEO",
-            "CTO",
-            "CFO",
-            "COO",
-        ]
-
-        def _pick_participant_name(*candidates: Optional[str]) -> Optional[str]:
-            """Return the first candidate that matches a known participant name."""
-            for candidate in candidates:
-                if not candidate:
-                    continue
-                value = str(candidate).strip()
-                if value in AGENT_SEQUENCE:
-                    return value
-            return None
-
-        # AI Board Meeting: Create CxO agents
+        # AI Board Meeting: CxO agents for this tone, shared across requests
         logger.info(f"[{request_id}] {get_text('log_planning_agent_creating', LANGUAGE)}")
-        ceo_agent = ChatAgent(
-            name="CEO",
-            chat_client=model_chat_client,
-            description="CEO leading the management meeting and presenting strategic direction",
-            instructions=get_text('agent_board_ceo_instructions', LANGUAGE, tone_suffix=tone_suffix),
-        )
-
-        cto_agent = ChatAgent(
-            name="CTO",
-            chat_client=model_chat_client,
-            description="Evaluates technical strategy and feasibility",
-            instructions=get_text('agent_board_cto_instructions', LANGUAGE, tone_suffix=tone_suffix),
-        )
-
-        cfo_agent = ChatAgent(
-            name="CFO",
-            chat_client=model_chat_client,
-            description="Evaluates financial viability and business potential",
-            instructions=get_text('agent_board_cfo_instructions', LANGUAGE, tone_suffix=tone_suffix),
-        )
-
-        coo_agent = ChatAgent(
-            name="COO",
-            chat_client=model_chat_client,
-            description="Integrates CxO opinions and creates execution plan",
-            instructions=get_text('agent_board_coo_instructions', LANGUAGE, tone_suffix=tone_suffix),
-        )
-
+        flow = "board_dag" if mode == "dag" else "board"
+        template = agent_templates.checkout(flow, resolve_deployment(model_name), model_chat_client, tone=tone)
         logger.info(f"[{request_id}] {get_text('log_planning_agent_created', LANGUAGE)}")
 
-        # Build workflow (create new instance to reset)
+        # Fresh (never-run) workflow instance from the template pool
         workflow_id = f"wf_{int(time.time() * 1000)}"
         logger.info(f"[{request_id}] {get_text('log_board_workflow_building', LANGUAGE, id=workflow_id)}")
-
-        selector_state = {
-            "calls": 0,
-            "last_returned": None,
-        }
-
-        def planning_selector(state) -> Optional[str]:
-            # Newer Agent Framework passes GroupChatState:
-            # - current_round: int
-            # - conversation: list[ChatMessage]
-            # Keep this defensive to tolerate slight shape differences across betas.
-            round_idx = getattr(state, "current_round", None)
-            if round_idx is None:
-                round_idx = getattr(state, "round_index", 0) or 0
-
-            history = getattr(state, "conversation", None)
-            if history is None:
-                history = getattr(state, "history", ()) or ()
-
-            # Similar to examples/two_phase_planning_execution.ipynb: limit by round_index
-            MAX_ROUNDS = 10
-            if round_idx >= MAX_ROUNDS:
-                logger.warning(f"[{request_id}] {get_text('warning_max_rounds', LANGUAGE, max=MAX_ROUNDS)}")
-                return None
-
-            # Double guard for cases where round_index doesn't advance properly
-            MAX_SELECTOR_CALLS = 50
-            if selector_state["calls"] >= MAX_SELECTOR_CALLS:
-                logger.warning(f"[{request_id}] {get_text('warning_max_selector_calls', LANGUAGE, max=MAX_SELECTOR_CALLS)}")
-                return None
-
-            # Completion check: Look for PLAN_READY in recent messages (checking from end)
-            for turn in reversed(history):
-                text = ""
-                if hasattr(turn, "text"):
-                    text = turn.text or ""
-                elif hasattr(turn, "message") and hasattr(turn.message, "text"):
-                    text = turn.message.text or ""
-                if text and "PLAN_READY:" in text:
-                    logger.info(f"[{request_id}] {get_text('log_plan_ready', LANGUAGE)}")
-                    return None
-
-            # Find the last "expected agent" speaker (skip orchestrator, etc.)
-            last_agent_speaker: Optional[str] = None
-            for turn in reversed(history):
-                speaker = None
-                if hasattr(turn, "author_name"):
-                    speaker = turn.author_name
-                elif hasattr(turn, "speaker"):
-                    speaker = turn.speaker
-                elif hasattr(turn, "message") and hasattr(turn.message, "author_name"):
-                    speaker = turn.message.author_name
-                speaker = _pick_participant_name(speaker)
-                if speaker:
-                    last_agent_speaker = speaker
-                    break
-
-            if not last_agent_speaker:
-                next_speaker = AGENT_SEQUENCE[0]
-            else:
-                current_index = AGENT_SEQUENCE.index(last_agent_speaker)
-                next_speaker = AGENT_SEQUENCE[(current_index + 1) % len(AGENT_SEQUENCE)]
-
-            # Guard for when selector is called multiple times quickly and history hasn't updated yet
-            if next_speaker == selector_state.get("last_returned"):
-                current_index = AGENT_SEQUENCE.index(next_speaker)
-                next_speaker = AGENT_SEQUENCE[(current_index + 1) % len(AGENT_SEQUENCE)]
-
-            selector_state["calls"] += 1
-            selector_state["last_returned"] = next_speaker
-            return next_speaker
-
-        planning_workflow = (
-            GroupChatBuilder()
-            .participants([
-                ceo_agent,
-                cto_agent,
-                cfo_agent,
-                coo_agent,
-            ])
-            .with_select_speaker_func(planning_selector, orchestrator_name="PlanningOrchestrator")
-            .build()
-        )
-        
+        template.state["request_id"] = request_id
+        planning_workflow = _stream_session(request_id, "/api/phase1/stream", mode, model_name, prompt, body).wrap("workflow", template.workflow)
         logger.info(f"[{request_id}] {get_text('log_board_workflow_built', LANGUAGE, id=workflow_id)}")
 
         workflow_exec_start = time.time()
@@ -592,58 +1286,387 @@ async def phase1_planning_stream(request: Request):
         event_count = 0
         seq = 0
 
-        async for event in planning_workflow.run_stream(prompt):
-            event_count += 1
-            if isinstance(event, AgentRunUpdateEvent):
-                # NOTE: Agent Framework's executor_id is the "executor (node) ID in workflow",
-                #       not necessarily the participant name (CEO, etc.) - it could be PlanningOrchestrator.
-                #       Get participant name from author_name, and don't output events from non-participants.
-                author_name = None
-                if event.data is not None:
-                    if hasattr(event.data, "author_name") and event.data.author_name:
-                        author_name = event.data.author_name
-                    elif hasattr(event.data, "message") and hasattr(event.data.message, "author_name"):
-                        author_name = event.data.message.author_name
-
-                agent_name = _pick_participant_name(author_name, event.executor_id)
-                if not agent_name:
-                    # Non-participants (e.g., PlanningOrchestrator / internal executor)
-                    continue
-
-                text = ""
-                if event.data is not None and hasattr(event.data, "text"):
-                    text = event.data.text or ""
-                elif event.data is not None and hasattr(event.data, "message") and hasattr(event.data.message, "text"):
-                    text = event.data.message.text or ""
-                elif event.data is not None:
-                    text = str(event.data)
-                if text:
-                    seq += 1
-                    data = {
-                        "agent": agent_name,
-                        "seq": seq,
-                        "content": text,
-                        "is_final": False,
-                        # For debugging: executor node ID and author name (if exists)
-                        "executor_id": getattr(event, "executor_id", None),
-                        "author_name": author_name,
-                    }
-                    yield json.dumps(data, ensure_ascii=False) + "\n"
-            elif isinstance(event, WorkflowOutputEvent):
-                pass
+        async with aclosing(planning_workflow.run_stream(prompt)) as events:
+            async for event in events:
+                event_count += 1
+                if isinstance(event, AgentRunUpdateEvent):
+                    # NOTE: Agent Framework's executor_id is the "executor (node) ID in workflow",
+                    #       not necessarily the participant name (CEO, etc.) - it could be PlanningOrchestrator.
+                    #       Get participant name from author_name, and don't output events from non-participants.
+                    author_name = None
+                    if event.data is not None:
+                        if hasattr(event.data, "author_name") and event.data.author_name:
+                            author_name = event.data.author_name
+                        elif hasattr(event.data, "message") and hasattr(event.data.message, "author_name"):
+                            author_name = event.data.message.author_name
+
+                    agent_name = _pick_participant_name(author_name, event.executor_id)
+                    if not agent_name:
+                        # Non-participants (e.g., PlanningOrchestrator / internal executor)
+                        continue
+
+                    text = ""
+                    if event.data is not None and hasattr(event.data, "text"):
+                        text = event.data.text or ""
+                    elif event.data is not None and hasattr(event.data, "message") and hasattr(event.data.message, "text"):
+                        text = event.data.message.text or ""
+                    elif event.data is not None:
+                        text = str(event.data)
+                    if text:
+                        seq += 1
+                        stream_metrics.chunk(agent_name)
+                        data = {
+                            "agent": agent_name,
+                            "seq": seq,
+                            "content": text,
+                            "is_final": False,
+                            # For debugging (opt-in): executor node ID and author name (if exists)
+                            "executor_id": getattr(event, "executor_id", None),
+                            "author_name": author_name,
+                        }
+                        yield data
+                elif isinstance(event, WorkflowOutputEvent):
+                    pass
 
         total_time = time.time() - start_time
         workflow_time = time.time() - workflow_exec_start
         logger.info(f"[{request_id}] {get_text('log_board_complete', LANGUAGE, workflow_time=f'{workflow_time:.2f}', count=event_count, total_time=f'{total_time:.2f}')}")
-        yield json.dumps({"type": "complete"}, ensure_ascii=False) + "\n"
+        yield {"type": "complete"}
+
+    return _ndjson_response(request, body, supervised(request_id, stream_metrics, ticket, generator(), events=True), BOARD_SEQUENCE, ticket=ticket)
+
+
+@app.get("/api/flows")
+async def list_flows():
+    """Declarative flows and the stages of each that run concurrently"""
+    return {
+        name: {"description": definition.description, "stages": definition.levels(), "uses_tone": definition.uses_tone}
+        for name, definition in workflow_definitions.items()
+    }
 
-    return StreamingResponse(generator(), media_type="text/plain")
+
+@app.post("/api/flows/{name}/stream")
+async def flow_stream(name: str, request: Request):
+    """Run a declarative flow; every stage whose dependencies are done runs concurrently"""
+    start_time = time.time()
+    request_id = f"flow_{int(start_time * 1000)}"
+    definition = workflow_definitions.get(name)
+    if definition is None:
+        return JSONResponse({"error": f"unknown flow: {name}"}, status_code=404)
+    logger.info(f"[{request_id}] {get_text('log_flow_request', LANGUAGE, name=name, levels=definition.levels())}")
+
+    body = await request.json()
+    prompt = body.get("prompt", "")
+    model_name = body.get("model", "gpt-4.1-mini")
+    tone = body.get("tone", "balanced")
+
+    if not prompt:
+        return JSONResponse({"error": "prompt required"}, status_code=400)
+    if not _valid_replay_speed(body):
+        return JSONResponse({"error": "invalid replay_speed"}, status_code=400)
+
+    # One model call per stage
+    ticket = _admit(request_id, resolve_deployment(model_name), prompt, calls=len(definition.stages))
+    if isinstance(ticket, JSONResponse):
+        return ticket
+    stream_metrics = metrics.StreamMetrics(f"/api/flows/{name}/stream", metrics_model(model_name), resolve_deployment(model_name))
+    stages = set(definition.order)
+
+    async def generator():
+        model_chat_client = get_chat_client_for_model(model_name)
+        if model_chat_client is None:
+            stream_metrics.error("config_missing")
+            yield {"type": "error", "message": get_text('error_config_missing', LANGUAGE)}
+            return
+
+        template = agent_templates.checkout(f"flow:{name}", resolve_deployment(model_name), model_chat_client, tone=tone)
+        template.state["request_id"] = request_id
+        workflow_exec_start = time.time()
+        event_count = 0
+        seq = 0
+
+        try:
+            yield {"type": "start", "stages": definition.levels()}
+            workflow = _stream_session(request_id, f"/api/flows/{name}/stream", "", model_name, prompt, body).wrap("workflow", template.workflow)
+            async with aclosing(workflow.run_stream(prompt)) as events:
+                async for event in events:
+                    event_count += 1
+                    if isinstance(event, AgentRunUpdateEvent) and event.executor_id in stages:
+                        text = getattr(event.data, "text", None) if event.data is not None else None
+                        if text:
+                            seq += 1
+                            stream_metrics.chunk(event.executor_id)
+                            yield {
+                                "agent": event.executor_id,
+                                "seq": seq,
+                                "content": text,
+                                "is_final": False,
+                                "executor_id": event.executor_id,
+                            }
+                    elif isinstance(event, ExecutorCompletedEvent) and event.executor_id in stages:
+                        yield {"type": "agent_complete", "agent": event.executor_id}
+
+            workflow_time = time.time() - workflow_exec_start
+            logger.info(f"[{request_id}] {get_text('log_flow_complete', LANGUAGE, name=name, time=f'{workflow_time:.2f}', count=event_count)}")
+            yield {"type": "complete"}
+
+        except Exception as e:
+            yield _error_event(request_id, stream_metrics, e, debug=_stream_debug(body))
+
+    return _ndjson_response(request, body, supervised(request_id, stream_metrics, ticket, generator(), events=True), definition.order, ticket=ticket)
+
+
+# Batch jobs (/api/batch): prompts run in the background, at most BATCH_CONCURRENCY at a time per
+# deployment, behind the same admission queue as interactive requests
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+# LLM calls one item of each mode makes (the RAG search tool call is a second round trip)
+BATCH_MODES = {"chat": 1, "rag": 2, "multi_agent": 3}
+
+
+def _check_batch_item(item: BatchItem) -> None:
+    if not item.prompt:
+        raise ValueError("prompt required")
+    if item.mode not in BATCH_MODES:
+        raise ValueError(f"unknown mode {item.mode!r}")
+
+
+async def _run_batch_item(item: BatchItem) -> dict:
+    model_chat_client = get_chat_client_for_model(item.model)
+    if model_chat_client is None:
+        raise RuntimeError(get_text('error_config_missing', LANGUAGE))
+    deployment_name = resolve_deployment(item.model)
+
+    if item.mode == "chat":
+        response = await agent_templates.agents("simple", deployment_name, model_chat_client)["SimpleAgent"].run(item.prompt)
+        return {"text": response.text}
+    if item.mode == "rag":
+        response = await agent_templates.agents("rag", deployment_name, model_chat_client)["SearchAgent"].run(item.prompt)
+        return {"text": response.text}
+
+    template = agent_templates.checkout("multi_agent", deployment_name, model_chat_client)
+    perspectives = {}
+    for output in (await template.workflow.run(item.prompt)).get_outputs():
+        for msg in output or ():
+            if getattr(msg, "author_name", None):
+                perspectives[msg.author_name] = msg.text
+    texts = {name: perspectives.get(name, "") for name in ("CriticalAnalyst", "PositiveAdvocate")}
+    synthesis_prompt = _build_synthesis_prompt(
+        item.prompt, **_perspective_args(_fit_synthesis_inputs(f"batch_{item.id}", item.prompt, texts))
+    )
+    response = await template.agents["Synthesizer"].run(synthesis_prompt)
+    return {"text": response.text, "perspectives": texts}
+
+
+@asynccontextmanager
+async def _batch_slot(item: BatchItem):
+    """Admission for one batch item; a full queue is waited out instead of failing the item."""
+    if admission is None:
+        yield
+        return
+    calls = BATCH_MODES[item.mode]
+    extra_tokens = SYNTHESIS_MAX_INPUT_TOKENS if item.mode == "multi_agent" else 0
+    while True:
+        try:
+            ticket = admission.enqueue(resolve_deployment(item.model), estimate_tokens(item.prompt) * calls + extra_tokens, calls)
+            break
+        except AdmissionRejected as e:
+            await asyncio.sleep(max(e.retry_after, 1))
+    try:
+        async for _ in ticket.wait():
+            pass
+        yield
+    finally:
+        ticket.release()
+
+
+batch_runner = BatchRunner(
+    _run_batch_item,
+    deployment_for=lambda item: resolve_deployment(item.model),
+    check=_check_batch_item,
+    concurrency=BATCH_CONCURRENCY,
+    # Per-deployment overrides, e.g. {"gpt-4.1": 2}
+    limits=json.loads(os.getenv("BATCH_LIMITS") or "{}"),
+    slot=_batch_slot,
+    retryable=lambda exc: isinstance(exc, DeploymentUnavailableError) or failure_reason(exc) is not None,
+    max_jobs=int(os.getenv("BATCH_MAX_JOBS", "100")),
+    ttl=float(os.getenv("BATCH_JOB_TTL", "3600")),
+    language=LANGUAGE,
+    on_result=lambda item, status: metrics.BATCH_ITEMS.labels(item.mode, status).inc(),
+)
+
+
+def _batch_response(job, after: int = 0) -> StreamingResponse:
+    async def encode():
+        async for event in batch_runner.follow(job, after):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        encode(),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Job-Id": job.job_id, "Content-Location": f"/api/batch/{job.job_id}"},
+    )
+
+
+@app.post("/api/batch")
+async def api_batch(request: Request):
+    """
+    Run many prompts as one background job and stream NDJSON results tagged by item id
+    as they complete. {"items": [{"id", "prompt", "model", "mode": chat|rag|multi_agent}]}
+    starts a job; {"job_id", "items"?} adds items to it and re-runs its failed ones.
+    A dropped client reconnects with GET /api/batch/{job_id}?after=<last seq>.
+    """
+    body = await request.json()
+    job_id = body.get("job_id")
+    raw_items = body.get("items") or []
+    if not isinstance(raw_items, list) or (not raw_items and not job_id):
+        return JSONResponse({"error": "items required"}, status_code=400)
+    if len(raw_items) > BATCH_MAX_ITEMS:
+        return JSONResponse({"error": f"at most {BATCH_MAX_ITEMS} items per request"}, status_code=413)
+
+    items = []
+    for index, raw in enumerate(raw_items):
+        if not isinstance(raw, dict):
+            raw = {"prompt": raw}
+        mode = str(raw.get("mode") or "chat").replace("-", "_")
+        items.append(BatchItem(
+            id=str(raw.get("id", index)),
+            prompt=str(raw.get("prompt") or ""),
+            model=raw.get("model") or "gpt-4.1-mini",
+            mode=mode,
+        ))
+    if len({item.id for item in items}) != len(items):
+        return JSONResponse({"error": "duplicate item ids"}, status_code=400)
+
+    try:
+        job = batch_runner.submit(items, job_id=job_id, retry_failed=bool(body.get("retry_failed", True)))
+    except KeyError:
+        return JSONResponse({"error": "unknown job"}, status_code=404)
+    except BatchRejected:
+        return JSONResponse({"error": get_text('error_overloaded', LANGUAGE)}, status_code=429, headers={"Retry-After": "30"})
+    return _batch_response(job, int(body.get("after") or 0))
+
+
+@app.get("/api/batch/stats")
+async def batch_stats():
+    """Batch jobs held, items running per deployment, and item counters"""
+    return batch_runner.stats()
+
+
+@app.get("/api/batch/{job_id}")
+async def batch_job(job_id: str, after: int = 0, follow: bool = True):
+    """Replay a job's results after seq `after` and follow it until done (follow=false: summary only)."""
+    job = batch_runner.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "unknown job"}, status_code=404)
+    if not follow:
+        return job.summary()
+    return _batch_response(job, after)
 
 
 @app.get("/")
 async def root():
     return {"status": "ok", "framework": "Microsoft Agent Framework"}
 
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics (TTFT, inter-chunk gaps, throughput, in-flight streams, errors)"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/api/streams/stats")
+async def stream_buffers_stats():
+    """Counters and memory usage of the resumable SSE stream buffers"""
+    return stream_buffers.stats()
+
+
+@app.get("/api/streams/{stream_id}")
+async def resume_stream(stream_id: str, request: Request):
+    """Resume an SSE-mode stream after the event id in Last-Event-ID (replayed from the buffer, not regenerated)"""
+    buffer = stream_buffers.get(stream_id)
+    if buffer is None:
+        return JSONResponse({"error": "stream not found or expired"}, status_code=404)
+    last_event_id = request.headers.get("Last-Event-ID") or request.query_params.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return JSONResponse({"error": "invalid Last-Event-ID"}, status_code=400)
+    return StreamingResponse(
+        stream_buffers.sse(buffer, last_event_id),
+        media_type="text/event-stream",
+        headers={"X-Stream-Id": stream_id, "Cache-Control": "no-cache"},
+    )
+
+
+@app.get("/api/pool/stats")
+async def pool_stats():
+    """Connection pool statistics of the shared Azure OpenAI HTTP client"""
+    if client_registry is None:
+        return JSONResponse({"error": "Azure OpenAI configuration is missing"}, status_code=503)
+    return client_registry.stats()
+
+
+@app.get("/api/breakers/stats")
+async def breaker_stats():
+    """Circuit breaker state, retries and failovers per deployment"""
+    return {"enabled": failover_router is not None, **(failover_router.stats() if failover_router is not None else {})}
+
+
+@app.get("/api/recordings/stats")
+async def recordings_stats():
+    return {
+        "record": stream_recorder.stats() if stream_recorder is not None else None,
+        "replay": stream_replayer.stats() if stream_replayer is not None else None,
+    }
+
+
+@app.get("/api/hedging/stats")
+async def hedging_stats():
+    """Hedged requests fired and won per deployment, and the current hedge delays"""
+    return {"enabled": hedger is not None, **(hedger.stats() if hedger is not None else {})}
+
+@app.get("/api/search/cache/stats")
+async def search_cache_stats():
+    """Hit/miss counters of the search_tool result cache"""
+    return {"enabled": SEARCH_CACHE_ENABLED, **search_cache.stats()}
+
+
+@app.get("/api/search/index/stats")
+async def search_index_stats():
+    """Size and freshness of the local BM25 index (SEARCH_BACKEND=local)"""
+    if SEARCH_BACKEND != "local":
+        return {"backend": SEARCH_BACKEND}
+    return search_backend.stats()
+
+
+@app.get("/api/response-cache/stats")
+async def response_cache_stats():
+    """Hit/miss counters and memory usage of the /api/stream response cache"""
+    return {"enabled": RESPONSE_CACHE_ENABLED, "replay": RESPONSE_CACHE_REPLAY, **response_cache.stats()}
+
+
+@app.get("/api/admission/stats")
+async def admission_stats():
+    if admission is None:
+        return {"enabled": False}
+    return {"enabled": True, "deployments": admission.stats()}
+
+
+@app.get("/api/agent-templates/stats")
+async def agent_templates_stats():
+    """Reuse counters of the prebuilt agent/workflow templates, including build time saved"""
+    return agent_templates.stats()
+
+
+@app.get("/api/similar-cache/stats")
+async def similar_cache_stats():
+    """Hit/miss counters of the near-duplicate prompt cache"""
+    if similar_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **similar_cache.stats()}
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", "8000"))
@@ -0,0 +1,265 @@
+# Batch jobs: many prompts run in the background with bounded concurrency per deployment
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncContextManager, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from translations import get_text
+
+logger = logging.getLogger(__name__)
+
+PENDING, RUNNING, OK, ERROR = "pending", "running", "ok", "error"
+
+
+class BatchRejected(Exception):
+    """The runner is already holding as many unfinished jobs as it may."""
+
+
+@dataclass(frozen=True)
+class BatchItem:
+    id: str
+    prompt: str
+    model: str
+    mode: str
+
+
+class BatchJob:
+    """
+    One job: its items, their status and the result events in completion order.
+    Events are numbered from 1 ("seq"), so a client that lost its connection can
+    ask for everything after the last seq it saw.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.items: Dict[str, BatchItem] = {}
+        self.status: Dict[str, str] = {}
+        self.events: List[dict] = []
+        self.tasks: set = set()
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return all(status in (OK, ERROR) for status in self.status.values())
+
+    def counts(self) -> Dict[str, int]:
+        counts = {PENDING: 0, RUNNING: 0, OK: 0, ERROR: 0}
+        for status in self.status.values():
+            counts[status] += 1
+        return counts
+
+    def summary(self) -> dict:
+        counts = self.counts()
+        return {
+            "job_id": self.job_id,
+            "total": len(self.items),
+            "pending": counts[PENDING] + counts[RUNNING],
+            "succeeded": counts[OK],
+            "failed": counts[ERROR],
+            "done": self.done,
+            "last_seq": len(self.events),
+        }
+
+    def append(self, event: dict) -> None:
+        self.events.append({**event, "seq": len(self.events) + 1})
+        # Wake every waiting reader, then arm a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class BatchRunner:
+    """
+    Runs batch jobs in the background, decoupled from the HTTP connection that
+    submitted them: every item is a task that waits for a slot on its deployment
+    (at most `concurrency` items per deployment across all jobs, or the
+    deployment's entry in `limits`) plus whatever `slot(item)` adds (the admission
+    queue, so batch work shares the deployment's quota with interactive traffic).
+
+    Submitting to an existing job id adds the items it does not know yet and, with
+    `retry_failed`, runs its failed items again; items that succeeded never re-run.
+    Finished jobs are kept for `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        run_item: Callable[[BatchItem], Awaitable[dict]],
+        deployment_for: Callable[[BatchItem], Optional[str]],
+        *,
+        # Raises for an item that cannot run at all, so it fails without waiting for a slot
+        check: Optional[Callable[[BatchItem], None]] = None,
+        concurrency: int = 4,
+        limits: Optional[Dict[str, int]] = None,
+        slot: Optional[Callable[[BatchItem], AsyncContextManager]] = None,
+        retryable: Callable[[Exception], bool] = lambda exc: False,
+        max_jobs: int = 100,
+        ttl: float = 3600.0,
+        keepalive: float = 15.0,
+        language: str = "ja",
+        on_result: Optional[Callable[[BatchItem, str], None]] = None,
+    ):
+        self.run_item = run_item
+        self.deployment_for = deployment_for
+        self.check = check
+        self.concurrency = max(concurrency, 1)
+        self.limits = dict(limits or {})
+        self.slot = slot
+        self.retryable = retryable
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.keepalive = keepalive
+        self.language = language
+        self.on_result = on_result
+        self._jobs: "OrderedDict[str, BatchJob]" = OrderedDict()
+        self._semaphores: Dict[Optional[str], asyncio.Semaphore] = {}
+        self._running: Dict[str, int] = {}
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _semaphore(self, deployment: Optional[str]) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(deployment)
+        if semaphore is None:
+            limit = self.limits.get(deployment or "", self.concurrency)
+            semaphore = self._semaphores[deployment] = asyncio.Semaphore(max(limit, 1))
+        return semaphore
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        self._expire()
+        return self._jobs.get(job_id)
+
+    def submit(self, items: List[BatchItem], job_id: Optional[str] = None, retry_failed: bool = True) -> BatchJob:
+        """Start (or extend) a job; raises KeyError for an unknown job id, BatchRejected when full."""
+        self._expire()
+        if job_id is not None:
+            job = self._jobs[job_id]
+        else:
+            if sum(1 for job in self._jobs.values() if not job.done) >= self.max_jobs:
+                raise BatchRejected()
+            while len(self._jobs) >= self.max_jobs and self._evict_finished():
+                pass
+            job = BatchJob(uuid.uuid4().hex)
+            self._jobs[job.job_id] = job
+
+        queued: Dict[str, BatchItem] = {}
+        for item in items:
+            if item.id not in job.status or (retry_failed and job.status[item.id] == ERROR):
+                queued[item.id] = item
+        if retry_failed:
+            for item_id, status in job.status.items():
+                if status == ERROR and item_id not in queued:
+                    queued[item_id] = job.items[item_id]
+        for item in queued.values():
+            job.items[item.id] = item
+            job.status[item.id] = PENDING
+            task = asyncio.create_task(self._run(job, item))
+            job.tasks.add(task)
+            task.add_done_callback(job.tasks.discard)
+        if queued:
+            job.finished_at = None
+        self.submitted += len(queued)
+        logger.info(get_text('log_batch_submitted', self.language, job_id=job.job_id, count=len(queued), total=len(job.items)))
+        return job
+
+    async def _run(self, job: BatchJob, item: BatchItem) -> None:
+        deployment = self.deployment_for(item)
+        start = time.monotonic()
+        event: Dict[str, Any] = {"type": "result", "id": item.id, "model": item.model, "mode": item.mode}
+        try:
+            if self.check is not None:
+                self.check(item)
+            async with self._semaphore(deployment):
+                async with (self.slot(item) if self.slot is not None else _no_slot()):
+                    job.status[item.id] = RUNNING
+                    self._running[deployment or ""] = self._running.get(deployment or "", 0) + 1
+                    try:
+                        result = await self.run_item(item)
+                    finally:
+                        self._running[deployment or ""] -= 1
+            event.update(status=OK, **result)
+        except asyncio.CancelledError:
+            event.update(status=ERROR, error="cancelled", retryable=True)
+            raise
+        except Exception as exc:
+            logger.warning(get_text('log_batch_item_failed', self.language, job_id=job.job_id, id=item.id, error=str(exc)))
+            event.update(status=ERROR, error=str(exc), retryable=self.retryable(exc))
+        finally:
+            event["time_ms"] = round((time.monotonic() - start) * 1000, 2)
+            job.status[item.id] = event["status"]
+            if event["status"] == OK:
+                self.completed += 1
+            else:
+                self.failed += 1
+            if self.on_result is not None:
+                self.on_result(item, event["status"])
+            job.append(event)
+            if job.done:
+                job.finished_at = time.monotonic()
+                summary = job.summary()
+                job.append({"type": "complete", **{key: summary[key] for key in ("job_id", "total", "succeeded", "failed")}})
+                logger.info(get_text(
+                    'log_batch_complete', self.language,
+                    job_id=job.job_id, succeeded=summary["succeeded"], failed=summary["failed"],
+                ))
+
+    async def follow(self, job: BatchJob, after: int = 0) -> AsyncIterator[dict]:
+        """The job's summary, then every event after seq `after`, until the job is done."""
+        yield {"type": "job", **job.summary()}
+        cursor = max(after, 0)
+        while True:
+            for event in job.events[cursor:]:
+                yield event
+            cursor = len(job.events)
+            if job.done:
+                return
+            if not await job.wait(self.keepalive):
+                # Keeps idle proxies from closing a connection that waits on slow items
+                yield {"type": "keepalive", **job.summary()}
+
+    def _evict_finished(self) -> bool:
+        finished = next((job_id for job_id, job in self._jobs.items() if job.done), None)
+        if finished is None:
+            return False
+        del self._jobs[finished]
+        return True
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for job_id in [j for j, job in self._jobs.items() if job.done and job.finished_at and now - job.finished_at > self.ttl]:
+            del self._jobs[job_id]
+
+    async def aclose(self) -> None:
+        tasks = [task for job in self._jobs.values() for task in job.tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "jobs": len(self._jobs),
+            "active": sum(1 for job in self._jobs.values() if not job.done),
+            "concurrency": self.concurrency,
+            "limits": dict(self.limits),
+            "running": dict(self._running),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+@asynccontextmanager
+async def _no_slot():
+    yield
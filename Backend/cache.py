@@ -0,0 +1,201 @@
+# In-process TTL + LRU caches (with an optional local on-disk tier)
+
+import asyncio
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+def normalize_text(text: str) -> str:
+    """Normalize free text for cache keys (NFKC, case-folded, collapsed whitespace)."""
+    return " ".join(unicodedata.normalize("NFKC", text or "").casefold().split())
+
+
+class DiskCacheTier:
+    """
+    Small SQLite-backed second tier so cached entries survive restarts.
+    Values are stored as JSON, so other processes can write the file safely.
+    Calls block on SQLite; TTLCache only makes them from a worker thread.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_json (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[tuple]:
+        """Return (value, remaining_ttl) or None when missing/expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache_json WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            try:
+                value = json.loads(row[0]) if row[1] >= time.time() else None
+            except ValueError:
+                value = None
+            if value is None:
+                self._conn.execute("DELETE FROM cache_json WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+        return value, row[1] - time.time()
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_json (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + self.ttl),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_json")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache whose entries expire after `ttl` seconds.
+
+    Lookups are a dict access plus an LRU move, so memory hits cost microseconds.
+    When `disk_path` is set, `aget()` misses fall back to a DiskCacheTier in a worker
+    thread and entries found there are promoted back into memory; `aset()` also
+    writes through to it. The synchronous `get()`/`set()` only touch memory, so
+    they never block the event loop. Disk values must be JSON-serializable. When `max_bytes` is set, entries are weighed
+    with `sizeof` and the least recently used ones are evicted to stay under the limit.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 600.0,
+        disk_path: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: len(pickle.dumps(value)))
+        self.total_bytes = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._disk = DiskCacheTier(disk_path, ttl) if disk_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _get_memory(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is not None:
+            value, expires_at, _size = entry
+            if expires_at >= time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            self._remove(key)
+            self.expirations += 1
+        return None
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self._get_memory(key)
+        if value is None:
+            self.misses += 1
+        return value
+
+    async def aget(self, key: Hashable) -> Optional[Any]:
+        value = self._get_memory(key)
+        if value is not None:
+            return value
+        if self._disk is not None:
+            found = await asyncio.to_thread(self._disk.get, repr(key))
+            if found is not None:
+                value, remaining = found
+                self.disk_hits += 1
+                self._store(key, value, remaining)
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, key: Hashable, value: Any) -> bool:
+        """Store a value in memory; returns False when a single entry exceeds `max_bytes`."""
+        return self._store(key, value)
+
+    async def aset(self, key: Hashable, value: Any) -> bool:
+        """Like set(), also writing through to the disk tier."""
+        if not self._store(key, value):
+            return False
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, repr(key), value)
+        return True
+
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> bool:
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl), size)
+        self.total_bytes += size
+        while len(self._data) > self.max_entries or (
+            self.max_bytes is not None and self.total_bytes > self.max_bytes
+        ):
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+        return True
+
+    def _remove(self, key: Hashable) -> None:
+        _value, _expires_at, size = self._data.pop(key)
+        self.total_bytes -= size
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.total_bytes = 0
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "disk": self._disk.path if self._disk is not None else None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
@@ -0,0 +1,115 @@
+# Cancel the background work of a stream (agent runs, workflow supersteps) once its client is gone
+
+import asyncio
+import contextvars
+import weakref
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, Optional
+
+_current_scope: ContextVar[Optional["RunScope"]] = ContextVar("run_scope", default=None)
+
+
+class RunScope:
+    """
+    Tasks created while a stream is being produced.
+
+    The workflow runner drives each superstep in its own task and does not cancel it
+    when the event stream is abandoned, so closing the stream alone leaves the agents
+    (and their Azure OpenAI streams) running. Tasks are tracked through the loop's
+    task factory, so anything created in the scope's context is covered, however deep.
+    """
+
+    def __init__(self):
+        self.tasks: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+
+    def cancel(self) -> int:
+        """Cancel the scope's unfinished tasks; returns how many were cancelled."""
+        current = asyncio.current_task()
+        pending = [task for task in self.tasks if not task.done() and task is not current]
+        for task in pending:
+            task.cancel()
+        return len(pending)
+
+
+def install(loop: asyncio.AbstractEventLoop) -> None:
+    """Register tasks created inside a RunScope with it (chains any existing task factory)."""
+    previous = loop.get_task_factory()
+    if getattr(previous, "_run_scope_factory", False):
+        return
+
+    def factory(loop, coro, **kwargs):
+        if previous is not None:
+            task = previous(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        # The task runs in `context` when one is passed, else in a copy of the caller's
+        context = kwargs.get("context")
+        scope = context.get(_current_scope) if context is not None else _current_scope.get()
+        if scope is not None:
+            scope.tasks.add(task)
+        return task
+
+    factory._run_scope_factory = True
+    loop.set_task_factory(factory)
+
+
+def detached_task(coro) -> asyncio.Task:
+    """
+    Start a task outside any RunScope: shared work that a request merely kicks off
+    (an index refresh, a cache load) must not be cancelled when that request ends.
+    """
+    context = contextvars.copy_context()
+    context.run(_current_scope.set, None)
+    return asyncio.create_task(coro, context=context)
+
+
+async def cancel_on_exit(stream: AsyncIterator, on_cancel=None) -> AsyncIterator:
+    """
+    Pass `stream` through inside a new RunScope and cancel whatever it left running
+    when it stops early (client disconnect, error). `on_cancel(count)` is called when
+    tasks had to be cancelled.
+    """
+    scope = RunScope()
+    # Set in the context of the task driving this generator, which is per request
+    _current_scope.set(scope)
+    completed = False
+    try:
+        async for item in stream:
+            yield item
+        completed = True
+    finally:
+        _current_scope.set(None)
+        if not completed:
+            cancelled = scope.cancel()
+            if cancelled and on_cancel is not None:
+                on_cancel(cancelled)
+        await _aclose(stream)
+
+
+async def _aclose(stream) -> None:
+    aclose = getattr(stream, "aclose", None)
+    if aclose is None:
+        return
+    try:
+        await aclose()
+    except (asyncio.CancelledError, Exception):
+        # Already being torn down by the cancellation that got us here
+        pass
+
+
+async def until_stopped(stream: AsyncIterator, stopped: Callable[[], bool]) -> AsyncIterator:
+    """
+    Pass `stream` through until `stopped()` is true, then close it with aclose().
+
+    For reader tasks whose consumer has gone: the task.cancel() sent to the reader
+    can be swallowed by an asyncio.wait_for inside the source (Python < 3.12), and
+    the source then keeps producing. The next item ends the read instead, and the
+    source is closed from the reading task, where its tracing contexts were attached.
+    """
+    try:
+        async for item in stream:
+            if stopped():
+                return
+            yield item
+    finally:
+        await _aclose(stream)
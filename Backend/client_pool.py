@@ -0,0 +1,173 @@
+# Shared, pre-warmed Azure OpenAI chat clients (one per deployment)
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from agent_framework.azure import AzureOpenAIChatClient
+
+from translations import get_text
+
+logger = logging.getLogger(__name__)
+
+
+class ChatClientRegistry:
+    """
+    Per-deployment AzureOpenAIChatClient registry backed by one keep-alive HTTP pool.
+
+    Clients are created once (at startup for the known deployments, lazily for any
+    other deployment) and all of them share a single httpx.AsyncClient, so requests
+    reuse already-open TLS connections instead of paying a handshake per request.
+    """
+
+    def __init__(
+        self,
+        *,
+        api_key: str,
+        endpoint: str,
+        deployments: Iterable[Optional[str]] = (),
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 60.0,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 120.0,
+        http2: bool = False,
+        language: str = 'ja',
+        hedger=None,
+        router=None,
+        client_factory: Optional[Callable[[str], Any]] = None,
+    ):
+        self.api_key = api_key
+        self.endpoint = endpoint
+        self.language = language
+        self.http2 = http2
+        # Optional hedging.Hedger; installed as chat middleware on every client
+        self.hedger = hedger
+        # Optional failover.FailoverRouter; installed outside the hedging middleware
+        self.router = router
+        # Builds a stand-in client per deployment (mock_client.MockChatClient) instead of Azure ones
+        self.client_factory = client_factory
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._requests_sent = 0
+        self._warmup = {"connections": 0, "time_ms": None, "error": None}
+        self._http_client = self._build_http_client()
+        self._clients: Dict[str, AzureOpenAIChatClient] = {}
+        for deployment in deployments:
+            if deployment and deployment not in self._clients:
+                self._clients[deployment] = self._build_chat_client(deployment)
+
+        logger.info(get_text(
+            'log_pool_ready', language,
+            count=len(self._clients),
+            max_connections=max_connections,
+            keepalive=max_keepalive_connections,
+        ))
+
+    def _build_http_client(self) -> httpx.AsyncClient:
+        async def _count_request(_request: httpx.Request) -> None:
+            self._requests_sent += 1
+
+        return httpx.AsyncClient(
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=self.http2,
+            event_hooks={"request": [_count_request]},
+        )
+
+    def _build_chat_client(self, deployment_name: str) -> AzureOpenAIChatClient:
+        if self.client_factory is not None:
+            chat_client = self.client_factory(deployment_name)
+        else:
+            chat_client = AzureOpenAIChatClient(
+                api_key=self.api_key,
+                endpoint=self.endpoint,
+                deployment_name=deployment_name,
+            )
+            # Rebind the framework-built OpenAI client onto the shared pool; copy() keeps
+            # the deployment base URL, API version and default headers intact.
+            # The router retries with its own backoff and breakers, so the SDK's built-in retries are turned off
+            chat_client.client = chat_client.client.copy(
+                http_client=self._http_client,
+                max_retries=0 if self.router is not None else chat_client.client.max_retries,
+            )
+        middleware = []
+        if self.router is not None:
+            middleware.append(self.router.middleware(deployment_name))
+        if self.hedger is not None:
+            middleware.append(self.hedger.middleware(deployment_name))
+        if middleware:
+            chat_client.middleware = middleware
+        return chat_client
+
+    @property
+    def deployments(self) -> list:
+        return list(self._clients)
+
+    def get(self, deployment_name: str) -> AzureOpenAIChatClient:
+        """Return the pooled client for a deployment, creating it on first use."""
+        chat_client = self._clients.get(deployment_name)
+        if chat_client is None:
+            chat_client = self._build_chat_client(deployment_name)
+            self._clients[deployment_name] = chat_client
+        return chat_client
+
+    async def warmup(self, connections: int = 2) -> None:
+        """Pre-open keep-alive connections to the endpoint before the first request."""
+        if connections <= 0 or self.client_factory is not None:
+            return
+        start = time.time()
+        parts = urlsplit(self.endpoint)
+        url = f"{parts.scheme}://{parts.netloc}/"
+
+        async def _touch() -> None:
+            # Any HTTP response (usually 404 on the bare host) leaves a warm TLS connection behind
+            response = await self._http_client.get(url)
+            await response.aclose()
+
+        results = await asyncio.gather(*[_touch() for _ in range(connections)], return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        self._warmup = {
+            "connections": connections - len(errors),
+            "time_ms": round((time.time() - start) * 1000, 2),
+            "error": str(errors[0]) if errors else None,
+        }
+        if errors:
+            logger.warning(get_text('log_pool_warmup_failed', self.language, error=errors[0]))
+        else:
+            logger.info(get_text(
+                'log_pool_warmup_done', self.language,
+                count=connections,
+                time=f"{self._warmup['time_ms']:.2f}",
+            ))
+
+    def stats(self) -> dict:
+        """Snapshot of the shared connection pool."""
+        connections = []
+        transport = getattr(self._http_client, "_transport", None)
+        pool = getattr(transport, "_pool", None)
+        if pool is not None:
+            connections = list(getattr(pool, "connections", []) or [])
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {
+            "deployments": self.deployments,
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "open_connections": len(connections),
+            "idle_connections": idle,
+            "active_connections": len(connections) - idle,
+            "requests_sent": self._requests_sent,
+            "warmup": dict(self._warmup),
+        }
+
+    async def aclose(self) -> None:
+        await self._http_client.aclose()
@@ -0,0 +1,167 @@
+# Rolling-summary context window for group chats: recent turns verbatim, older turns condensed
+
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+
+from agent_framework import ChatContext, ChatMessage, ChatMiddleware
+
+from cache import TTLCache
+from token_budget import TokenBudget, compress_text, estimate_tokens
+from translations import get_text
+
+logger = logging.getLogger(__name__)
+
+# (speaker, text) of the turns to fold in, previous summary -> new summary
+Summarizer = Callable[[str, List[Tuple[str, str]], int], Awaitable[str]]
+
+
+def _role(message: ChatMessage) -> str:
+    role = message.role
+    return getattr(role, "value", role)
+
+
+@dataclass
+class CondenseReport:
+    turns_condensed: int
+    turns_kept: int
+    tokens_before: int
+    tokens_after: int
+    source: str  # "extractive", "model" or "cache"
+
+
+class RollingSummary(ChatMiddleware):
+    """
+    Chat middleware that bounds the history a group-chat participant sends.
+
+    Every participant's thread holds the whole meeting, so each turn's prompt would
+    otherwise grow with the round count. Leading system messages and the first user
+    message (the question) are always sent as-is, the latest `keep_turns` turns stay
+    verbatim, and everything older is replaced by one running summary of at most
+    `max_summary_tokens` tokens. The history is sent unchanged while the older turns
+    fit in that budget or whenever the summary would not make the prompt shorter.
+
+    The summary is folded one turn at a time (summary of turns 1..k plus turn k+1),
+    and each step is cached under a digest of the turns it covers, so a turn that
+    leaves the window is condensed once per meeting rather than once per call.
+    Summaries are extractive by default; with `summarize` set, that (cheap) model
+    call is used instead and extraction is the fallback when it fails or times out.
+    """
+
+    def __init__(
+        self,
+        *,
+        keep_turns: int = 4,
+        max_summary_tokens: int = 600,
+        label: str = "",
+        language: str = "ja",
+        summarize: Optional[Summarizer] = None,
+        summarize_timeout: float = 10.0,
+        cache_entries: int = 512,
+        cache_ttl: float = 3600.0,
+        on_condense: Optional[Callable[[CondenseReport], None]] = None,
+    ):
+        self.keep_turns = max(keep_turns, 0)
+        self.max_summary_tokens = max_summary_tokens
+        self.label = label
+        self.language = language
+        self.summarize = summarize
+        self.summarize_timeout = summarize_timeout
+        self.on_condense = on_condense
+        self._budget = TokenBudget(max_summary_tokens)
+        self._cache = TTLCache(max_entries=cache_entries, ttl=cache_ttl)
+
+    async def process(self, context: ChatContext, next) -> None:
+        messages = list(context.messages)
+        head, turns = self._split(messages)
+        if self.max_summary_tokens > 0 and len(turns) > self.keep_turns:
+            older = turns[:len(turns) - self.keep_turns]
+            recent = turns[len(turns) - self.keep_turns:]
+            # Older turns that already fit in the summary budget are cheaper sent as they are
+            if sum(estimate_tokens(m.text or "") for m in older) > self.max_summary_tokens:
+                query = head[-1].text if head else ""
+                summary, source = await self._summary(older, query or "")
+                condensed = head + [ChatMessage(role="user", text=f"{self.label}\n{summary}".strip())] + recent
+                tokens_before = sum(estimate_tokens(m.text or "") for m in messages)
+                tokens_after = sum(estimate_tokens(m.text or "") for m in condensed)
+                # The summary plus label can still come out longer than the turns it replaces
+                if tokens_after < tokens_before:
+                    context.messages = condensed
+                    if self.on_condense is not None:
+                        self.on_condense(CondenseReport(
+                            turns_condensed=len(older),
+                            turns_kept=len(recent),
+                            tokens_before=tokens_before,
+                            tokens_after=tokens_after,
+                            source=source,
+                        ))
+        await next(context)
+
+    @staticmethod
+    def _split(messages: Sequence[ChatMessage]) -> Tuple[List[ChatMessage], List[ChatMessage]]:
+        """Leading system messages plus the first user message, then the turns after it."""
+        position = 0
+        while position < len(messages) and _role(messages[position]) == "system":
+            position += 1
+        if position < len(messages) and _role(messages[position]) == "user":
+            position += 1
+        return list(messages[:position]), list(messages[position:])
+
+    async def _summary(self, turns: Sequence[ChatMessage], query: str) -> Tuple[str, str]:
+        digest = hashlib.sha256(query.encode("utf-8")).hexdigest()
+        summary, source = "", "cache"
+        # Find the longest already-summarized prefix, then fold in the rest
+        digests = []
+        for message in turns:
+            digest = hashlib.sha256(
+                f"{digest}\x00{message.author_name or _role(message)}\x00{message.text or ''}".encode("utf-8")
+            ).hexdigest()
+            digests.append(digest)
+        start = 0
+        for index in range(len(digests) - 1, -1, -1):
+            cached = self._cache.get(digests[index])
+            if cached is not None:
+                summary, start = cached, index + 1
+                break
+        if start == len(turns):
+            return summary, source
+
+        pending = [(message.author_name or _role(message), message.text or "") for message in turns[start:]]
+        summary, source = await self._fold(summary, pending, query)
+        self._cache.set(digests[-1], summary)
+        return summary, source
+
+    async def _fold(self, summary: str, turns: List[Tuple[str, str]], query: str) -> Tuple[str, str]:
+        if self.summarize is not None:
+            try:
+                folded = await asyncio.wait_for(
+                    self.summarize(summary, turns, self.max_summary_tokens), self.summarize_timeout
+                )
+                if folded and folded.strip():
+                    return compress_text(folded.strip(), self.max_summary_tokens, query)[0], "model"
+            except asyncio.TimeoutError:
+                logger.warning(get_text('log_context_summary_fallback', self.language, error="timeout"))
+            except Exception as exc:
+                logger.warning(get_text('log_context_summary_fallback', self.language, error=str(exc)))
+        for speaker, text in turns:
+            summary = self._extract(summary, speaker, text, query)
+        return summary, "extractive"
+
+    def _extract(self, summary: str, speaker: str, text: str, query: str) -> str:
+        """Add one turn's key lines, then share the token ceiling across all turns summarized so far."""
+        sections = {}
+        for position, line in enumerate(summary.splitlines()):
+            name, _, body = line.partition(": ")
+            sections[f"{position}\x00{name}"] = body
+        sections[f"{len(sections)}\x00{speaker}"] = compress_text(text, self.max_summary_tokens // 2, query)[0]
+        fitted, _ = self._budget.fit(sections, query)
+        # One line per turn keeps the speaker attached to everything extracted from it
+        lines = []
+        for key, body in fitted.items():
+            body = " ".join(part.strip() for part in body.splitlines() if part.strip())
+            if body:
+                name = key.split("\x00", 1)[1]
+                lines.append(f"{name}: {body}")
+        return "\n".join(lines)
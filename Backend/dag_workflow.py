@@ -0,0 +1,151 @@
+# Dependency-graph workflows: agents that do not depend on each other run concurrently
+
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from agent_framework import (
+    AgentExecutor,
+    AgentExecutorRequest,
+    AgentExecutorResponse,
+    ChatAgent,
+    ChatMessage,
+    Executor,
+    WorkflowBuilder,
+    WorkflowContext,
+    handler,
+)
+
+# (question, {upstream agent: its output}) -> the prompt an agent is given instead of the conversation
+InputRenderer = Callable[[str, Dict[str, str]], str]
+
+
+def _question(results: List[AgentExecutorResponse]) -> str:
+    for result in results:
+        for message in result.full_conversation or ():
+            role = getattr(message.role, "value", message.role)
+            if role == "user":
+                return message.text or ""
+    return ""
+
+
+class _JoinConversations(Executor):
+    """
+    Merge the conversations of several upstream agents into one request for the next.
+
+    Every upstream conversation starts with the same shared prefix (the question and
+    the turns they all depended on), so messages are de-duplicated by identity and
+    the result reads like one meeting: the prefix, then each upstream turn in order.
+    """
+
+    @handler
+    async def join(self, results: List[AgentExecutorResponse], ctx: WorkflowContext[AgentExecutorRequest]) -> None:
+        conversation, seen = [], set()
+        for result in results:
+            messages = result.full_conversation
+            if messages is None:
+                messages = result.agent_response.messages
+            for message in messages:
+                if id(message) not in seen:
+                    seen.add(id(message))
+                    conversation.append(message)
+        await ctx.send_message(AgentExecutorRequest(messages=conversation, should_respond=True))
+
+
+class _RenderInput(Executor):
+    """Give the next agent one prompt rendered from the question and the upstream outputs."""
+
+    def __init__(self, render: InputRenderer, id: str):
+        super().__init__(id)
+        self._render = render
+
+    @handler
+    async def from_prompt(self, prompt: str, ctx: WorkflowContext[AgentExecutorRequest]) -> None:
+        await self._send(self._render(prompt, {}), ctx)
+
+    @handler
+    async def from_response(self, result: AgentExecutorResponse, ctx: WorkflowContext[AgentExecutorRequest]) -> None:
+        await self.from_responses([result], ctx)
+
+    @handler
+    async def from_responses(
+        self, results: List[AgentExecutorResponse], ctx: WorkflowContext[AgentExecutorRequest]
+    ) -> None:
+        outputs = {result.executor_id: result.agent_response.text for result in results}
+        await self._send(self._render(_question(results), outputs), ctx)
+
+    async def _send(self, text: str, ctx: WorkflowContext[AgentExecutorRequest]) -> None:
+        message = ChatMessage(role="user", text=text)
+        await ctx.send_message(AgentExecutorRequest(messages=[message], should_respond=True))
+
+
+class _Dispatch(Executor):
+    """Start node that hands the prompt to every participant without dependencies."""
+
+    @handler
+    async def dispatch(self, prompt: str, ctx: WorkflowContext[str]) -> None:
+        await ctx.send_message(prompt)
+
+
+def topological_order(order: Sequence[str], dependencies: Optional[Dict[str, Iterable[str]]] = None) -> List[str]:
+    """`order` rearranged so everyone comes after their dependencies (ties keep declaration order)."""
+    dependencies = {name: tuple((dependencies or {}).get(name, ())) for name in order}
+    unknown = {dep for deps in dependencies.values() for dep in deps} - set(order)
+    if unknown:
+        raise ValueError(f"unknown dependencies: {sorted(unknown)}")
+    placed: List[str] = []
+    while len(placed) < len(order):
+        ready = [name for name in order if name not in placed and all(dep in placed for dep in dependencies[name])]
+        if not ready:
+            raise ValueError(f"dependency cycle among: {sorted(set(order) - set(placed))}")
+        placed.append(ready[0])
+    return placed
+
+
+def build_dag_workflow(
+    agents: Dict[str, ChatAgent],
+    order: Sequence[str],
+    dependencies: Optional[Dict[str, Iterable[str]]] = None,
+    inputs: Optional[Dict[str, InputRenderer]] = None,
+):
+    """
+    Build a workflow in which each participant speaks once, as soon as everyone it
+    depends on has spoken. A participant with one dependency continues that
+    dependency's conversation; one with several gets the merged conversations (the
+    workflow runner executes the agents of a superstep concurrently, so e.g. CTO and
+    CFO both answer the CEO at the same time and COO sees all three). A participant
+    with an entry in `inputs` gets a single rendered prompt instead of a conversation.
+    """
+    names = topological_order(order, dependencies)
+    dependencies = {name: tuple((dependencies or {}).get(name, ())) for name in names}
+    inputs = inputs or {}
+    # Executors keep per-run state, so each workflow gets its own; the agents are shared
+    executors = {name: AgentExecutor(agents[name], id=name) for name in names}
+
+    builder = WorkflowBuilder()
+    # The executor that receives each participant's input (the agent itself, or its renderer)
+    entries: Dict[str, Executor] = {}
+    for name in names:
+        if name in inputs:
+            entries[name] = _RenderInput(inputs[name], id=f"{name}Input")
+            builder.add_edge(entries[name], executors[name])
+        else:
+            entries[name] = executors[name]
+
+    roots = [name for name in names if not dependencies[name]]
+    if len(roots) == 1:
+        builder.set_start_executor(entries[roots[0]])
+    else:
+        dispatch = _Dispatch(id="Dispatch")
+        builder.set_start_executor(dispatch)
+        builder.add_fan_out_edges(dispatch, [entries[name] for name in roots])
+
+    for name in names:
+        deps = dependencies[name]
+        if len(deps) == 1:
+            builder.add_edge(executors[deps[0]], entries[name])
+        elif deps and name in inputs:
+            builder.add_fan_in_edges([executors[dep] for dep in deps], entries[name])
+        elif deps:
+            join = _JoinConversations(id=f"{name}Join")
+            builder.add_fan_in_edges([executors[dep] for dep in deps], join)
+            builder.add_edge(join, executors[name])
+    return builder.build()
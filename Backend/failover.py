@@ -0,0 +1,548 @@
+# Deployment failover: per-deployment circuit breakers, retries with backoff, fallback deployments
+
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from agent_framework import ChatContext, ChatMessage, ChatMiddleware, ChatResponseUpdate, Content
+
+from hedging import _first_token
+from translations import get_text
+
+logger = logging.getLogger(__name__)
+
+# Set while the router itself makes a call, so the called client's own middleware does not route again
+_routed_attempt: contextvars.ContextVar[bool] = contextvars.ContextVar("routed_attempt", default=False)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+class DeploymentUnavailableError(RuntimeError):
+    """Every candidate deployment is failing, or its circuit is open."""
+
+
+def _chain(exc: BaseException):
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        exc = exc.__cause__ or exc.__context__
+
+
+def failure_reason(exc: BaseException) -> Optional[str]:
+    """
+    Why a call failed, when the failure is the deployment's rather than the request's:
+    "rate_limited" (429), "server_error" (5xx), "timeout" or "connection". None for
+    everything else (bad request, content filter, auth), which is neither retried
+    nor counted against the deployment. The framework wraps the OpenAI SDK errors,
+    so the whole cause chain is inspected.
+    """
+    for error in _chain(exc):
+        status = getattr(error, "status_code", None)
+        if isinstance(status, int):
+            if status == 429:
+                return "rate_limited"
+            if status >= 500:
+                return "server_error"
+            if status == 408:
+                return "timeout"
+            return None
+        if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException)) or type(error).__name__ == "APITimeoutError":
+            return "timeout"
+        if isinstance(error, httpx.TransportError) or type(error).__name__ == "APIConnectionError":
+            return "connection"
+    return None
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the service asked to wait (retry-after-ms / retry-after headers), if any."""
+    for error in _chain(exc):
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        if not headers:
+            continue
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("retry-after"):
+                return float(headers["retry-after"])
+        except ValueError:
+            return None
+    return None
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker of one deployment.
+
+    Closed: calls pass, and their outcomes over the last `window` seconds are kept.
+    Once at least `min_calls` outcomes are known and the failure rate reaches
+    `failure_rate`, the circuit opens and calls are refused for `open_seconds`.
+    It then goes half-open and lets `half_open_probes` calls through: if they all
+    succeed it closes again, and a single failure re-opens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        window: float = 60.0,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        open_seconds: float = 30.0,
+        half_open_probes: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+        on_state_change: Optional[Callable[[str, str], None]] = None,
+    ):
+        self.name = name
+        self.window = window
+        self.min_calls = max(min_calls, 1)
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(half_open_probes, 1)
+        self.clock = clock
+        self.on_state_change = on_state_change
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._probes = 0
+        self._probe_successes = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self.clock() - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def _transition(self, state: str) -> None:
+        if state == self._state:
+            return
+        self._state = state
+        if state == OPEN:
+            self._opened_at = self.clock()
+        if state == HALF_OPEN:
+            self._probes = self._probe_successes = 0
+        if state == CLOSED:
+            self._outcomes.clear()
+        if self.on_state_change is not None:
+            self.on_state_change(self.name, state)
+
+    def allow(self) -> bool:
+        """Whether a call may go to this deployment now (a half-open probe slot is taken if so)."""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self._probes < self.half_open_probes:
+            self._probes += 1
+            return True
+        return False
+
+    def release(self) -> None:
+        """A call let through by allow() ended without an outcome (cancelled, or a request error)."""
+        if self._state == HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def record_success(self) -> None:
+        if self._state == HALF_OPEN:
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self._transition(CLOSED)
+            return
+        self._record(True)
+
+    def record_failure(self) -> None:
+        if self._state == HALF_OPEN:
+            self._transition(OPEN)
+            return
+        self._record(False)
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+            self._transition(OPEN)
+
+    def _record(self, ok: bool) -> None:
+        now = self.clock()
+        self._outcomes.append((now, ok))
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def stats(self) -> dict:
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        return {
+            "state": self.state,
+            "calls": len(self._outcomes),
+            "failures": failures,
+            "retry_in": round(max(0.0, self.open_seconds - (self.clock() - self._opened_at)), 2) if self._state == OPEN else None,
+        }
+
+
+class FailoverRouter:
+    """
+    Routes each chat call of a deployment to the first healthy candidate: the
+    deployment itself, then its configured fallbacks. A call that fails with a
+    retryable error (429, 5xx, timeout, connection) before its first token is
+    retried after an exponential backoff with full jitter (at least the
+    service's Retry-After, within max_backoff), each time on the candidate that
+    has failed least for this request, up to `max_attempts` calls in total.
+    Once a token has been streamed the call is never restarted, so a client never
+    sees a response twice; it can only be continued (see `stream`). Deployments
+    whose circuit is open are skipped.
+    """
+
+    def __init__(
+        self,
+        fallbacks: Dict[str, Sequence[str]],
+        get_client: Callable[[str], Any],
+        *,
+        max_attempts: int = 3,
+        backoff: float = 0.25,
+        max_backoff: float = 4.0,
+        breaker: Optional[Dict[str, Any]] = None,
+        recover_attempts: int = 0,
+        recovery_prompt: str = "",
+        overlap_chars: int = 80,
+        language: str = "ja",
+        on_state_change: Optional[Callable[[str, str], None]] = None,
+        on_retry: Optional[Callable[[str, str], None]] = None,
+        on_failover: Optional[Callable[[str, str], None]] = None,
+        on_recovered: Optional[Callable[[str, str], None]] = None,
+    ):
+        self.fallbacks = {name: [alt for alt in alts if alt and alt != name] for name, alts in fallbacks.items()}
+        self.get_client = get_client
+        self.max_attempts = max(max_attempts, 1)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker_options = dict(breaker or {})
+        self.recover_attempts = max(recover_attempts, 0)
+        self.recovery_prompt = recovery_prompt
+        self.overlap_chars = overlap_chars
+        self.language = language
+        self.on_state_change = on_state_change
+        self.on_retry = on_retry
+        self.on_failover = on_failover
+        self.on_recovered = on_recovered
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.retries: Dict[str, int] = {}
+        self.failovers: Dict[str, int] = {}
+        self.recovered: Dict[str, int] = {}
+
+    def middleware(self, deployment: str) -> "FailoverMiddleware":
+        return FailoverMiddleware(self, deployment)
+
+    def breaker(self, deployment: str) -> CircuitBreaker:
+        breaker = self._breakers.get(deployment)
+        if breaker is None:
+            breaker = self._breakers[deployment] = CircuitBreaker(
+                deployment, on_state_change=self._state_changed, **self.breaker_options
+            )
+        return breaker
+
+    def _state_changed(self, deployment: str, state: str) -> None:
+        logger.warning(get_text('log_breaker_state', self.language, deployment=deployment, state=state))
+        if self.on_state_change is not None:
+            self.on_state_change(deployment, state)
+
+    def _pick(self, deployment: str, failures: Dict[str, int]) -> Optional[str]:
+        candidates = [deployment, *self.fallbacks.get(deployment, ())]
+        # Least-failed first; ties keep the configured order (the deployment itself first)
+        for name in sorted(candidates, key=lambda name: failures.get(name, 0)):
+            if self.breaker(name).allow():
+                return name
+        return None
+
+    def _delay(self, attempt: int, error: BaseException) -> float:
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+        requested = retry_after(error)
+        if requested is not None:
+            delay = max(delay, min(requested, self.max_backoff))
+        return delay
+
+    async def _call(self, name: str, start: Callable[[], Awaitable], settle: bool = True):
+        """
+        Run one attempt; returns its result, or the retryable error it failed with.
+        With `settle` off, a success is left for the caller to record once it knows
+        the outcome (a stream is only a success when it ends cleanly).
+        """
+        breaker = self.breaker(name)
+        try:
+            result = await start()
+        except Exception as exc:
+            if failure_reason(exc) is None:
+                breaker.release()
+                raise
+            breaker.record_failure()
+            return None, exc
+        except BaseException:
+            breaker.release()
+            raise
+        if settle:
+            breaker.record_success()
+        return result, None
+
+    def _settle_failed(self, name: str, exc: BaseException) -> None:
+        """Outcome of a routed stream that did not end cleanly: transient errors count as failures."""
+        if isinstance(exc, Exception) and failure_reason(exc) is not None:
+            self.breaker(name).record_failure()
+        else:
+            # Cancelled, closed early or a request error: says nothing about the deployment
+            self.breaker(name).release()
+
+    async def _route(
+        self,
+        deployment: str,
+        attempt: Callable[[str, int], Awaitable],
+        failures: Optional[Dict[str, int]] = None,
+        settle: bool = True,
+    ) -> Tuple[str, Any]:
+        """Run `attempt(name, number)` until one succeeds; returns (deployment that served, result)."""
+        failures = {} if failures is None else failures
+        last_error: Optional[BaseException] = None
+        for number in range(self.max_attempts):
+            if number:
+                await asyncio.sleep(self._delay(number, last_error))
+            name = self._pick(deployment, failures)
+            if name is None:
+                raise DeploymentUnavailableError(
+                    get_text('error_deployment_unavailable', self.language, deployment=deployment)
+                ) from last_error
+            if number:
+                self.retries[deployment] = self.retries.get(deployment, 0) + 1
+                if self.on_retry is not None:
+                    self.on_retry(deployment, failure_reason(last_error))
+                logger.warning(get_text(
+                    'log_failover_retry', self.language,
+                    deployment=deployment, target=name, attempt=number + 1, error=str(last_error),
+                ))
+            if name != deployment:
+                self.failovers[deployment] = self.failovers.get(deployment, 0) + 1
+                if self.on_failover is not None:
+                    self.on_failover(deployment, name)
+            result, error = await self._call(name, lambda: attempt(name, number), settle)
+            if error is None:
+                if name != deployment:
+                    logger.info(get_text('log_failover_served', self.language, deployment=deployment, target=name))
+                return name, result
+            failures[name] = failures.get(name, 0) + 1
+            last_error = error
+        raise last_error
+
+    async def stream(
+        self,
+        deployment: str,
+        primary: AsyncIterator,
+        start: Callable[[str, List[ChatMessage]], AsyncIterator],
+        messages: Sequence[ChatMessage] = (),
+    ) -> AsyncIterator:
+        """
+        Stream `primary`, or a retry started by `start(name, messages)` when it fails
+        before its first token. With `recover_attempts`, a stream that breaks after
+        it has produced text is resumed: the partial answer and the recovery
+        instruction are sent as a new request (on the least-failed candidate), and
+        the continuation is spliced in under the original message id. Its first
+        update carries additional_properties["recovered"].
+        """
+        started = []
+        request = list(messages)
+        failures: Dict[str, int] = {}
+
+        async def attempt(name: str, number: int):
+            if not started and number == 0 and name == deployment:
+                stream, context = primary, None
+            else:
+                context = contextvars.copy_context()
+                context.run(_routed_attempt.set, True)
+                stream = context.run(start, name, request)
+            started.append(stream)
+            try:
+                return stream, await asyncio.create_task(_first_token(stream), context=context)
+            except BaseException:
+                await _aclose(stream)
+                raise
+
+        try:
+            name, (stream, (updates, exhausted)) = await self._route(deployment, attempt, failures, settle=False)
+        finally:
+            if primary not in started:
+                # Never read because its circuit was open: close it unstarted
+                await _aclose(primary)
+
+        text: List[str] = []
+        continuable = True
+        first: Optional[ChatResponseUpdate] = None
+        recovered = 0
+        # The serving deployment's outcome is recorded once, when its stream ends
+        while True:
+            try:
+                async with aclosing(_chain_updates(updates, None if exhausted else stream)) as chained:
+                    async for update in chained:
+                        if first is None:
+                            first = update
+                        elif recovered:
+                            # Same message as the interrupted answer, so the agent records one reply
+                            update.message_id = first.message_id
+                            update.response_id = first.response_id
+                        continuable = continuable and _continuable(update)
+                        text.append(update.text or "")
+                        yield update
+            except BaseException as exc:
+                self._settle_failed(name, exc)
+                partial = "".join(text)
+                if (
+                    not isinstance(exc, Exception) or failure_reason(exc) is None
+                    or recovered >= self.recover_attempts or not (continuable and partial.strip())
+                ):
+                    raise
+                error = exc
+            else:
+                self.breaker(name).record_success()
+                return
+
+            recovered += 1
+            failures[name] = failures.get(name, 0) + 1
+            logger.warning(get_text(
+                'log_stream_recovering', self.language, deployment=name, chars=len(partial), error=str(error),
+            ))
+            await asyncio.sleep(self._delay(recovered, error))
+            request = [
+                *messages,
+                ChatMessage(role="assistant", text=partial),
+                ChatMessage(role="user", text=self.recovery_prompt),
+            ]
+            failed = name
+            name, (stream, (updates, exhausted)) = await self._route(deployment, attempt, failures, settle=False)
+            try:
+                updates, exhausted = await _splice(partial, updates, exhausted, stream, self.overlap_chars)
+            except BaseException as exc:
+                self._settle_failed(name, exc)
+                raise
+            updates[0].additional_properties = {
+                **(updates[0].additional_properties or {}),
+                "recovered": {"deployment": failed, "target": name, "chars": len(partial), "attempt": recovered},
+            }
+            self.recovered[deployment] = self.recovered.get(deployment, 0) + 1
+            if self.on_recovered is not None:
+                self.on_recovered(failed, name)
+            logger.info(get_text('log_stream_recovered', self.language, deployment=failed, target=name))
+
+    async def call(self, deployment: str, primary: Callable[[], Awaitable], start: Callable[[str], Awaitable]) -> Any:
+        """Non-streaming call: `primary()` first, `start(name)` for every retry."""
+
+        async def attempt(name: str, number: int):
+            if number == 0 and name == deployment:
+                return await primary()
+            context = contextvars.copy_context()
+            context.run(_routed_attempt.set, True)
+            return await asyncio.create_task(start(name), context=context)
+
+        _, result = await self._route(deployment, attempt)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "fallbacks": self.fallbacks,
+            "breakers": {name: breaker.stats() for name, breaker in self._breakers.items()},
+            "retries": dict(self.retries),
+            "failovers": dict(self.failovers),
+            "recovered": dict(self.recovered),
+        }
+
+
+def recovery_marker(update) -> Optional[dict]:
+    """The "recovered" details on the first update of a resumed stream (None on every other update)."""
+    return (getattr(update, "additional_properties", None) or {}).get("recovered")
+
+
+def _continuable(update: ChatResponseUpdate) -> bool:
+    """Only a plain-text answer can be continued (not a half-streamed tool call)."""
+    return all(content.type in ("text", "usage") for content in update.contents or ())
+
+
+async def _chain_updates(updates: List[ChatResponseUpdate], rest: Optional[AsyncIterator]) -> AsyncIterator:
+    try:
+        for update in updates:
+            yield update
+        if rest is not None:
+            async for update in rest:
+                yield update
+    finally:
+        if rest is not None:
+            await _aclose(rest)
+
+
+def _overlap(partial: str, continuation: str) -> int:
+    """Length of the longest prefix of `continuation` that repeats the end of `partial`."""
+    for size in range(min(len(partial), len(continuation)), 0, -1):
+        if partial.endswith(continuation[:size]):
+            return size
+    return 0
+
+
+async def _splice(
+    partial: str, updates: List[ChatResponseUpdate], exhausted: bool, stream: AsyncIterator, window: int
+) -> Tuple[List[ChatResponseUpdate], bool]:
+    """
+    Read the first `window` characters of a continuation and drop what repeats the
+    end of the partial answer (models often restate the last words before going on).
+    """
+    while not exhausted and sum(len(update.text or "") for update in updates) < window:
+        try:
+            updates.append(await stream.__anext__())
+        except StopAsyncIteration:
+            exhausted = True
+    head = "".join(update.text or "" for update in updates)
+    trim = _overlap(partial, head)
+    if trim < 3:
+        trim = 0  # a short coincidental match is more likely the continuation itself
+    others = [update for update in updates if not update.text]
+    text = head[trim:]
+    spliced = ChatResponseUpdate(role="assistant", contents=[Content.from_text(text)] if text else [])
+    return [spliced, *others], exhausted
+
+
+async def _aclose(stream) -> None:
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except (asyncio.CancelledError, Exception):
+            pass
+
+
+class FailoverMiddleware(ChatMiddleware):
+    """Chat middleware installed on a deployment's pooled client, outside the hedging middleware."""
+
+    def __init__(self, router: FailoverRouter, deployment: str):
+        self.router = router
+        self.deployment = deployment
+
+    async def process(self, context: ChatContext, next) -> None:
+        if _routed_attempt.get():
+            await next(context)
+            return
+        messages = list(context.messages)
+        options = {key: value for key, value in (context.options or {}).items() if key != "model_id"}
+        kwargs = dict(context.kwargs)
+
+        if context.is_streaming:
+            await next(context)
+            if context.result is None:
+                return
+
+            def start(name: str, request: List[ChatMessage]) -> AsyncIterator:
+                return self.router.get_client(name).get_streaming_response(request, options=options, **kwargs)
+
+            context.result = self.router.stream(self.deployment, context.result, start, messages)
+            return
+
+        async def primary():
+            await next(context)
+            return context.result
+
+        async def start(name: str):
+            return await self.router.get_client(name).get_response(messages, options=options, **kwargs)
+
+        context.result = await self.router.call(self.deployment, primary, start)
@@ -0,0 +1,203 @@
+# Hedged streaming requests: re-send a slow-starting chat request to an alternate deployment
+
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from agent_framework import ChatContext, ChatMiddleware
+
+from translations import get_text
+
+logger = logging.getLogger(__name__)
+
+# Set while an alternate request is being made, so its own middleware does not hedge again
+_hedge_attempt: contextvars.ContextVar[bool] = contextvars.ContextVar("hedge_attempt", default=False)
+
+
+def _has_token(update) -> bool:
+    """The first update that carries content (Azure often opens with an empty role/filter chunk)."""
+    return bool(getattr(update, "contents", None))
+
+
+async def _first_token(stream: AsyncIterator) -> Tuple[List[Any], bool]:
+    """Read up to and including the first update with content; returns (updates, exhausted)."""
+    updates = []
+    async for update in stream:
+        updates.append(update)
+        if _has_token(update):
+            return updates, False
+    return updates, True
+
+
+class TtftWindow:
+    """Recent time-to-first-token samples of one deployment."""
+
+    def __init__(self, size: int):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Hedger:
+    """
+    Races a slow-starting streaming request against an alternate deployment.
+
+    When no token has arrived after the hedge delay, the same messages and options
+    are sent to the deployment's first alternate; whichever stream produces a token
+    first is streamed and the other is cancelled. The delay is `delay` seconds when
+    set, otherwise the deployment's running `quantile` TTFT (clamped to
+    [min_delay, max_delay], and max_delay until `min_samples` have been seen).
+    """
+
+    def __init__(
+        self,
+        alternates: Dict[str, Sequence[str]],
+        get_client: Callable[[str], Any],
+        *,
+        delay: Optional[float] = None,
+        quantile: float = 0.9,
+        min_delay: float = 0.5,
+        max_delay: float = 5.0,
+        min_samples: int = 20,
+        window: int = 200,
+        language: str = "ja",
+        on_fired: Optional[Callable[[str, str], None]] = None,
+        on_won: Optional[Callable[[str, str], None]] = None,
+    ):
+        self.alternates = {name: [alt for alt in alts if alt and alt != name] for name, alts in alternates.items()}
+        self.get_client = get_client
+        self.delay = delay
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.language = language
+        self.on_fired = on_fired
+        self.on_won = on_won
+        self._ttft: Dict[str, TtftWindow] = {}
+        self.fired: Dict[str, int] = {}
+        self.won: Dict[str, int] = {}
+
+    def middleware(self, deployment: str) -> "HedgingMiddleware":
+        return HedgingMiddleware(self, deployment)
+
+    def _window(self, deployment: str) -> TtftWindow:
+        window = self._ttft.get(deployment)
+        if window is None:
+            window = self._ttft[deployment] = TtftWindow(self.window)
+        return window
+
+    def delay_for(self, deployment: str) -> float:
+        if self.delay is not None:
+            return self.delay
+        window = self._window(deployment)
+        if len(window.samples) < self.min_samples:
+            return self.max_delay
+        return min(self.max_delay, max(self.min_delay, window.quantile(self.quantile)))
+
+    async def race(self, deployment: str, primary: AsyncIterator, start_alternate: Callable[[str], AsyncIterator]) -> AsyncIterator:
+        """Stream `primary`, or the alternate started by `start_alternate(alt)` if that produces a token first."""
+        alternates = self.alternates.get(deployment) or []
+        start = time.monotonic()
+        contenders = {asyncio.create_task(_first_token(primary)): (deployment, primary)}
+        done, _ = await asyncio.wait(contenders, timeout=self.delay_for(deployment) if alternates else None)
+
+        if not done:
+            alternate = alternates[0]
+            self.fired[deployment] = self.fired.get(deployment, 0) + 1
+            if self.on_fired is not None:
+                self.on_fired(deployment, alternate)
+            logger.info(get_text('log_hedge_fired', self.language, deployment=deployment, alternate=alternate, waited=f"{time.monotonic() - start:.2f}"))
+            context = contextvars.copy_context()
+            context.run(_hedge_attempt.set, True)
+            stream = context.run(start_alternate, alternate)
+            contenders[asyncio.create_task(_first_token(stream), context=context)] = (alternate, stream)
+
+        winner = None
+        pending = set(contenders)
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # A contender that failed only loses the race while another is still running
+                    if task.exception() is None or not pending:
+                        winner = task
+                        break
+        finally:
+            for task in contenders:
+                if task is not winner and not task.done():
+                    task.cancel()
+            for task, (_, stream) in contenders.items():
+                if task is not winner:
+                    await _discard(task, stream)
+
+        name, stream = contenders[winner]
+        updates, exhausted = winner.result()  # re-raises when every contender failed
+        self._window(name).add(time.monotonic() - start)
+        if name != deployment:
+            self.won[deployment] = self.won.get(deployment, 0) + 1
+            if self.on_won is not None:
+                self.on_won(deployment, name)
+            logger.info(get_text('log_hedge_won', self.language, deployment=deployment, alternate=name))
+        for update in updates:
+            yield update
+        if not exhausted:
+            async for update in stream:
+                yield update
+
+    def stats(self) -> dict:
+        return {
+            "alternates": self.alternates,
+            "fired": dict(self.fired),
+            "won": dict(self.won),
+            "delay": {name: round(self.delay_for(name), 3) for name in self.alternates},
+        }
+
+
+async def _discard(task: asyncio.Task, stream) -> None:
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except (asyncio.CancelledError, Exception):
+            pass
+
+
+class HedgingMiddleware(ChatMiddleware):
+    """Chat middleware installed on a deployment's pooled client; only streaming calls are hedged."""
+
+    def __init__(self, hedger: Hedger, deployment: str):
+        self.hedger = hedger
+        self.deployment = deployment
+
+    async def process(self, context: ChatContext, next) -> None:
+        await next(context)
+        if not context.is_streaming or _hedge_attempt.get() or context.result is None:
+            return
+        if not self.hedger.alternates.get(self.deployment):
+            return
+        # Inner middleware has run by now, so these are the messages actually sent
+        messages = list(context.messages)
+        options = {key: value for key, value in (context.options or {}).items() if key != "model_id"}
+        kwargs = dict(context.kwargs)
+
+        def start_alternate(alternate: str) -> AsyncIterator:
+            client = self.hedger.get_client(alternate)
+            return client.get_streaming_response(messages, options=options, **kwargs)
+
+        context.result = self.hedger.race(self.deployment, context.result, start_alternate)
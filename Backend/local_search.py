@@ -0,0 +1,445 @@
+# In-process BM25 search over a local documents directory, as an alternative backend for search_tool
+
+import asyncio
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from cache import normalize_text
+from cancellation import detached_task
+from translations import get_text
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+DEFAULT_EXTENSIONS = (".txt", ".md", ".markdown")
+
+# Hiragana, katakana (incl. the prolonged sound mark), CJK ideographs and their extensions
+_CJK_CHARS = "぀-ヿ㐀-䶿一-鿿豈-﫿"
+_TOKENS = re.compile(rf"(?P<cjk>[{_CJK_CHARS}]+)|(?P<word>[^\W_{_CJK_CHARS}]+)", re.UNICODE)
+_PARAGRAPHS = re.compile(r"\n\s*\n")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Words for space-separated scripts, overlapping character bigrams for runs of
+    Japanese/Chinese characters (a lone character is kept as a unigram), so text
+    without word boundaries is searchable without a morphological analyzer.
+    """
+    tokens: List[str] = []
+    for match in _TOKENS.finditer(normalize_text(text)):
+        run = match.group("cjk")
+        if run is None:
+            tokens.append(match.group("word"))
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def split_passages(text: str, max_chars: int) -> List[str]:
+    """Paragraph-aligned passages of at most `max_chars` (longer paragraphs are cut)."""
+    passages: List[str] = []
+    current = ""
+    for paragraph in _PARAGRAPHS.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        while len(paragraph) > max_chars:
+            if current:
+                passages.append(current)
+                current = ""
+            passages.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        passages.append(current)
+    return passages
+
+
+class _Index:
+    """
+    One generation of the on-disk index, memory-mapped read-only:
+      <path>.json               files, passages (text offset, length) and the term dictionary
+      <path>.<name>.postings    per term: doc ids (uint32) then term frequencies (uint16), 4-byte aligned
+      <path>.<name>.text        passage texts (UTF-8)
+    The JSON file is replaced last, so a reader always sees a complete generation; each
+    generation has a unique name, so processes sharing the index never overwrite one in use.
+    """
+
+    def __init__(self, path: str, meta: dict):
+        self.path = path
+        self.meta = meta
+        self.generation = meta["generation"]
+        self.name = meta["name"]
+        self.files: Dict[str, list] = meta["files"]
+        self.docs: List[list] = meta["docs"]
+        self.terms: Dict[str, list] = meta["terms"]
+        self.doc_lengths = np.array([doc[3] for doc in self.docs], dtype=np.float32)
+        self.avg_length = float(self.doc_lengths.mean()) if len(self.docs) else 0.0
+        self.length_norm: Optional[np.ndarray] = None
+        self._postings = self._map(f"{path}.{self.name}.postings")
+        self._text = self._map(f"{path}.{self.name}.text")
+
+    @staticmethod
+    def _map(path: str) -> Optional[mmap.mmap]:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def empty(cls, path: str) -> "_Index":
+        index = cls.__new__(cls)
+        index.path = path
+        index.meta = {"generation": 0, "name": "", "files": {}, "docs": [], "terms": {}}
+        index.generation, index.name = 0, ""
+        index.files, index.docs, index.terms = {}, [], {}
+        index.doc_lengths = np.zeros(0, dtype=np.float32)
+        index.avg_length = 0.0
+        index.length_norm = None
+        index._postings = index._text = None
+        return index
+
+    @classmethod
+    def load(cls, path: str, settings: dict) -> Optional["_Index"]:
+        """The stored index, or None when missing, unreadable or built with other settings."""
+        try:
+            with open(f"{path}.json", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != INDEX_VERSION or meta.get("settings") != settings:
+                return None
+            return cls(path, meta)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        entry = self.terms.get(term)
+        if entry is None or self._postings is None:
+            return None
+        offset, count = entry
+        ids = np.frombuffer(self._postings, dtype=np.uint32, count=count, offset=offset)
+        tfs = np.frombuffer(self._postings, dtype=np.uint16, count=count, offset=offset + 4 * count)
+        return ids, tfs
+
+    def text(self, doc_id: int) -> str:
+        _, offset, size, _ = self.docs[doc_id]
+        return self._text[offset:offset + size].decode("utf-8") if self._text is not None else ""
+
+    def close(self) -> None:
+        for mapped in (self._postings, self._text):
+            if mapped is not None:
+                mapped.close()
+        self._postings = self._text = None
+
+
+class LocalSearchBackend:
+    """
+    BM25 search over the text/Markdown files under `documents_dir`, with the same
+    `search(query)` contract as AzureSearchBackend (hits with content and
+    metadata_storage_name), so search_tool formats both the same way.
+
+    Files are split into paragraph-aligned passages and indexed with a CJK-aware
+    tokenizer. Postings live in a memory-mapped file that is loaded on the first
+    search (or by `warmup()`) and reused across restarts. Every `refresh_interval`
+    seconds a search also checks the directory for changes; only changed files are
+    re-read, their old passages are dropped from the postings, and the new
+    generation is swapped in without blocking searches.
+    """
+
+    def __init__(
+        self,
+        *,
+        documents_dir: str,
+        index_path: Optional[str] = None,
+        top: int = 3,
+        k1: float = 1.2,
+        b: float = 0.75,
+        chunk_chars: int = 800,
+        refresh_interval: float = 10.0,
+        extensions=DEFAULT_EXTENSIONS,
+        timeout: float = 10.0,
+        language: str = "ja",
+    ):
+        self.documents_dir = documents_dir
+        self.index_path = index_path or os.path.join(documents_dir or ".", ".bm25", "index")
+        self.top = top
+        self.k1 = k1
+        self.b = b
+        self.chunk_chars = chunk_chars
+        self.refresh_interval = refresh_interval
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.timeout = timeout
+        self.language = language
+        self._index: Optional[_Index] = None
+        self._loading: Optional[asyncio.Task] = None
+        self._refreshing: Optional[asyncio.Task] = None
+        self._checked_at = 0.0
+        self.searches = 0
+        self.search_seconds = 0.0
+        self.updates = 0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.documents_dir) and os.path.isdir(self.documents_dir)
+
+    @property
+    def _settings(self) -> dict:
+        return {"chunk_chars": self.chunk_chars, "extensions": list(self.extensions), "tokenizer": 1}
+
+    # --- indexing (runs in a worker thread) ---
+
+    def _scan(self) -> Dict[str, list]:
+        found: Dict[str, list] = {}
+        for root, dirs, files in os.walk(self.documents_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if name.startswith(".") or not name.lower().endswith(self.extensions):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found[os.path.relpath(path, self.documents_dir)] = [stat.st_mtime_ns, stat.st_size]
+        return found
+
+    def _update(self, old: _Index) -> Optional[_Index]:
+        """Write the next generation for whatever changed on disk; None when nothing did."""
+        found = self._scan()
+        changed = sorted(rel for rel, stat in found.items() if old.files.get(rel, [None, None])[:2] != stat)
+        removed = [rel for rel in old.files if rel not in found]
+        if not changed and not removed and old.generation:
+            return None
+        start = time.perf_counter()
+
+        # Old passages of unchanged files keep their order; ids are compacted
+        keep = np.zeros(len(old.docs), dtype=bool)
+        for rel, (_, _, first, count) in old.files.items():
+            if rel in found and rel not in changed:
+                keep[first:first + count] = True
+        remap = np.where(keep, np.cumsum(keep) - 1, -1).astype(np.int64)
+        kept = int(keep.sum())
+
+        generation = old.generation + 1
+        name = f"{generation}-{uuid.uuid4().hex[:8]}"
+        base = f"{self.index_path}.{name}"
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        docs: List[list] = []
+        files: Dict[str, list] = {}
+        with open(f"{base}.text", "wb") as text_out:
+            offset = 0
+            for rel, (mtime, size, first, count) in old.files.items():
+                if rel in found and rel not in changed:
+                    files[rel] = [mtime, size, int(remap[first]) if count else 0, count]
+            for doc_id in np.flatnonzero(keep):
+                rel, old_offset, length, tokens = old.docs[doc_id]
+                text_out.write(old._text[old_offset:old_offset + length])
+                docs.append([rel, offset, length, tokens])
+                offset += length
+
+            # Re-read only new and changed files
+            new_terms: Dict[str, Tuple[List[int], List[int]]] = {}
+            for rel in changed:
+                try:
+                    with open(os.path.join(self.documents_dir, rel), encoding="utf-8", errors="replace") as f:
+                        content = f.read()
+                except OSError as exc:
+                    logger.warning(get_text('log_local_search_read_failed', self.language, path=rel, error=str(exc)))
+                    continue
+                passages = split_passages(content, self.chunk_chars)
+                files[rel] = found[rel] + [len(docs), len(passages)]
+                for passage in passages:
+                    doc_id = len(docs)
+                    tokens = tokenize(passage)
+                    for term, tf in Counter(tokens).items():
+                        ids, tfs = new_terms.setdefault(term, ([], []))
+                        ids.append(doc_id)
+                        tfs.append(min(tf, 65535))
+                    data = passage.encode("utf-8")
+                    text_out.write(data)
+                    docs.append([rel, offset, len(data), len(tokens)])
+                    offset += len(data)
+
+        # Postings: old lists with dropped passages filtered out, then the new passages
+        terms: Dict[str, list] = {}
+        with open(f"{base}.postings", "wb") as postings_out:
+            offset = 0
+            for term in sorted(set(old.terms) | set(new_terms)):
+                ids_parts, tfs_parts = [], []
+                previous = old.postings(term) if kept else None
+                if previous is not None:
+                    old_ids, old_tfs = previous
+                    mapped = remap[old_ids]
+                    mask = mapped >= 0
+                    ids_parts.append(mapped[mask].astype(np.uint32))
+                    tfs_parts.append(old_tfs[mask])
+                if term in new_terms:
+                    ids_parts.append(np.array(new_terms[term][0], dtype=np.uint32))
+                    tfs_parts.append(np.array(new_terms[term][1], dtype=np.uint16))
+                ids = np.concatenate(ids_parts) if ids_parts else np.zeros(0, dtype=np.uint32)
+                if not len(ids):
+                    continue
+                tfs = np.concatenate(tfs_parts).astype(np.uint16)
+                block = ids.tobytes() + tfs.tobytes()
+                block += b"\0" * (-len(block) % 4)
+                postings_out.write(block)
+                terms[term] = [offset, int(len(ids))]
+                offset += len(block)
+
+        meta = {
+            "version": INDEX_VERSION,
+            "settings": self._settings,
+            "generation": generation,
+            "name": name,
+            "files": files,
+            "docs": docs,
+            "terms": terms,
+        }
+        with open(f"{self.index_path}.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(f"{self.index_path}.json.tmp", f"{self.index_path}.json")
+        self.updates += 1
+        logger.info(get_text(
+            'log_local_search_indexed', self.language,
+            changed=len(changed), removed=len(removed), docs=len(docs), terms=len(terms),
+            time=f"{(time.perf_counter() - start) * 1000:.0f}",
+        ))
+        return _Index(self.index_path, meta)
+
+    def _remove_generation(self, name: str) -> None:
+        for suffix in ("postings", "text"):
+            try:
+                os.remove(f"{self.index_path}.{name}.{suffix}")
+            except OSError:
+                pass
+
+    def _open(self) -> _Index:
+        index = _Index.load(self.index_path, self._settings) or _Index.empty(self.index_path)
+        updated = self._update(index)
+        if updated is None:
+            return index
+        index.close()
+        if index.name:
+            self._remove_generation(index.name)
+        return updated
+
+    # --- async API ---
+
+    async def _ensure_index(self) -> _Index:
+        if self._index is not None:
+            return self._index
+        if self._loading is None:
+            self._loading = detached_task(asyncio.to_thread(self._open))
+        # The build keeps going when this caller times out; later calls wait for the same task
+        index = await asyncio.wait_for(asyncio.shield(self._loading), timeout=self.timeout)
+        if self._index is None:
+            self._index = index
+            self._checked_at = time.monotonic()
+        return self._index
+
+    async def _refresh(self) -> None:
+        old = self._index
+        try:
+            updated = await asyncio.to_thread(self._update, old)
+        except Exception as exc:
+            logger.warning(get_text('log_local_search_update_failed', self.language, error=str(exc)))
+            return
+        finally:
+            self._checked_at = time.monotonic()
+        if updated is not None:
+            # Searches run on the event loop, so none is reading the old maps at this point
+            self._index = updated
+            old.close()
+            self._remove_generation(old.name)
+
+    def _maybe_refresh(self) -> None:
+        if self.refresh_interval <= 0 or (self._refreshing is not None and not self._refreshing.done()):
+            return
+        if time.monotonic() - self._checked_at >= self.refresh_interval:
+            self._refreshing = detached_task(self._refresh())
+
+    def warmup(self) -> None:
+        """Start loading (or building) the index in the background."""
+        if self.configured and self._loading is None:
+            self._loading = detached_task(asyncio.to_thread(self._open))
+
+    def _rank(self, index: _Index, query: str) -> List[dict]:
+        count = len(index.docs)
+        if not count:
+            return []
+        scores = np.zeros(count, dtype=np.float32)
+        norm = index.length_norm
+        if norm is None:
+            # Per-passage part of the BM25 denominator; fixed for the lifetime of a generation
+            norm = index.length_norm = self.k1 * (1 - self.b + self.b * index.doc_lengths / max(index.avg_length, 1e-9))
+        for term in set(tokenize(query)):
+            postings = index.postings(term)
+            if postings is None:
+                continue
+            ids, tfs = postings
+            idf = math.log(1 + (count - len(ids) + 0.5) / (len(ids) + 0.5))
+            tf = tfs.astype(np.float32)
+            scores[ids] += idf * tf * (self.k1 + 1) / (tf + norm[ids])
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        top = matched[np.argsort(-scores[matched], kind="stable")[:self.top]]
+        return [
+            {
+                "content": index.text(int(doc_id)),
+                "metadata_storage_name": os.path.basename(index.docs[doc_id][0]),
+                "@search.score": float(scores[doc_id]),
+            }
+            for doc_id in top
+        ]
+
+    async def search(self, query: str) -> List[dict]:
+        """The `top` best passages for the query (content, metadata_storage_name)."""
+        index = await self._ensure_index()
+        self._maybe_refresh()
+        start = time.perf_counter()
+        results = self._rank(index, query)
+        self.searches += 1
+        self.search_seconds += time.perf_counter() - start
+        return results
+
+    async def aclose(self) -> None:
+        for task in (self._loading, self._refreshing):
+            if task is not None:
+                try:
+                    await task
+                except Exception:
+                    pass
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        self._loading = None
+
+    def stats(self) -> dict:
+        index = self._index
+        return {
+            "backend": "local",
+            "documents_dir": self.documents_dir,
+            "loaded": index is not None,
+            "generation": index.generation if index else None,
+            "files": len(index.files) if index else 0,
+            "passages": len(index.docs) if index else 0,
+            "terms": len(index.terms) if index else 0,
+            "updates": self.updates,
+            "searches": self.searches,
+            "avg_search_ms": round(self.search_seconds / self.searches * 1000, 3) if self.searches else None,
+        }
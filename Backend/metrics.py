@@ -0,0 +1,212 @@
+# Prometheus metrics for the streaming endpoints (TTFT, inter-chunk gaps, throughput)
+
+import asyncio
+import time
+from typing import AsyncIterator, Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+
+REGISTRY = CollectorRegistry(auto_describe=True)
+
+_STREAM_LABELS = ["endpoint", "model", "deployment"]
+_AGENT_LABELS = _STREAM_LABELS + ["agent"]
+
+STREAM_TTFT = Histogram(
+    "agent_stream_ttft_seconds",
+    "Time from request start to the first streamed chunk of each agent",
+    _AGENT_LABELS,
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8, 13, 20, 30, 60),
+    registry=REGISTRY,
+)
+STREAM_CHUNK_GAP = Histogram(
+    "agent_stream_chunk_gap_seconds",
+    "Gap between consecutive chunks of the same agent",
+    _AGENT_LABELS,
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10),
+    registry=REGISTRY,
+)
+STREAM_CHUNKS = Counter(
+    "agent_stream_chunks_total",
+    "Streamed chunks",
+    _AGENT_LABELS,
+    registry=REGISTRY,
+)
+STREAM_DURATION = Histogram(
+    "agent_stream_duration_seconds",
+    "Total duration of completed streams",
+    _STREAM_LABELS,
+    buckets=(0.5, 1, 2, 3, 5, 8, 13, 20, 30, 45, 60, 90, 120, 180, 300),
+    registry=REGISTRY,
+)
+STREAM_THROUGHPUT = Histogram(
+    "agent_stream_chunks_per_second",
+    "Chunks per second over the lifetime of completed streams",
+    _STREAM_LABELS,
+    buckets=(1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 200, 350, 500),
+    registry=REGISTRY,
+)
+STREAM_IN_FLIGHT = Gauge(
+    "agent_streams_in_flight",
+    "Streams currently being produced",
+    _STREAM_LABELS,
+    registry=REGISTRY,
+)
+STREAM_ERRORS = Counter(
+    "agent_stream_errors_total",
+    "Streams that ended with an error, by kind",
+    _STREAM_LABELS + ["kind"],
+    registry=REGISTRY,
+)
+STREAM_CANCELLED = Counter(
+    "agent_stream_cancelled_total",
+    "Streams whose generation was cancelled because the client went away",
+    _STREAM_LABELS,
+    registry=REGISTRY,
+)
+STREAM_CANCELLED_WORK = Histogram(
+    "agent_stream_cancelled_work_seconds",
+    "How long a stream had been generating when it was cancelled",
+    _STREAM_LABELS,
+    buckets=(0.5, 1, 2, 3, 5, 8, 13, 20, 30, 45, 60, 90, 120, 180, 300),
+    registry=REGISTRY,
+)
+STREAM_CANCELLED_TASKS = Counter(
+    "agent_stream_cancelled_tasks_total",
+    "Agent and workflow tasks still running when their stream was abandoned, and cancelled",
+    _STREAM_LABELS,
+    registry=REGISTRY,
+)
+
+ADMISSION_WAIT = Histogram(
+    "admission_queue_wait_seconds",
+    "Time requests spent in a deployment's admission queue",
+    ["deployment"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60),
+    registry=REGISTRY,
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total",
+    "Requests rejected with 429 because the deployment's queue was full",
+    ["deployment"],
+    registry=REGISTRY,
+)
+HEDGE_FIRED = Counter(
+    "agent_hedge_fired_total",
+    "Streaming requests re-sent to an alternate deployment because no token arrived within the hedge delay",
+    ["deployment", "alternate"],
+    registry=REGISTRY,
+)
+HEDGE_WON = Counter(
+    "agent_hedge_won_total",
+    "Hedged requests where the alternate deployment produced the first token",
+    ["deployment", "alternate"],
+    registry=REGISTRY,
+)
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+BREAKER_STATE = Gauge(
+    "agent_circuit_breaker_state",
+    "Circuit breaker state of each deployment (0 = closed, 1 = half-open, 2 = open)",
+    ["deployment"],
+    registry=REGISTRY,
+)
+FAILOVER_RETRIES = Counter(
+    "agent_failover_retries_total",
+    "Chat calls retried after a retryable failure before their first token",
+    ["deployment", "reason"],
+    registry=REGISTRY,
+)
+FAILOVER_ROUTED = Counter(
+    "agent_failover_routed_total",
+    "Chat calls of a deployment sent to one of its fallback deployments",
+    ["deployment", "fallback"],
+    registry=REGISTRY,
+)
+STREAM_RECOVERED = Counter(
+    "agent_stream_recovered_total",
+    "Streams that broke after producing text and were continued from the partial answer",
+    ["deployment", "target"],
+    registry=REGISTRY,
+)
+BATCH_ITEMS = Counter(
+    "agent_batch_items_total",
+    "Batch job items finished, by mode and status (ok or error)",
+    ["mode", "status"],
+    registry=REGISTRY,
+)
+
+CONTEXT_PROMPT_TOKENS = Histogram(
+    "agent_context_prompt_tokens",
+    "Estimated prompt tokens of a condensed group-chat turn, before (full) and after (sent) condensing",
+    ["stage"],
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 12000, 16000, 32000),
+    registry=REGISTRY,
+)
+
+
+class StreamMetrics:
+    """
+    Per-request recorder for one streaming endpoint.
+
+    Create it when the request arrives (TTFT is measured from that point), call
+    `chunk(agent)` for every content chunk, and wrap the response generator with
+    `observe()` so the in-flight gauge, duration, throughput and errors are recorded.
+    """
+
+    def __init__(self, endpoint: str, model: Optional[str], deployment: Optional[str]):
+        self._labels = (endpoint, model or "", deployment or "")
+        self._start = time.perf_counter()
+        self._last_chunk: Dict[str, float] = {}
+        self.chunks = 0
+        self.failed = False
+
+    def chunk(self, agent: str = "") -> None:
+        now = time.perf_counter()
+        labels = self._labels + (agent,)
+        last = self._last_chunk.get(agent)
+        if last is None:
+            STREAM_TTFT.labels(*labels).observe(now - self._start)
+        else:
+            STREAM_CHUNK_GAP.labels(*labels).observe(now - last)
+        self._last_chunk[agent] = now
+        STREAM_CHUNKS.labels(*labels).inc()
+        self.chunks += 1
+
+    def error(self, kind: str) -> None:
+        self.failed = True
+        STREAM_ERRORS.labels(*self._labels, kind).inc()
+
+    def tasks_cancelled(self, count: int) -> None:
+        STREAM_CANCELLED_TASKS.labels(*self._labels).inc(count)
+
+    async def observe(self, stream: AsyncIterator, agent: Optional[str] = None) -> AsyncIterator:
+        """Pass a response stream through; with `agent`, every item also counts as a chunk of that agent."""
+        in_flight = STREAM_IN_FLIGHT.labels(*self._labels)
+        in_flight.inc()
+        try:
+            async for item in stream:
+                if agent is not None:
+                    self.chunk(agent)
+                yield item
+        except (GeneratorExit, asyncio.CancelledError):
+            # Client went away before the stream finished; the generation behind it is cancelled
+            self.error("disconnected")
+            STREAM_CANCELLED.labels(*self._labels).inc()
+            STREAM_CANCELLED_WORK.labels(*self._labels).observe(time.perf_counter() - self._start)
+            raise
+        except Exception as exc:
+            self.error(type(exc).__name__)
+            raise
+        else:
+            if self.failed:
+                return
+            duration = time.perf_counter() - self._start
+            STREAM_DURATION.labels(*self._labels).observe(duration)
+            if duration > 0:
+                STREAM_THROUGHPUT.labels(*self._labels).observe(self.chunks / duration)
+        finally:
+            in_flight.dec()
+
+
+def render() -> tuple:
+    """Current metrics in the Prometheus text exposition format, with its content type."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
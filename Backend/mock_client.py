@@ -0,0 +1,156 @@
+# Local stand-in for AzureOpenAIChatClient: synthetic streams with configurable latency and failures
+
+import asyncio
+import random
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Optional
+
+import httpx
+import openai
+from agent_framework import (
+    BaseChatClient,
+    ChatMessage,
+    ChatResponse,
+    ChatResponseUpdate,
+    Content,
+    use_chat_middleware,
+    use_function_invocation,
+)
+from agent_framework.exceptions import ServiceResponseException
+
+_WORDS = (
+    "the market risk plan team cost growth data model customer value launch budget quarter "
+    "strategy product support margin scale review pilot region partner timeline revenue "
+    "analysis option impact security hiring roadmap feedback metric target demand supply"
+).split()
+_WORDS_JA = (
+    "市場 リスク 計画 チーム コスト 成長 データ 顧客 価値 予算 戦略 製品 支援 利益 規模 "
+    "検証 地域 提携 売上 分析 選択肢 影響 セキュリティ 採用 指標 目標 需要 供給 は が を に で と の"
+).split()
+
+
+@dataclass(frozen=True)
+class MockProfile:
+    """Latency and failure model of one mock deployment."""
+
+    # Median time to first token, and the lognormal spread around it
+    ttft_ms: float = 400.0
+    ttft_sigma: float = 0.5
+    tokens_per_second: float = 60.0
+    # Relative jitter of each inter-token gap (0.3 = +/-30%)
+    jitter: float = 0.3
+    response_tokens: int = 200
+    # Probability of a 429 / a 500 before the first token, and of the stream breaking halfway
+    rate_limit_rate: float = 0.0
+    error_rate: float = 0.0
+    break_rate: float = 0.0
+    retry_after: float = 1.0
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any], base: Optional["MockProfile"] = None) -> "MockProfile":
+        base = base or cls()
+        known = {key: type(getattr(base, key))(value) for key, value in values.items() if hasattr(base, key)}
+        return replace(base, **known)
+
+
+def _status_error(status: int, retry_after: float) -> Exception:
+    """The exception the real client raises: the OpenAI SDK error wrapped by the framework."""
+    request = httpx.Request("POST", "https://mock.openai.azure.com/openai/deployments/mock/chat/completions")
+    response = httpx.Response(status, headers={"retry-after": f"{retry_after:g}"}, request=request)
+    if status == 429:
+        inner = openai.RateLimitError("mock: rate limit exceeded", response=response, body=None)
+    else:
+        inner = openai.InternalServerError("mock: internal server error", response=response, body=None)
+    try:
+        raise inner
+    except openai.APIStatusError as ex:
+        try:
+            raise ServiceResponseException(f"mock service failed to complete the prompt: {ex}", inner_exception=ex) from ex
+        except ServiceResponseException as wrapped:
+            return wrapped
+
+
+def _broken_stream() -> Exception:
+    try:
+        raise httpx.RemoteProtocolError("mock: peer closed connection without sending complete message body")
+    except httpx.RemoteProtocolError as ex:
+        try:
+            raise ServiceResponseException(f"mock service failed to complete the prompt: {ex}", inner_exception=ex) from ex
+        except ServiceResponseException as wrapped:
+            return wrapped
+
+
+@use_function_invocation
+@use_chat_middleware
+class MockChatClient(BaseChatClient):
+    """
+    Chat client that never leaves the process. Responses are random words streamed
+    at `tokens_per_second` after a lognormal TTFT; 429s, 500s and broken streams are
+    injected with the profile's probabilities, as the same exception chain the Azure
+    client produces, so retries, failover and hedging behave as in production.
+    It never calls tools.
+    """
+
+    def __init__(self, deployment_name: str, profile: MockProfile, *, language: str = "ja", seed: Optional[int] = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.deployment_name = deployment_name
+        self.model_id = deployment_name
+        self.profile = profile
+        self.words = _WORDS_JA if language == "ja" else _WORDS
+        self.separator = "" if language == "ja" else " "
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    def _ttft(self) -> float:
+        profile = self.profile
+        return profile.ttft_ms / 1000 * self._random.lognormvariate(0, profile.ttft_sigma) if profile.ttft_sigma > 0 else profile.ttft_ms / 1000
+
+    def _gap(self) -> float:
+        profile = self.profile
+        if profile.tokens_per_second <= 0:
+            return 0.0
+        return max(0.0, 1 / profile.tokens_per_second * (1 + self._random.uniform(-profile.jitter, profile.jitter)))
+
+    async def _start(self) -> None:
+        self.calls += 1
+        profile = self.profile
+        await asyncio.sleep(self._ttft())
+        roll = self._random.random()
+        if roll < profile.rate_limit_rate:
+            raise _status_error(429, profile.retry_after)
+        if roll < profile.rate_limit_rate + profile.error_rate:
+            raise _status_error(500, profile.retry_after)
+
+    def _token(self, index: int) -> str:
+        word = self._random.choice(self.words)
+        return word if index == 0 else self.separator + word
+
+    async def _inner_get_response(self, *, messages, options, **kwargs: Any) -> ChatResponse:
+        await self._start()
+        tokens = [self._token(i) for i in range(self.profile.response_tokens)]
+        await asyncio.sleep(sum(self._gap() for _ in tokens))
+        return ChatResponse(
+            messages=[ChatMessage(role="assistant", text="".join(tokens))],
+            model_id=self.deployment_name,
+        )
+
+    async def _inner_get_streaming_response(self, *, messages, options, **kwargs: Any):
+        await self._start()
+        response_id = f"mock-{self.calls}"
+        break_at = None
+        if self._random.random() < self.profile.break_rate:
+            break_at = self._random.randint(1, max(1, self.profile.response_tokens - 1))
+        # Azure opens with an empty role chunk before the first token
+        yield ChatResponseUpdate(role="assistant", contents=[], response_id=response_id, message_id=response_id)
+        for index in range(self.profile.response_tokens):
+            if index == break_at:
+                raise _broken_stream()
+            if index:
+                await asyncio.sleep(self._gap())
+            yield ChatResponseUpdate(
+                role="assistant",
+                contents=[Content.from_text(self._token(index))],
+                response_id=response_id,
+                message_id=response_id,
+                model_id=self.deployment_name,
+            )
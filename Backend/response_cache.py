@@ -0,0 +1,90 @@
+# Exact-match response cache with streamed replay
+
+import asyncio
+import hashlib
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Iterable, List, Optional
+
+from cache import TTLCache
+
+
+@dataclass
+class CachedResponse:
+    """Chunk sequence of one completed stream and each chunk's offset from stream start."""
+
+    chunks: List[str] = field(default_factory=list)
+    offsets: List[float] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def size(self) -> int:
+        return sum(len(chunk.encode("utf-8")) for chunk in self.chunks) + 8 * len(self.offsets)
+
+
+async def capture_stream(
+    stream: AsyncIterator[str],
+    sinks: Iterable[Callable[[CachedResponse], object]],
+    cacheable: Optional[Callable[[], bool]] = None,
+) -> AsyncIterator[str]:
+    """Pass chunks through and hand the recorded sequence to each sink once the stream completes."""
+    entry = CachedResponse()
+    start = time.monotonic()
+    async for chunk in stream:
+        entry.chunks.append(chunk)
+        entry.offsets.append(time.monotonic() - start)
+        yield chunk
+    # Streams cut short (client disconnect, upstream error) never reach this point
+    if entry.chunks and (cacheable is None or cacheable()):
+        for sink in sinks:
+            sink(entry)
+
+
+class ResponseCache:
+    """
+    Opt-in cache of complete streamed answers, keyed by deployment, language,
+    agent instructions and prompt.
+
+    A hit is replayed through the same StreamingResponse, either instantly or with
+    the original inter-chunk timing, without touching Azure OpenAI.
+    """
+
+    def __init__(self, *, max_bytes: int, max_entry_bytes: int, ttl: float, max_entries: int = 10000):
+        self.max_entry_bytes = max_entry_bytes
+        self._cache = TTLCache(
+            max_entries=max_entries,
+            ttl=ttl,
+            max_bytes=max_bytes,
+            sizeof=lambda entry: entry.size,
+        )
+
+    @staticmethod
+    def make_key(deployment: Optional[str], language: str, instructions: str, prompt: str) -> str:
+        # Hash instead of holding long instruction/prompt strings as dict keys
+        digest = hashlib.sha256()
+        for part in (deployment or "", language, instructions, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        return self._cache.get(key)
+
+    def set(self, key: str, entry: CachedResponse) -> bool:
+        if entry.size > self.max_entry_bytes:
+            return False
+        return self._cache.set(key, entry)
+
+    @staticmethod
+    async def replay(entry: CachedResponse, timed: bool = False, speed: float = 1.0) -> AsyncIterator[str]:
+        """Yield a cached chunk sequence, optionally reproducing the original pacing."""
+        start = time.monotonic()
+        for chunk, offset in zip(entry.chunks, entry.offsets):
+            if timed:
+                delay = offset / speed - (time.monotonic() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield chunk
+
+    def stats(self) -> dict:
+        return {"max_entry_bytes": self.max_entry_bytes, **self._cache.stats()}
@@ -0,0 +1,90 @@
+# Async, connection-pooled Azure AI Search access for search_tool
+
+import asyncio
+import logging
+from typing import List, Optional
+
+import aiohttp
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.search.documents.aio import SearchClient
+from azure.search.documents.models import QueryType
+
+logger = logging.getLogger(__name__)
+
+
+class AzureSearchBackend:
+    """
+    Long-lived async SearchClient shared by every search_tool call.
+
+    The client (and its aiohttp connection pool) is created lazily inside the running
+    event loop and reused until shutdown, so a semantic search never blocks the loop
+    and never pays for a fresh TLS handshake.
+    """
+
+    def __init__(
+        self,
+        *,
+        endpoint: str,
+        index_name: str,
+        api_key: str,
+        semantic_config: str = "default",
+        timeout: float = 10.0,
+        max_connections: int = 20,
+        top: int = 3,
+    ):
+        self.endpoint = endpoint
+        self.index_name = index_name
+        self.api_key = api_key
+        self.semantic_config = semantic_config
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.top = top
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._client: Optional[SearchClient] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.endpoint and self.index_name and self.api_key)
+
+    async def _get_client(self) -> SearchClient:
+        if self._client is not None:
+            return self._client
+        async with self._lock:
+            if self._client is None:
+                self._session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60),
+                )
+                self._client = SearchClient(
+                    endpoint=self.endpoint,
+                    index_name=self.index_name,
+                    credential=AzureKeyCredential(self.api_key),
+                    transport=AioHttpTransport(session=self._session, session_owner=False),
+                )
+        return self._client
+
+    async def search(self, query: str) -> List[dict]:
+        """Run a semantic search and return the raw hits (content, metadata_storage_name)."""
+        client = await self._get_client()
+
+        async def _run() -> List[dict]:
+            results = await client.search(
+                search_text=query,
+                query_type=QueryType.SEMANTIC,
+                semantic_configuration_name=self.semantic_config,
+                top=self.top,
+                select=["content", "metadata_storage_name"],
+            )
+            return [dict(result) async for result in results]
+
+        # asyncio.TimeoutError propagates to the caller, which reports it to the agent
+        return await asyncio.wait_for(_run(), timeout=self.timeout)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
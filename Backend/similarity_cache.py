@@ -0,0 +1,192 @@
+# Near-duplicate prompt cache backed by a local MinHash/LSH index
+
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+
+from cache import normalize_text
+
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+@dataclass
+class SimilarMatch:
+    """A cache hit together with the prompt it was stored for and its estimated similarity."""
+
+    value: Any
+    prompt: str
+    similarity: float
+    age: float
+
+
+class SimilarityCache:
+    """
+    Near-duplicate lookup over cached prompts without an embedding service.
+
+    Prompts are normalized (case, width, whitespace, punctuation), shingled into
+    character n-grams and reduced to MinHash signatures. Signatures live in one
+    preallocated uint32 matrix; LSH banding narrows a lookup to a handful of
+    candidate rows, so lookups stay sub-millisecond at 100k+ entries. The estimated
+    Jaccard similarity of the best candidate must reach `threshold` to count as a hit.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_entries: int = 100_000,
+        threshold: float = 0.85,
+        ttl: float = 3600.0,
+        ngram: int = 3,
+        num_perm: int = 64,
+        bands: int = 16,
+        seed: int = 7,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self.ngram = ngram
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+
+        self._signatures = np.zeros((max_entries, num_perm), dtype=np.uint32)
+        self._scopes = np.zeros(max_entries, dtype=np.uint32)
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._values: List[Any] = [None] * max_entries
+        self._prompts: List[str] = [""] * max_entries
+        self._band_keys: List[tuple] = [()] * max_entries
+        self._buckets: Dict[tuple, Set[int]] = {}
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def _shingles(self, text: str) -> np.ndarray:
+        normalized = _NON_WORD.sub("", normalize_text(text))
+        codes = np.frombuffer(normalized.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        if codes.size < self.ngram:
+            if codes.size == 0:
+                return np.zeros(1, dtype=np.uint64)
+            return np.array([zlib.crc32(normalized.encode("utf-8"))], dtype=np.uint64) % _MERSENNE_PRIME
+        # Polynomial rolling hash of each n-gram, computed for all positions at once
+        hashes = np.zeros(codes.size - self.ngram + 1, dtype=np.uint64)
+        for offset in range(self.ngram):
+            hashes = (hashes * np.uint64(1_000_003) + codes[offset:offset + hashes.size]) % _MERSENNE_PRIME
+        return np.unique(hashes)
+
+    def signature(self, text: str) -> np.ndarray:
+        shingles = self._shingles(text)
+        permuted = (self._a[:, None] * shingles[None, :] + self._b[:, None]) % _MERSENNE_PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _bands_for(self, scope: int, signature: np.ndarray) -> tuple:
+        return tuple(
+            (scope, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        )
+
+    @staticmethod
+    def scope_id(*parts: Optional[str]) -> int:
+        """Partition key (e.g. endpoint, deployment, language, instructions) as a 32-bit id."""
+        return zlib.crc32("\x00".join(part or "" for part in parts).encode("utf-8"))
+
+    def lookup(self, scope: int, prompt: str) -> Optional[SimilarMatch]:
+        signature = self.signature(prompt)
+        now = time.time()
+        with self._lock:
+            candidates: Set[int] = set()
+            for band_key in self._bands_for(scope, signature):
+                bucket = self._buckets.get(band_key)
+                if bucket:
+                    candidates.update(bucket)
+            if not candidates:
+                self.misses += 1
+                return None
+
+            slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            slots = slots[(self._scopes[slots] == scope) & (self._expires[slots] >= now)]
+            if slots.size == 0:
+                self.misses += 1
+                return None
+            similarities = (self._signatures[slots] == signature).mean(axis=1)
+            best = int(similarities.argmax())
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            slot = int(slots[best])
+            self._lru.move_to_end(slot)
+            self.hits += 1
+            return SimilarMatch(
+                value=self._values[slot],
+                prompt=self._prompts[slot],
+                similarity=similarity,
+                age=now - (self._expires[slot] - self.ttl),
+            )
+
+    def add(self, scope: int, prompt: str, value: Any) -> None:
+        signature = self.signature(prompt)
+        with self._lock:
+            if not self._free:
+                oldest, _ = self._lru.popitem(last=False)
+                self._release(oldest)
+                self.evictions += 1
+            slot = self._free.pop()
+            band_keys = self._bands_for(scope, signature)
+            self._signatures[slot] = signature
+            self._scopes[slot] = scope
+            self._expires[slot] = time.time() + self.ttl
+            self._values[slot] = value
+            self._prompts[slot] = prompt
+            self._band_keys[slot] = band_keys
+            for band_key in band_keys:
+                self._buckets.setdefault(band_key, set()).add(slot)
+            self._lru[slot] = None
+
+    def _release(self, slot: int) -> None:
+        for band_key in self._band_keys[slot]:
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(slot)
+                if not bucket:
+                    del self._buckets[band_key]
+        self._values[slot] = None
+        self._prompts[slot] = ""
+        self._band_keys[slot] = ()
+        self._expires[slot] = 0.0
+        self._free.append(slot)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "ttl": self.ttl,
+            "num_perm": self.num_perm,
+            "bands": self.bands,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,209 @@
+# Speaker selection for group chats: an incremental conversation index and pluggable rotation policies
+
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+
+def _message_author(message) -> Optional[str]:
+    author = getattr(message, "author_name", None)
+    if author is None:
+        author = getattr(message, "speaker", None)
+    if author is None and hasattr(message, "message"):
+        author = getattr(message.message, "author_name", None)
+    return str(author).strip() if author else None
+
+
+def _message_text(message) -> str:
+    text = getattr(message, "text", None)
+    if text is None and hasattr(message, "message"):
+        text = getattr(message.message, "text", None)
+    return text or ""
+
+
+class ConversationIndex:
+    """
+    What the selector needs to know about a conversation, maintained incrementally.
+
+    The group chat hands the selector the full (append-only) history on every call;
+    `update()` only looks at messages added since the previous call, so keeping the
+    index current costs O(1) per new message instead of a scan of the whole history.
+    """
+
+    def __init__(self, participants: Sequence[str], completion_marker: Optional[str] = None):
+        self.participants: List[str] = list(participants)
+        self.completion_marker = completion_marker
+        self.reset()
+
+    def reset(self) -> None:
+        self.seen = 0
+        self.turns: Dict[str, int] = {name: 0 for name in self.participants}
+        # Position (in participant turns) of each participant's latest turn
+        self.last_turn: Dict[str, int] = {}
+        self.total_turns = 0
+        self.last_speaker: Optional[str] = None
+        self.last_selected: Optional[str] = None
+        self.selections = 0
+        self.completed = False
+
+    def update(self, conversation: Sequence) -> None:
+        if len(conversation) < self.seen:
+            # A different (or restarted) conversation; rebuild from scratch
+            self.reset()
+        for message in conversation[self.seen:]:
+            self._add(message)
+        self.seen = len(conversation)
+
+    def _add(self, message) -> None:
+        speaker = _message_author(message)
+        if speaker in self.turns:
+            self.turns[speaker] += 1
+            self.total_turns += 1
+            self.last_turn[speaker] = self.total_turns
+            self.last_speaker = speaker
+        if self.completion_marker and not self.completed and self.completion_marker in _message_text(message):
+            self.completed = True
+
+    def selected(self, speaker: str) -> None:
+        self.last_selected = speaker
+        self.selections += 1
+
+
+class RotationPolicy(ABC):
+    """Chooses the next speaker from the index; None means nobody is left to speak."""
+
+    @abstractmethod
+    def next_speaker(self, index: ConversationIndex) -> Optional[str]:
+        """Name of the participant to speak next, or None."""
+
+
+class RoundRobinPolicy(RotationPolicy):
+    """Fixed order, starting over after the last participant."""
+
+    def __init__(self, order: Sequence[str]):
+        self.order = list(order)
+        self._position = {name: i for i, name in enumerate(self.order)}
+
+    def next_speaker(self, index: ConversationIndex) -> Optional[str]:
+        # Rotate from the last pick rather than the last message, so a repeated call
+        # before the picked participant has answered does not pick them twice
+        current = index.last_selected or index.last_speaker
+        if current not in self._position:
+            return self.order[0]
+        return self.order[(self._position[current] + 1) % len(self.order)]
+
+
+class PriorityPolicy(RotationPolicy):
+    """
+    Weighted fair share: the participant furthest below its share of turns speaks next
+    (ties go to the higher weight, then declaration order); nobody speaks twice in a row.
+    """
+
+    def __init__(self, weights: Dict[str, float]):
+        self.weights = {name: float(weight) for name, weight in weights.items() if weight > 0}
+        self._order = {name: i for i, name in enumerate(self.weights)}
+
+    def next_speaker(self, index: ConversationIndex) -> Optional[str]:
+        previous = index.last_selected or index.last_speaker
+        candidates = [name for name in self.weights if name != previous] or list(self.weights)
+        if not candidates:
+            return None
+        return min(
+            candidates,
+            key=lambda name: ((index.turns.get(name, 0) + 1) / self.weights[name], -self.weights[name], self._order[name]),
+        )
+
+
+class DagPolicy(RotationPolicy):
+    """
+    Each participant speaks once, after everyone it depends on has spoken; participants
+    whose dependencies are met go in declaration order. Exhausted once all have spoken.
+    """
+
+    def __init__(self, order: Sequence[str], dependencies: Optional[Dict[str, Iterable[str]]] = None):
+        self.order = list(order)
+        self.dependencies = {name: tuple((dependencies or {}).get(name, ())) for name in self.order}
+        unknown = {dep for deps in self.dependencies.values() for dep in deps} - set(self.order)
+        if unknown:
+            raise ValueError(f"unknown dependencies: {sorted(unknown)}")
+
+    def next_speaker(self, index: ConversationIndex) -> Optional[str]:
+        for name in self.order:
+            if index.turns.get(name, 0) or name == index.last_selected:
+                continue
+            if all(index.turns.get(dep, 0) for dep in self.dependencies[name]):
+                return name
+        return None
+
+
+def make_policy(
+    name: str,
+    participants: Sequence[str],
+    *,
+    dependencies: Optional[Dict[str, Iterable[str]]] = None,
+    weights: Optional[Dict[str, float]] = None,
+) -> RotationPolicy:
+    if name == "round_robin":
+        return RoundRobinPolicy(participants)
+    if name == "dag":
+        return DagPolicy(participants, dependencies)
+    if name == "priority":
+        return PriorityPolicy(weights or {participant: 1 for participant in participants})
+    raise ValueError(f"unknown speaker policy: {name!r}")
+
+
+class SpeakerSelector:
+    """
+    Selection function plus termination condition for a GroupChatBuilder workflow.
+
+    The group chat checks the termination condition before every selection, so the
+    selector itself never has to return None (which the orchestrator rejects as an
+    unknown participant). The conversation ends when the completion marker appears,
+    after `max_rounds` selections, or when the policy has nobody left to pick;
+    `on_stop(reason)` is told which ("completed", "max_rounds" or "exhausted").
+    """
+
+    def __init__(
+        self,
+        participants: Sequence[str],
+        policy: RotationPolicy,
+        *,
+        completion_marker: Optional[str] = None,
+        max_rounds: int = 10,
+        on_stop: Optional[Callable[[str], None]] = None,
+    ):
+        self.index = ConversationIndex(participants, completion_marker)
+        self.policy = policy
+        self.max_rounds = max_rounds
+        self.on_stop = on_stop
+        self.stop_reason: Optional[str] = None
+        self._next: Optional[str] = None
+
+    def _stop(self, reason: str) -> bool:
+        if self.stop_reason is None:
+            self.stop_reason = reason
+            if self.on_stop is not None:
+                self.on_stop(reason)
+        return True
+
+    def should_terminate(self, conversation: Sequence) -> bool:
+        self.index.update(conversation)
+        if self.index.completed:
+            return self._stop("completed")
+        if self.index.selections >= self.max_rounds:
+            return self._stop("max_rounds")
+        self._next = self.policy.next_speaker(self.index)
+        if self._next is None:
+            return self._stop("exhausted")
+        return False
+
+    def __call__(self, state) -> str:
+        conversation = getattr(state, "conversation", None)
+        if conversation is None:
+            conversation = getattr(state, "history", ()) or ()
+        if self._next is None or self.index.seen != len(conversation):
+            # Called without a preceding termination check on this history
+            self.index.update(conversation)
+            self._next = self.policy.next_speaker(self.index) or self.index.participants[0]
+        speaker, self._next = self._next, None
+        self.index.selected(speaker)
+        return speaker
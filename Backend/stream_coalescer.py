@@ -0,0 +1,175 @@
+# Time/size-window coalescing of streamed chunks in front of StreamingResponse
+
+import asyncio
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List, Optional
+
+from cancellation import until_stopped
+
+
+class _Window(ABC):
+    """Buffered output of one window; subclasses decide how items merge."""
+
+    def __init__(self):
+        self.size = 0
+
+    @abstractmethod
+    def add(self, item) -> Optional[list]:
+        """Buffer an item; return items that must be emitted right away (in order)."""
+
+    @abstractmethod
+    def flush(self) -> list:
+        """Return the buffered items and empty the window."""
+
+
+class _TextWindow(_Window):
+    def __init__(self):
+        super().__init__()
+        self._parts: List[str] = []
+        self._first = True
+
+    def add(self, item: str) -> Optional[List[str]]:
+        if self._first:
+            # First chunk goes out immediately so TTFT is unchanged
+            self._first = False
+            return [item]
+        self._parts.append(item)
+        self.size += len(item)
+        return None
+
+    def flush(self) -> List[str]:
+        out = ["".join(self._parts)] if self._parts else []
+        self._parts = []
+        self.size = 0
+        return out
+
+
+class _EventWindow(_Window):
+    """
+    Merges `{"agent", "content", ...}` delta events per agent within a window.
+
+    Control events (anything with a "type", or that is not a delta) flush the window
+    first and are emitted immediately, so event order relative to content is kept.
+    The first delta of each agent is also emitted immediately.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._deltas: Dict[str, dict] = {}
+        self._seen_agents: set = set()
+
+    def add(self, item: dict) -> Optional[List[dict]]:
+        if "type" in item or "agent" not in item or "content" not in item:
+            return self.flush() + [item]
+
+        agent = item["agent"]
+        if agent not in self._seen_agents:
+            self._seen_agents.add(agent)
+            return self.flush() + [item]
+
+        pending = self._deltas.get(agent)
+        if pending is None:
+            self._deltas[agent] = dict(item)
+        else:
+            content = pending["content"] + item["content"]
+            pending.update(item)
+            pending["content"] = content
+        self.size += len(item["content"])
+        return None
+
+    def flush(self) -> List[dict]:
+        out = list(self._deltas.values())
+        self._deltas = {}
+        self.size = 0
+        return out
+
+
+_DONE = object()
+
+
+async def _coalesce(
+    stream: AsyncIterator,
+    window: _Window,
+    interval: float,
+    max_bytes: int,
+) -> AsyncIterator:
+    """
+    Emit the window every `interval` seconds or once it holds `max_bytes` characters.
+
+    The source is drained by one reader task into a bounded queue, so a buffered
+    window is flushed on time even while the upstream is stalled between tokens.
+    A single task keeps every step of the source in the same context (tracing spans
+    opened by the agent framework are attached and detached in that context).
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=1024)
+    stopped = False
+
+    async def _read() -> None:
+        try:
+            async for item in until_stopped(stream, lambda: stopped):
+                await queue.put(item)
+            if not stopped:
+                await queue.put(_DONE)
+        except Exception as exc:  # re-raised in the consumer
+            if not stopped:
+                await queue.put(exc)
+
+    reader = asyncio.create_task(_read())
+    deadline: Optional[float] = None
+    try:
+        while True:
+            try:
+                if deadline is None:
+                    item = await queue.get()
+                else:
+                    item = await asyncio.wait_for(queue.get(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                for out in window.flush():
+                    yield out
+                deadline = None
+                continue
+
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                for out in window.flush():
+                    yield out
+                raise item
+
+            immediate = window.add(item)
+            if immediate is not None:
+                for out in immediate:
+                    yield out
+                deadline = None
+            elif window.size >= max_bytes:
+                for out in window.flush():
+                    yield out
+                deadline = None
+            elif deadline is None:
+                deadline = loop.time() + interval
+
+        for out in window.flush():
+            yield out
+    finally:
+        stopped = True
+        if not reader.done():
+            reader.cancel()
+            try:
+                await reader
+            except BaseException:
+                pass
+
+
+def coalesce_text(stream: AsyncIterator[str], interval: float, max_bytes: int) -> AsyncIterator[str]:
+    """Concatenate plain-text chunks per window; returns the stream unchanged when interval <= 0."""
+    if interval <= 0:
+        return stream
+    return _coalesce(stream, _TextWindow(), interval, max_bytes)
+
+
+def coalesce_events(stream: AsyncIterator[dict], interval: float, max_bytes: int) -> AsyncIterator[dict]:
+    """Merge agent content delta events per agent and window; returns the stream unchanged when interval <= 0."""
+    if interval <= 0:
+        return stream
+    return _coalesce(stream, _EventWindow(), interval, max_bytes)
@@ -0,0 +1,102 @@
+# Wire formats for the NDJSON agent streams (v1: verbose objects, v2: compact indexed frames)
+
+import json
+from typing import AsyncIterator, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+# Fields only emitted when debug output is requested
+DEBUG_FIELDS = ("executor_id", "author_name", "traceback")
+
+
+def _dumps(value) -> str:
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(line):
+    """Decode one frame (either version) with the fastest available decoder."""
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+def is_delta(event: dict) -> bool:
+    return "type" not in event and "agent" in event and "content" in event
+
+
+class NdjsonV1Encoder:
+    """The original format: one self-describing JSON object per line."""
+
+    version = 1
+    media_type = "text/plain"
+
+    def __init__(self, agents: Optional[List[str]] = None, debug: bool = False):
+        self.debug = debug
+
+    def encode(self, event: dict) -> str:
+        if not self.debug:
+            event = {key: value for key, value in event.items() if key not in DEBUG_FIELDS}
+        return json.dumps(event, ensure_ascii=False) + "\n"
+
+
+class NdjsonV2Encoder:
+    """
+    Compact frames:
+      {"v":2,"agents":["CEO","CTO",...]}   header; sent first and again if an agent is added
+      [i,"delta"]                          content delta of agents[i]
+      [i,"delta",{...}]                    same, with debug fields (opt-in)
+      {"type":...}                         control events, unchanged apart from debug fields
+    """
+
+    version = 2
+    media_type = "application/x-ndjson"
+
+    def __init__(self, agents: Optional[List[str]] = None, debug: bool = False):
+        self.debug = debug
+        self.agents: List[str] = list(agents or [])
+        self._index: Dict[str, int] = {name: i for i, name in enumerate(self.agents)}
+        self._header_sent = False
+
+    def _header(self) -> str:
+        self._header_sent = True
+        return _dumps({"v": 2, "agents": self.agents}) + "\n"
+
+    def encode(self, event: dict) -> str:
+        prefix = "" if self._header_sent else self._header()
+        if is_delta(event):
+            agent = event["agent"]
+            index = self._index.get(agent)
+            if index is None:
+                index = self._index[agent] = len(self.agents)
+                self.agents.append(agent)
+                prefix += self._header()
+            frame = [index, event["content"]]
+            if self.debug:
+                extra = {key: event[key] for key in DEBUG_FIELDS if event.get(key) is not None}
+                if extra:
+                    frame.append(extra)
+            return prefix + _dumps(frame) + "\n"
+        if not self.debug:
+            event = {key: value for key, value in event.items() if key not in DEBUG_FIELDS}
+        return prefix + _dumps(event) + "\n"
+
+
+def negotiate(version, agents: List[str], debug: bool = False):
+    """Encoder for the requested protocol version (anything but 2 means v1)."""
+    try:
+        version = int(version)
+    except (TypeError, ValueError):
+        version = 1
+    if version == 2:
+        return NdjsonV2Encoder(agents, debug)
+    return NdjsonV1Encoder(agents, debug)
+
+
+async def encode_stream(events: AsyncIterator[dict], encoder) -> AsyncIterator[str]:
+    async for event in events:
+        yield encoder.encode(event)
@@ -0,0 +1,329 @@
+# Record the agent/workflow event streams of real requests and replay them with their original timing
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from agent_framework import (
+    AgentResponseUpdate,
+    AgentRunUpdateEvent,
+    ChatMessage,
+    Content,
+    ExecutorCompletedEvent,
+    WorkflowEvent,
+    WorkflowOutputEvent,
+)
+
+from translations import get_text
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# Event kinds of the compact encoding; every event is a list starting with [t_ms, kind, ...]
+#   [t, "a", author_name, text, props?]          AgentResponseUpdate of an agent stream
+#   [t, "u", executor_id, author_name, text, props?]  AgentRunUpdateEvent
+#   [t, "o", executor_id, [[author, role, text], ...] | text]  WorkflowOutputEvent
+#   [t, "c", executor_id]                        ExecutorCompletedEvent
+#   [t, "e", event_type, executor_id]            any other workflow event
+#   [t, "x", message]                            the stream raised
+
+
+class ReplayedError(RuntimeError):
+    """A recorded stream failed; replaying it fails at the same point with the same message."""
+
+
+def _props(update: Any) -> Optional[dict]:
+    props = getattr(update, "additional_properties", None)
+    if not props:
+        return None
+    try:
+        json.dumps(props)
+    except (TypeError, ValueError):
+        return None
+    return dict(props)
+
+
+def encode_event(t_ms: float, event: Any) -> Optional[list]:
+    """Compact form of one stream item, or None for items no endpoint reads (empty updates)."""
+    t = round(t_ms, 1)
+    if isinstance(event, AgentRunUpdateEvent):
+        data = event.data
+        text = (getattr(data, "text", "") or "") if data is not None else ""
+        props = _props(data)
+        if not text and not props:
+            return None
+        encoded = [t, "u", event.executor_id, getattr(data, "author_name", None), text]
+        return encoded + [props] if props else encoded
+    if isinstance(event, WorkflowOutputEvent):
+        data = event.data
+        if isinstance(data, list):
+            messages = [[getattr(m, "author_name", None), str(getattr(m, "role", "assistant")), getattr(m, "text", "") or ""] for m in data]
+            return [t, "o", event.executor_id, messages]
+        return [t, "o", event.executor_id, None if data is None else str(data)]
+    if isinstance(event, ExecutorCompletedEvent):
+        return [t, "c", event.executor_id]
+    if isinstance(event, WorkflowEvent):
+        return [t, "e", type(event).__name__, getattr(event, "executor_id", None)]
+    text = getattr(event, "text", "") or ""
+    props = _props(event)
+    if not text and not props:
+        return None
+    encoded = [t, "a", getattr(event, "author_name", None), text]
+    return encoded + [props] if props else encoded
+
+
+def _update(author_name: Optional[str], text: str, props: Optional[dict]) -> AgentResponseUpdate:
+    return AgentResponseUpdate(
+        contents=[Content.from_text(text)] if text else [],
+        role="assistant",
+        author_name=author_name,
+        additional_properties=props,
+    )
+
+
+def decode_event(encoded: list) -> Any:
+    """The event or update an endpoint sees for one compact item ("x" items raise ReplayedError)."""
+    kind = encoded[1]
+    if kind == "a":
+        return _update(encoded[2], encoded[3], encoded[4] if len(encoded) > 4 else None)
+    if kind == "u":
+        return AgentRunUpdateEvent(encoded[2], _update(encoded[3], encoded[4], encoded[5] if len(encoded) > 5 else None))
+    if kind == "o":
+        data = encoded[3]
+        if isinstance(data, list):
+            data = [ChatMessage(role=role, text=text, author_name=author) for author, role, text in data]
+        return WorkflowOutputEvent(data, encoded[2])
+    if kind == "c":
+        return ExecutorCompletedEvent(encoded[2])
+    if kind == "x":
+        raise ReplayedError(encoded[2])
+    return WorkflowEvent()
+
+
+class _Recorded:
+    """Stands in for an agent or workflow; its run_stream() calls are recorded or replayed."""
+
+    def __init__(self, session, label: str, target: Any):
+        self._session = session
+        self._label = label
+        self._target = target
+        self._calls = 0
+
+    def run_stream(self, *args, **kwargs) -> AsyncIterator[Any]:
+        index = self._calls
+        self._calls += 1
+        return self._session.stream(self._label, index, lambda: self._target.run_stream(*args, **kwargs))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._target, name)
+
+
+class RecordSession:
+    """
+    The recording of one request. Each stream is appended to the file as one gzip
+    member when it ends, so a recording is readable even if the request dies later.
+    The appends run on the recorder's writer thread, in order, off the event loop.
+    """
+
+    def __init__(self, path: str, header: dict, writer: ThreadPoolExecutor, language: str = "ja"):
+        self.path = path
+        self.header = header
+        self.writer = writer
+        self.language = language
+        self.started = time.monotonic()
+        self._written = False
+
+    def wrap(self, label: str, target: Any) -> Any:
+        return _Recorded(self, label, target)
+
+    async def stream(self, label: str, index: int, start) -> AsyncIterator[Any]:
+        events: List[list] = []
+        offset = (time.monotonic() - self.started) * 1000
+        began = time.perf_counter()
+        try:
+            async for event in start():
+                encoded = encode_event((time.perf_counter() - began) * 1000, event)
+                if encoded is not None:
+                    events.append(encoded)
+                yield event
+        except Exception as exc:
+            events.append([round((time.perf_counter() - began) * 1000, 1), "x", str(exc)])
+            raise
+        finally:
+            block = {"stream": label, "index": index, "offset_ms": round(offset, 1), "events": events}
+            asyncio.get_running_loop().run_in_executor(self.writer, self._write, block)
+
+    def _write(self, block: dict) -> None:
+        lines = [] if self._written else [json.dumps(self.header, ensure_ascii=False)]
+        lines.append(json.dumps(block, ensure_ascii=False, separators=(",", ":")))
+        try:
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            self._written = True
+        except OSError as exc:
+            logger.warning(get_text('log_recording_failed', self.language, path=self.path, error=str(exc)))
+
+
+class StreamRecorder:
+    """Writes one `<endpoint>-<time>-<id>.jsonl.gz` file per request into `directory`."""
+
+    def __init__(self, directory: str, language: str = "ja"):
+        self.directory = directory
+        self.language = language
+        self.recorded = 0
+        # One thread, so the blocks of a recording are appended in the order their streams ended
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stream-recorder")
+        os.makedirs(directory, exist_ok=True)
+
+    def session(self, endpoint: str, variant: str, model: str, prompt: str) -> RecordSession:
+        recording_id = uuid.uuid4().hex[:12]
+        slug = re.sub(r"[^a-z0-9]+", "-", endpoint.lower()).strip("-")
+        path = os.path.join(self.directory, f"{slug}-{time.strftime('%Y%m%d-%H%M%S')}-{recording_id}.jsonl.gz")
+        header = {
+            "version": FORMAT_VERSION,
+            "id": recording_id,
+            "endpoint": endpoint,
+            "variant": variant,
+            "model": model,
+            "prompt": prompt,
+            "language": self.language,
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        }
+        self.recorded += 1
+        return RecordSession(path, header, self._writer, self.language)
+
+    def stats(self) -> dict:
+        return {"mode": "record", "directory": self.directory, "recorded": self.recorded}
+
+
+def read_recording(path: str) -> dict:
+    """{"header": ..., "streams": {(label, index): block}} of one recording file."""
+    streams: Dict[tuple, dict] = {}
+    header: Optional[dict] = None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "stream" in item:
+                streams[(item["stream"], item["index"])] = item
+            elif header is None:
+                header = item
+    return {"header": header or {}, "streams": streams}
+
+
+class ReplaySession:
+    """Feeds the recorded streams of one request back in place of the live runs."""
+
+    def __init__(self, recording: dict, speed: float):
+        self.recording = recording
+        self.speed = speed
+
+    @property
+    def recording_id(self) -> str:
+        return self.recording["header"].get("id", "")
+
+    def wrap(self, label: str, target: Any) -> Any:
+        return _Recorded(self, label, target)
+
+    async def stream(self, label: str, index: int, start) -> AsyncIterator[Any]:
+        block = self.recording["streams"].get((label, index))
+        if block is None:
+            # Not in the recording (e.g. a synthesis reconcile turn recorded in another mode): run live
+            async for event in start():
+                yield event
+            return
+        began = time.perf_counter()
+        for encoded in block["events"]:
+            if self.speed > 0:
+                delay = encoded[0] / 1000 / self.speed - (time.perf_counter() - began)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield decode_event(encoded)
+
+
+class StreamReplayer:
+    """
+    Serves requests from the recordings in `directory`. A request replays the
+    recording with its id when it names one, else a recording of the same
+    endpoint and variant with the same prompt, else the next such recording in
+    turn, so any prompt maps onto the corpus deterministically. `speed` scales
+    time (2.0 = twice as fast, 0 = no waiting at all).
+    """
+
+    def __init__(self, directory: str, speed: float = 1.0, language: str = "ja"):
+        self.directory = directory
+        self.speed = speed
+        self.language = language
+        self._headers: Dict[str, dict] = {}
+        self._recordings: Dict[str, dict] = {}
+        self._turn: Dict[tuple, int] = {}
+        self.replayed = 0
+        self.live = 0
+        self._index()
+
+    def _index(self) -> None:
+        for name in sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else []:
+            if not name.endswith(".jsonl.gz"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    header = json.loads(f.readline())
+            except (OSError, ValueError) as exc:
+                logger.warning(get_text('log_recording_failed', self.language, path=path, error=str(exc)))
+                continue
+            if header.get("version") == FORMAT_VERSION:
+                self._headers[path] = header
+        logger.info(get_text('log_replay_ready', self.language, count=len(self._headers), directory=self.directory))
+
+    def _load(self, path: str) -> dict:
+        recording = self._recordings.get(path)
+        if recording is None:
+            recording = self._recordings[path] = read_recording(path)
+        return recording
+
+    def session(self, endpoint: str, variant: str, prompt: str, recording_id: Optional[str] = None, speed: Optional[float] = None) -> Optional[ReplaySession]:
+        """Replay session for a request, or None when no recording fits (the request runs live)."""
+        candidates = [path for path, header in self._headers.items() if header.get("endpoint") == endpoint and header.get("variant") == variant]
+        if recording_id:
+            chosen = next((path for path, header in self._headers.items() if header.get("id") == recording_id), None)
+        else:
+            chosen = next((path for path in candidates if self._headers[path].get("prompt") == prompt), None)
+            if chosen is None and candidates:
+                turn = self._turn.get((endpoint, variant), 0)
+                self._turn[(endpoint, variant)] = turn + 1
+                chosen = candidates[turn % len(candidates)]
+        if chosen is None:
+            self.live += 1
+            return None
+        self.replayed += 1
+        return ReplaySession(self._load(chosen), self.speed if speed is None else speed)
+
+    def stats(self) -> dict:
+        return {
+            "mode": "replay",
+            "directory": self.directory,
+            "recordings": len(self._headers),
+            "speed": self.speed,
+            "replayed": self.replayed,
+            "live": self.live,
+        }
+
+
+class _Passthrough:
+    """Session used when neither recording nor replaying: wrap() returns the target itself."""
+
+    def wrap(self, label: str, target: Any) -> Any:
+        return target
+
+
+PASSTHROUGH = _Passthrough()
@@ -0,0 +1,257 @@
+# Resumable Server-Sent Events: per-stream ring buffers that outlive the client connection
+
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Deque, Optional
+
+from cancellation import until_stopped
+
+
+@dataclass
+class SseEvent:
+    id: Optional[int]
+    data: str
+    event: Optional[str] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.data.encode("utf-8")) + 32
+
+    def encode(self) -> str:
+        lines = [] if self.id is None else [f"id: {self.id}"]
+        if self.event:
+            lines.append(f"event: {self.event}")
+        # A newline inside the payload would end the field; split into data lines instead
+        lines.extend(f"data: {line}" for line in self.data.split("\n"))
+        return "\n".join(lines) + "\n\n"
+
+
+class StreamBuffer:
+    """Recent events of one stream; older events fall off once the per-stream caps are hit."""
+
+    def __init__(self, stream_id: str, max_events: int, max_bytes: int):
+        self.stream_id = stream_id
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.events: Deque[SseEvent] = deque()
+        self.bytes = 0
+        self.next_id = 1
+        self.done = False
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.readers = 0
+        self.abandoned = False
+        self.orphan_timer: Optional[asyncio.TimerHandle] = None
+        self._changed = asyncio.Event()
+
+    def append(self, data: str, event: Optional[str] = None) -> int:
+        item = SseEvent(self.next_id, data, event)
+        self.next_id += 1
+        self.events.append(item)
+        self.bytes += item.size
+        while len(self.events) > 1 and (len(self.events) > self.max_events or self.bytes > self.max_bytes):
+            self.drop_oldest()
+        self._notify()
+        return item.size
+
+    def drop_oldest(self) -> int:
+        item = self.events.popleft()
+        self.bytes -= item.size
+        return item.size
+
+    def finish(self) -> None:
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    def _notify(self) -> None:
+        # Wake every waiting reader, then arm a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    @property
+    def first_id(self) -> int:
+        return self.events[0].id if self.events else self.next_id
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait for the next appended event; False when `timeout` passed first."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class StreamBufferRegistry:
+    """
+    Runs SSE-mode streams in the background and keeps their recent events so a
+    dropped client can reconnect with Last-Event-ID and resume without a new LLM call.
+
+    Generation is decoupled from the HTTP connection: the source stream is driven by
+    a task that appends to the stream's ring buffer, and every SSE response (the first
+    one and any reconnect) is just a reader over that buffer. Finished streams are
+    kept for `ttl` seconds; the total size across streams is capped at `max_total_bytes`
+    (finished streams are evicted first, then the oldest events of active streams).
+    A stream nobody has read for `orphan_timeout` seconds is cancelled (0 keeps it running).
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl: float = 300.0,
+        max_events: int = 5000,
+        max_stream_bytes: int = 1024 * 1024,
+        max_total_bytes: int = 64 * 1024 * 1024,
+        keepalive: float = 15.0,
+        orphan_timeout: float = 30.0,
+    ):
+        self.ttl = ttl
+        self.max_events = max_events
+        self.max_stream_bytes = max_stream_bytes
+        self.max_total_bytes = max_total_bytes
+        self.keepalive = keepalive
+        self.orphan_timeout = orphan_timeout
+        self._buffers: "OrderedDict[str, StreamBuffer]" = OrderedDict()
+        self.total_bytes = 0
+        self.started = 0
+        self.resumed = 0
+        self.evicted = 0
+        self.abandoned = 0
+
+    def start(self, stream: AsyncIterator[str], ndjson: bool = False) -> StreamBuffer:
+        """
+        Drive `stream` in the background. Each chunk becomes one event; for NDJSON
+        streams the trailing newline is dropped, so an event carries one or more lines.
+        """
+        self._expire()
+        buffer = StreamBuffer(uuid.uuid4().hex, self.max_events, self.max_stream_bytes)
+        self._buffers[buffer.stream_id] = buffer
+        buffer.task = asyncio.create_task(self._produce(buffer, stream, ndjson))
+        self.started += 1
+        return buffer
+
+    def get(self, stream_id: str) -> Optional[StreamBuffer]:
+        self._expire()
+        return self._buffers.get(stream_id)
+
+    async def _produce(self, buffer: StreamBuffer, stream: AsyncIterator[str], ndjson: bool) -> None:
+        try:
+            async for chunk in until_stopped(stream, lambda: buffer.abandoned):
+                if ndjson and chunk.endswith("\n"):
+                    chunk = chunk[:-1]
+                self._append(buffer, chunk, None)
+            if buffer.abandoned:
+                # The source swallowed the cancel and was closed at its next chunk instead
+                self._append(buffer, json.dumps({"type": "cancelled"}), "error")
+        except asyncio.CancelledError:
+            self._append(buffer, json.dumps({"type": "cancelled"}), "error")
+            raise
+        except Exception as exc:
+            self._append(buffer, json.dumps({"type": "error", "message": str(exc)}, ensure_ascii=False), "error")
+        finally:
+            self._append(buffer, "{}", "end")
+            buffer.finish()
+
+    def _append(self, buffer: StreamBuffer, data: str, event: Optional[str]) -> None:
+        before = buffer.bytes
+        buffer.append(data, event)
+        self.total_bytes += buffer.bytes - before
+        self._enforce_total()
+
+    def _enforce_total(self) -> None:
+        while self.total_bytes > self.max_total_bytes:
+            finished = next((b for b in self._buffers.values() if b.done), None)
+            if finished is not None:
+                self._remove(finished.stream_id)
+                continue
+            active = next((b for b in self._buffers.values() if len(b.events) > 1), None)
+            if active is None:
+                return
+            self.total_bytes -= active.drop_oldest()
+
+    def _remove(self, stream_id: str) -> None:
+        buffer = self._buffers.pop(stream_id, None)
+        if buffer is not None:
+            self.total_bytes -= buffer.bytes
+            self.evicted += 1
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for stream_id in [s for s, b in self._buffers.items() if b.done and now - b.finished_at > self.ttl]:
+            self._remove(stream_id)
+
+    def _attach(self, buffer: StreamBuffer) -> None:
+        buffer.readers += 1
+        if buffer.orphan_timer is not None:
+            buffer.orphan_timer.cancel()
+            buffer.orphan_timer = None
+
+    def _detach(self, buffer: StreamBuffer) -> None:
+        buffer.readers -= 1
+        if buffer.readers == 0 and not buffer.done and self.orphan_timeout > 0:
+            # Give the client a window to reconnect before the generation is cancelled
+            loop = asyncio.get_running_loop()
+            buffer.orphan_timer = loop.call_later(self.orphan_timeout, self._cancel_orphan, buffer)
+
+    def _cancel_orphan(self, buffer: StreamBuffer) -> None:
+        buffer.orphan_timer = None
+        if buffer.readers == 0 and buffer.task is not None and not buffer.task.done():
+            self.abandoned += 1
+            buffer.abandoned = True
+            buffer.task.cancel()
+
+    async def sse(self, buffer: StreamBuffer, last_event_id: Optional[int] = None) -> AsyncIterator[str]:
+        """Replay buffered events after `last_event_id`, then follow the stream until it ends."""
+        if last_event_id is not None:
+            self.resumed += 1
+        self._attach(buffer)
+        try:
+            async for frame in self._follow(buffer, last_event_id):
+                yield frame
+        finally:
+            self._detach(buffer)
+
+    async def _follow(self, buffer: StreamBuffer, last_event_id: Optional[int]) -> AsyncIterator[str]:
+        cursor = (last_event_id or 0) + 1
+        yield "retry: 2000\n\n"
+        while True:
+            if cursor < buffer.first_id:
+                # Part of what the client missed has already fallen out of the ring buffer
+                gap = {"missing_from": cursor, "resume_from": buffer.first_id}
+                yield SseEvent(None, json.dumps(gap), "truncated").encode()
+                cursor = buffer.first_id
+            # Ids are contiguous, so the unread tail starts at a known offset
+            start = cursor - buffer.first_id
+            for item in [buffer.events[i] for i in range(start, len(buffer.events))]:
+                yield item.encode()
+                cursor = item.id + 1
+            if buffer.done and cursor >= buffer.next_id:
+                return
+            if cursor >= buffer.next_id and not await buffer.wait(self.keepalive):
+                # Comment line keeps idle proxies from closing the connection
+                yield ": keepalive\n\n"
+
+    async def aclose(self) -> None:
+        tasks = [b.task for b in self._buffers.values() if b.task is not None and not b.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        active = sum(1 for b in self._buffers.values() if not b.done)
+        return {
+            "streams": len(self._buffers),
+            "active": active,
+            "bytes": self.total_bytes,
+            "max_total_bytes": self.max_total_bytes,
+            "ttl": self.ttl,
+            "started": self.started,
+            "resumed": self.resumed,
+            "evicted": self.evicted,
+            "abandoned": self.abandoned,
+        }
@@ -0,0 +1,199 @@
+# Pipelined synthesis: start the Synthesizer before the concurrent perspectives finish
+
+import asyncio
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from agent_framework import AgentRunUpdateEvent, ExecutorCompletedEvent, WorkflowOutputEvent
+
+from failover import recovery_marker
+from token_budget import omitted_units
+
+
+class PipelinedSynthesis:
+    """
+    Overlap the synthesis pass with the tail of a ConcurrentBuilder workflow.
+
+    Synthesis starts once every perspective has produced `min_chars` characters
+    (or finished), or once `max_wait` seconds have passed and every perspective has
+    produced something. The Synthesizer then streams from those partial drafts. When
+    the perspectives finish with text the Synthesizer has not seen, a reconciliation
+    turn on the same thread hands over the unseen remainder and the Synthesizer amends
+    its answer, so the final synthesis accounts for the full perspective outputs.
+
+    Drafts pass through `fit` (the synthesis token budget) before `build_prompt`; the
+    parts of a draft that `fit` left out count as unseen and go into the remainder too.
+
+    `run()` yields plain dict events; the endpoint decides how to serialize them:
+      {"kind": "perspective", "agent", "text"}   streaming perspective chunk
+      {"kind": "synthesis_start", "partial"}     Synthesizer started (partial=True when pipelined)
+      {"kind": "synthesis", "text"}              streaming Synthesizer chunk
+      {"kind": "agents_complete", "event_count"} all perspectives finished
+      {"kind": "reconcile_start"}                amending the synthesis with the full outputs
+      {"kind": "synthesis_complete", "chunks"}   Synthesizer finished
+      {"kind": "recovered", "agent", "marker"}   an agent's broken stream was resumed
+    """
+
+    def __init__(
+        self,
+        *,
+        workflow,
+        synthesizer,
+        perspectives: List[str],
+        build_prompt: Callable[[Dict[str, str]], str],
+        build_reconcile_prompt: Callable[[Dict[str, str]], str],
+        fit: Callable[[Dict[str, str]], Dict[str, str]] = dict,
+        min_chars: int = 400,
+        max_wait: float = 3.0,
+    ):
+        self.workflow = workflow
+        self.synthesizer = synthesizer
+        self.perspectives = perspectives
+        self.build_prompt = build_prompt
+        self.build_reconcile_prompt = build_reconcile_prompt
+        self.fit = fit
+        self.min_chars = min_chars
+        self.max_wait = max_wait
+        self.seen_chars: Dict[str, int] = {}
+        # Draft parts the budget kept out of the first synthesis prompt
+        self.omitted: Dict[str, List[str]] = {}
+
+    def _ready(self, texts: Dict[str, List[str]], lengths: Dict[str, int], completed: set, elapsed: float) -> bool:
+        if all(name in completed or lengths[name] >= self.min_chars for name in self.perspectives):
+            return True
+        return elapsed >= self.max_wait and all(lengths[name] > 0 or name in completed for name in self.perspectives)
+
+    async def run(self, prompt: str) -> AsyncIterator[dict]:
+        queue: asyncio.Queue = asyncio.Queue()
+        texts: Dict[str, List[str]] = {name: [] for name in self.perspectives}
+        lengths: Dict[str, int] = {name: 0 for name in self.perspectives}
+        completed: set = set()
+        full_results: Dict[str, str] = {}
+        thread = self.synthesizer.get_new_thread()
+        tasks: List[asyncio.Task] = []
+        start = time.monotonic()
+
+        async def _pump_workflow() -> None:
+            try:
+                async for event in self.workflow.run_stream(prompt):
+                    await queue.put(("workflow", event))
+                await queue.put(("workflow_done", None))
+            except Exception as exc:  # surfaced to the consumer below
+                await queue.put(("error", exc))
+
+        async def _pump_synthesis(synthesis_prompt: str) -> None:
+            try:
+                async for update in self.synthesizer.run_stream(synthesis_prompt, thread=thread):
+                    marker = recovery_marker(update)
+                    if marker:
+                        await queue.put(("recovered", marker))
+                    if update.text:
+                        await queue.put(("synthesis", update.text))
+                await queue.put(("synthesis_done", None))
+            except Exception as exc:
+                await queue.put(("error", exc))
+
+        def _start_synthesis(synthesis_prompt: str) -> None:
+            tasks.append(asyncio.create_task(_pump_synthesis(synthesis_prompt)))
+
+        tasks.append(asyncio.create_task(_pump_workflow()))
+        synthesis_started = False
+        synthesis_running = False
+        reconciled = False
+        workflow_done = False
+        event_count = 0
+        synthesis_chunks = 0
+
+        deadline_checked = False
+        try:
+            while True:
+                timeout: Optional[float] = None
+                if not synthesis_started and not deadline_checked:
+                    timeout = max(0.0, self.max_wait - (time.monotonic() - start))
+                if timeout == 0:
+                    # max_wait is up: check readiness now; after that only new items can change it
+                    kind, payload = "tick", None
+                else:
+                    try:
+                        kind, payload = await asyncio.wait_for(queue.get(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        kind, payload = "tick", None
+                if kind == "tick" and time.monotonic() - start >= self.max_wait:
+                    deadline_checked = True
+
+                if kind == "error":
+                    raise payload
+
+                if kind == "workflow":
+                    event_count += 1
+                    if isinstance(payload, AgentRunUpdateEvent):
+                        agent_name = payload.executor_id
+                        marker = recovery_marker(payload.data)
+                        if marker:
+                            yield {"kind": "recovered", "agent": agent_name, "marker": marker}
+                        if payload.data and hasattr(payload.data, "text") and payload.data.text:
+                            if agent_name in texts:
+                                texts[agent_name].append(payload.data.text)
+                                lengths[agent_name] += len(payload.data.text)
+                            yield {"kind": "perspective", "agent": agent_name, "text": payload.data.text}
+                    elif isinstance(payload, ExecutorCompletedEvent) and payload.executor_id in texts:
+                        completed.add(payload.executor_id)
+                    elif isinstance(payload, WorkflowOutputEvent) and payload.data:
+                        for msg in payload.data:
+                            if hasattr(msg, "author_name") and hasattr(msg, "text"):
+                                full_results[msg.author_name] = msg.text
+
+                elif kind == "workflow_done":
+                    workflow_done = True
+                    completed.update(self.perspectives)
+                    yield {"kind": "agents_complete", "event_count": event_count}
+                    if not synthesis_started:
+                        # Perspectives finished before the threshold: plain (non-pipelined) synthesis
+                        self.seen_chars = {name: len(full_results.get(name, "")) for name in self.perspectives}
+                        synthesis_started = synthesis_running = True
+                        reconciled = True
+                        yield {"kind": "synthesis_start", "partial": False}
+                        _start_synthesis(self.build_prompt(self.fit(
+                            {name: full_results.get(name, "") for name in self.perspectives}
+                        )))
+
+                elif kind == "synthesis":
+                    synthesis_chunks += 1
+                    yield {"kind": "synthesis", "text": payload}
+
+                elif kind == "recovered":
+                    yield {"kind": "recovered", "agent": "Synthesizer", "marker": payload}
+
+                elif kind == "synthesis_done":
+                    synthesis_running = False
+
+                if not synthesis_started and self._ready(texts, lengths, completed, time.monotonic() - start):
+                    drafts = {name: "".join(texts[name]) for name in self.perspectives}
+                    self.seen_chars = {name: len(text) for name, text in drafts.items()}
+                    sent = self.fit(drafts)
+                    self.omitted = {name: omitted_units(drafts[name], sent.get(name, "")) for name in self.perspectives}
+                    synthesis_started = synthesis_running = True
+                    yield {"kind": "synthesis_start", "partial": True}
+                    _start_synthesis(self.build_prompt(sent))
+
+                if workflow_done and synthesis_started and not synthesis_running:
+                    if not reconciled:
+                        reconciled = True
+                        remainders = {
+                            name: "\n".join([
+                                *self.omitted.get(name, []),
+                                full_results.get(name, "")[self.seen_chars.get(name, 0):],
+                            ]).strip()
+                            for name in self.perspectives
+                        }
+                        if any(remainders.values()):
+                            yield {"kind": "reconcile_start"}
+                            synthesis_running = True
+                            _start_synthesis(self.build_reconcile_prompt(self.fit(remainders)))
+                            continue
+                    yield {"kind": "synthesis_complete", "chunks": synthesis_chunks}
+                    return
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
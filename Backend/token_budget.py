@@ -0,0 +1,163 @@
+# Token budget for prompts assembled from agent outputs (estimate + extractive compression)
+
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional; fall back to the character heuristic
+    _ENCODING = None
+
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff66-\uff9f]")
+_WORD = re.compile(r"[A-Za-z0-9]+")
+_SENTENCE_END = re.compile(r"(?<=[。．！？!?])\s*|(?<=\.)\s+")
+_HEADLINE = re.compile(r"^\s*(#{1,6}\s|[-*•・]\s|\d+[.)．]\s|\*\*)")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count locally (tiktoken when installed, otherwise a CJK-aware heuristic)."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    cjk_chars = len(_CJK.findall(text))
+    # ~1 token per CJK character, ~4 characters per token for everything else
+    return cjk_chars + math.ceil((len(text) - cjk_chars) / 4)
+
+
+def _terms(text: str) -> List[str]:
+    lowered = text.lower()
+    terms = _WORD.findall(lowered)
+    cjk = "".join(_CJK.findall(lowered))
+    terms.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return terms
+
+
+def _split_units(text: str) -> List[str]:
+    """Split text into lines, and long prose lines into sentences; headline lines stay whole."""
+    units: List[str] = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        if _HEADLINE.match(line):
+            units.append(line)
+            continue
+        units.extend(part for part in _SENTENCE_END.split(line) if part and part.strip())
+    return units
+
+
+def omitted_units(text: str, sent: str) -> List[str]:
+    """Units of `text` (as compress_text splits it) that do not appear in `sent`."""
+    if text == sent:
+        return []
+    return [unit for unit in _split_units(text) if unit not in sent]
+
+
+@dataclass
+class CompressionReport:
+    name: str
+    tokens_before: int
+    tokens_after: int
+    dropped: List[str] = field(default_factory=list)
+
+    @property
+    def compressed(self) -> bool:
+        return self.tokens_after < self.tokens_before
+
+
+def compress_text(text: str, budget: int, query: str = "") -> Tuple[str, List[str]]:
+    """
+    Extractively shrink `text` to roughly `budget` tokens.
+
+    Headline lines (markdown headings, bullets, numbered items) are kept first, then
+    the remaining sentences ranked by position and by overlap with the query and
+    the text's own frequent terms. Kept units are emitted in their original order.
+    Returns the compressed text and the list of dropped units.
+    """
+    if estimate_tokens(text) <= budget:
+        return text, []
+
+    units = _split_units(text)
+    costs = [estimate_tokens(unit) + 1 for unit in units]
+    query_terms = set(_terms(query))
+    frequency = Counter(term for unit in units for term in set(_terms(unit)))
+
+    def score(index: int) -> float:
+        unit_terms = set(_terms(units[index]))
+        if not unit_terms:
+            return 0.0
+        centrality = sum(frequency[term] for term in unit_terms) / len(unit_terms)
+        relevance = len(unit_terms & query_terms)
+        position = 1.0 / (1 + index)
+        headline = 3.0 if _HEADLINE.match(units[index]) else 0.0
+        return headline + relevance + 0.1 * centrality + position
+
+    order = sorted(range(len(units)), key=score, reverse=True)
+    kept, used = set(), 0
+    for index in order:
+        if used + costs[index] <= budget:
+            kept.add(index)
+            used += costs[index]
+
+    if not kept:
+        # No unit fits on its own (e.g. one huge unbroken paragraph): truncate proportionally
+        cut = max(0, int(len(text) * budget / max(estimate_tokens(text), 1)))
+        return text[:cut], [text[cut:]]
+
+    compressed = "\n".join(units[i] for i in range(len(units)) if i in kept)
+    dropped = [units[i] for i in range(len(units)) if i not in kept]
+    return compressed, dropped
+
+
+class TokenBudget:
+    """
+    Enforce a token cap on a set of named sections (e.g. the perspectives pasted
+    into the synthesis prompt).
+
+    The cap is shared: sections under their fair share give the surplus to the
+    others, and only the sections that still exceed their allotment are compressed.
+    """
+
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+
+    def fit(self, sections: Dict[str, str], query: str = "") -> Tuple[Dict[str, str], List[CompressionReport]]:
+        tokens = {name: estimate_tokens(text) for name, text in sections.items()}
+        if self.max_tokens <= 0 or sum(tokens.values()) <= self.max_tokens:
+            return dict(sections), []
+
+        # Water-filling: small sections keep everything, large ones split what is left
+        allotment: Dict[str, int] = {}
+        remaining_budget = self.max_tokens
+        pending = sorted(sections, key=lambda name: tokens[name])
+        while pending:
+            share = remaining_budget // len(pending)
+            name = pending[0]
+            if tokens[name] <= share:
+                allotment[name] = tokens[name]
+                remaining_budget -= tokens[name]
+                pending.pop(0)
+            else:
+                for name in pending:
+                    allotment[name] = share
+                break
+
+        fitted: Dict[str, str] = {}
+        reports: List[CompressionReport] = []
+        for name, text in sections.items():
+            if tokens[name] <= allotment[name]:
+                fitted[name] = text
+                continue
+            compressed, dropped = compress_text(text, allotment[name], query)
+            fitted[name] = compressed
+            reports.append(CompressionReport(
+                name=name,
+                tokens_before=tokens[name],
+                tokens_after=estimate_tokens(compressed),
+                dropped=dropped,
+            ))
+        return fitted, reports
@@ -216,8 +216,10 @@ PLAN_READY: 上記プランで実行準備完了
         
         # 検索ツールメッセージ
         'search_empty_query': "検索クエリが空です。有効な検索語句を入力してください。",
+        'search_not_configured': "検索サービスが設定されていないため、参照情報を検索できません。",
         'search_no_results': "「{query}」に関連する参照情報が見つかりませんでした。別のキーワードで検索してください。",
         'search_error': "検索エラー: {error}",
+        'search_timeout': "検索がタイムアウトしました（{timeout}秒）。しばらくしてから再度お試しください。",
         'search_file_label': "ファイル名",
         'search_content_label': "内容",
         
@@ -233,6 +235,33 @@ PLAN_READY: 上記プランで実行準備完了
         'log_request_parsed': "⏱️ リクエスト解析完了 ({time}ms)",
         'log_model_selected': "🧠 モデル選択: {model} -> デプロイメント: {deployment}",
         'log_model_info': "🧠 model={model}",
+        'log_pool_ready': "🔌 接続プール準備完了 (デプロイメント数: {count}, 最大接続数: {max_connections}, keep-alive: {keepalive})",
+        'log_pool_warmup_done': "🔥 接続プールのウォームアップ完了 (接続数: {count}, {time}ms)",
+        'log_pool_warmup_failed': "⚠️ 接続プールのウォームアップに失敗しました: {error}",
+        'log_mock_llm_enabled': "🧪 MOCK_LLM が有効です: Azure OpenAI の代わりにローカルのモッククライアントが応答します",
+        'log_local_search_indexed': "📚 ローカル検索インデックスを更新しました (変更 {changed} 件, 削除 {removed} 件, パッセージ {docs} 件, 語 {terms} 件, {time}ms)",
+        'log_local_search_read_failed': "⚠️ {path} を読み込めないためインデックスから除外します: {error}",
+        'log_local_search_update_failed': "⚠️ ローカル検索インデックスの更新に失敗しました: {error}",
+        'log_replay_ready': "📼 録画 {count} 件を読み込みました ({directory})",
+        'log_replay_session': "📼 録画 {id} を再生します (速度 x{speed})",
+        'log_recording_failed': "⚠️ 録画ファイル {path} を読み書きできません: {error}",
+        'log_hedge_fired': "🏁 {waited}s 経っても最初のトークンが来ないため {alternate} にもリクエスト ({deployment})",
+        'log_hedge_won': "🏁 ヘッジ先 {alternate} が先に応答しました ({deployment} はキャンセル)",
+        'log_breaker_state': "🔌 {deployment} のサーキットブレーカーが {state} になりました",
+        'log_failover_retry': "🔁 {deployment} の呼び出しを {target} で再試行 ({attempt} 回目): {error}",
+        'log_failover_served': "🔀 {deployment} の代わりに {target} が応答しました",
+        'log_stream_recovering': "🩹 {deployment} のストリームが {chars} 文字で途切れたため続きから再開します: {error}",
+        'log_stream_recovered': "🩹 {deployment} で途切れた応答を {target} が続きから生成しています",
+        'stream_recovery_instructions': "直前のあなたの回答は途中で途切れました。途切れた箇所の直後から、前置きや繰り返しをせずにそのまま続けてください。",
+        'error_deployment_unavailable': "{deployment} は現在利用できません。しばらくしてから再度お試しください",
+        'error_stream_processing': "応答の生成中にエラーが発生しました: {error}",
+        'log_agent_templates_ready': "🧩 エージェントテンプレート準備完了: キー {keys} 件, 事前構築ワークフロー {workflows} 件",
+        'log_admission_queued': "⏳ 実行待ちキュー: {position} 番目",
+        'log_admission_rejected': "🚦 デプロイメント {deployment} が過負荷のため拒否 (Retry-After: {retry_after}秒)",
+        'error_overloaded': "混雑しています。しばらくしてから再度お試しください",
+        'log_batch_submitted': "📦 バッチジョブ {job_id}: {count} 件を実行キューに追加 (合計 {total} 件)",
+        'log_batch_item_failed': "📦 バッチジョブ {job_id}: 項目 {id} が失敗しました: {error}",
+        'log_batch_complete': "📦 バッチジョブ {job_id} 完了 (成功: {succeeded}, 失敗: {failed})",
         'log_agent_creating': "🤖 エージェント作成開始",
         'log_agent_created': "⏱️ エージェント作成完了 ({time}ms)",
         'log_search_agent_creating': "🤖 検索エージェント作成開始",
@@ -240,7 +269,10 @@ PLAN_READY: 上記プランで実行準備完了
         'log_streaming_start': "🌊 ストリーミング開始 (プロンプト長: {length}文字)",
         'log_first_chunk': "⏱️ 最初のチャンク受信 (TTFB: {time}ms)",
         'log_completed': "✅ 完了 (総時間: {time}s, チャンク数: {count})",
+        'log_response_cache_hit': "⚡ レスポンスキャッシュヒット (チャンク数: {count})",
+        'log_similar_cache_hit': "⚡ 類似プロンプトキャッシュヒット (類似度: {similarity}, 一致: {prompt})",
         'log_search_success': "検索成功: {count}件の結果",
+        'log_search_cache_hit': "⚡ 検索キャッシュヒット",
         'log_guideline_request': "⏱️ RAG検索リクエスト受信",
         'log_multi_agent_request': "⏱️ マルチエージェントリクエスト受信",
         'log_idobata_request': "⏱️ AI役員会議リクエスト受信",
@@ -256,17 +288,40 @@ PLAN_READY: 上記プランで実行準備完了
         'log_parallel_execution_start': "🌊 並列エージェント実行開始 (プロンプト長: {length}文字)",
         'log_parallel_execution_complete': "⏱️ 並列エージェント完了 ({time}s, イベント数: {count})",
         'log_synthesis_start': "🔄 統合フェーズ開始",
+        'log_budget_compressed': "✂️ 統合入力を圧縮: {name} {before}→{after}トークン (削除: {dropped}文)",
+        'log_pipeline_synthesis_start': "🔀 パイプライン統合開始 (開始まで: {time}s, 参照文字数: {chars})",
+        'log_pipeline_reconcile': "🔄 完全な視点出力で統合結果を補正中",
         'log_synthesis_complete': "⏱️ 統合完了 ({time}s, チャンク数: {count})",
         'log_overall_complete': "✅ 全体完了 (総時間: {time}s)",
         
         # AI役員会議関連
         'log_board_workflow_building': "🔄 ワークフロー構築開始（新規作成, id={id}）",
         'log_board_workflow_built': "✅ ワークフロー構築完了（会話履歴なし・クリーンな状態, id={id}）",
+        'log_board_mode': "🧭 会議モード: {mode}",
+        'log_flow_definition_invalid': "❌ ワークフロー定義を読み込めません ({file}): {error}",
+        'log_flows_loaded': "📚 ワークフロー定義を読み込みました: {names}",
+        'log_flow_request': "🧩 フロー「{name}」のリクエストを受信 (ステージ: {levels})",
+        'log_flow_complete': "✅ フロー「{name}」完了 ({time}s, イベント数: {count})",
+        'flow_synthesis_input': """
+次の2つの視点を統合し、バランスの取れた分析を提示してください。
+
+元の質問: {prompt}
+
+批判的な視点:
+{CriticalAnalyst}
+
+肯定的な視点:
+{PositiveAdvocate}
+""",
         'log_board_workflow_start': "🌊 プランニングワークフロー開始 (プロンプト長: {length}文字)",
         'log_board_complete': "✅ AI役員会議完了 ({workflow_time}s, イベント数: {count}, 総時間: {total_time}s)",
         'warning_max_rounds': "⚠️ 最大ラウンド数({max})に達しました",
-        'warning_max_selector_calls': "⚠️ selector呼び出し上限({max})に達しました",
+        'log_speakers_exhausted': "✅ 全員の発言が完了しました",
         'log_plan_ready': "✅ プランが完成しました",
+        'log_context_condensed': "🗜️ 会議履歴を要約: {turns}発言を要約・直近{kept}発言を保持 ({before}→{after}トークン, {source})",
+        'log_context_summary_fallback': "⚠️ 要約モデルが使えないため抽出要約を使用します: {error}",
+        'context_summary_label': "【これまでの議論の要約】（古い発言は要約済み。直近の発言はこの後に続きます）",
+        'context_summary_instructions': "あなたは経営会議の書記です。これまでの要約と新しい発言をもとに、更新された要約を{max_tokens}トークン以内で作成してください。発言者ごとに「発言者: 要点」の形式で1行ずつ書き、決定事項・数値・リスク・未解決の論点を優先し、新しい情報は追加しないでください。",
         
         # トーン設定
         'tone_formal': "\n\n【話し方】堅実で公式的な表現を使用してください。敬語を徹底し、専門用語を正確に使います。",
@@ -490,8 +545,10 @@ Present a concrete executable plan.""",
         
         # Search Tool Messages
         'search_empty_query': "Search query is empty. Please enter a valid search term.",
+        'search_not_configured': "Search is not configured, so no references can be looked up.",
         'search_no_results': "No references related to \"{query}\" were found. Please try a different keyword.",
         'search_error': "Search error: {error}",
+        'search_timeout': "Search timed out ({timeout}s). Please try again later.",
         'search_file_label': "File name",
         'search_content_label': "Content",
         
@@ -507,6 +564,33 @@ Present a concrete executable plan.""",
         'log_request_parsed': "⏱️ Request parsed ({time}ms)",
         'log_model_selected': "🧠 Model selected: {model} -> Deployment: {deployment}",
         'log_model_info': "🧠 model={model}",
+        'log_pool_ready': "🔌 Connection pool ready (deployments: {count}, max connections: {max_connections}, keep-alive: {keepalive})",
+        'log_pool_warmup_done': "🔥 Connection pool warmed up (connections: {count}, {time}ms)",
+        'log_pool_warmup_failed': "⚠️ Connection pool warmup failed: {error}",
+        'log_mock_llm_enabled': "🧪 MOCK_LLM is enabled: a local mock client answers instead of Azure OpenAI",
+        'log_local_search_indexed': "📚 Local search index updated ({changed} changed, {removed} removed, {docs} passages, {terms} terms, {time}ms)",
+        'log_local_search_read_failed': "⚠️ Cannot read {path}; leaving it out of the index: {error}",
+        'log_local_search_update_failed': "⚠️ Local search index update failed: {error}",
+        'log_replay_ready': "📼 Loaded {count} recordings ({directory})",
+        'log_replay_session': "📼 Replaying recording {id} (speed x{speed})",
+        'log_recording_failed': "⚠️ Cannot read or write recording {path}: {error}",
+        'log_hedge_fired': "🏁 No first token after {waited}s, also sending the request to {alternate} ({deployment})",
+        'log_hedge_won': "🏁 Hedge {alternate} answered first ({deployment} cancelled)",
+        'log_breaker_state': "🔌 Circuit breaker of {deployment} is now {state}",
+        'log_failover_retry': "🔁 Retrying {deployment} call on {target} (attempt {attempt}): {error}",
+        'log_failover_served': "🔀 {target} answered in place of {deployment}",
+        'log_stream_recovering': "🩹 Stream of {deployment} broke after {chars} characters; resuming from the partial answer: {error}",
+        'log_stream_recovered': "🩹 {target} is continuing the answer interrupted on {deployment}",
+        'stream_recovery_instructions': "Your previous answer was cut off. Continue exactly where it stopped, without any preamble and without repeating what you already wrote.",
+        'error_deployment_unavailable': "{deployment} is currently unavailable. Please try again later",
+        'error_stream_processing': "An error occurred while generating the response: {error}",
+        'log_agent_templates_ready': "🧩 Agent templates ready: {keys} keys, {workflows} prebuilt workflows",
+        'log_admission_queued': "⏳ Waiting in admission queue: position {position}",
+        'log_admission_rejected': "🚦 Rejected, deployment {deployment} is overloaded (Retry-After: {retry_after}s)",
+        'error_overloaded': "The service is busy. Please try again shortly",
+        'log_batch_submitted': "📦 Batch job {job_id}: queued {count} items ({total} in total)",
+        'log_batch_item_failed': "📦 Batch job {job_id}: item {id} failed: {error}",
+        'log_batch_complete': "📦 Batch job {job_id} complete (succeeded: {succeeded}, failed: {failed})",
         'log_agent_creating': "🤖 Creating agent",
         'log_agent_created': "⏱️ Agent created ({time}ms)",
         'log_search_agent_creating': "🤖 Creating search agent",
@@ -514,7 +598,10 @@ Present a concrete executable plan.""",
         'log_streaming_start': "🌊 Streaming started (prompt length: {length} chars)",
         'log_first_chunk': "⏱️ First chunk received (TTFB: {time}ms)",
         'log_completed': "✅ Completed (total time: {time}s, chunks: {count})",
+        'log_response_cache_hit': "⚡ Response cache hit (chunks: {count})",
+        'log_similar_cache_hit': "⚡ Similar prompt cache hit (similarity: {similarity}, matched: {prompt})",
         'log_search_success': "Search successful: {count} results",
+        'log_search_cache_hit': "⚡ Search cache hit",
         'log_guideline_request': "⏱️ RAG search request received",
         'log_multi_agent_request': "⏱️ Multi-agent request received",
         'log_idobata_request': "⏱️ AI board meeting request received",
@@ -530,17 +617,40 @@ Present a concrete executable plan.""",
         'log_parallel_execution_start': "🌊 Parallel agent execution started (prompt length: {length} chars)",
         'log_parallel_execution_complete': "⏱️ Parallel agents completed ({time}s, events: {count})",
         'log_synthesis_start': "🔄 Synthesis phase started",
+        'log_budget_compressed': "✂️ Synthesis input compressed: {name} {before}→{after} tokens (dropped: {dropped} sentences)",
+        'log_pipeline_synthesis_start': "🔀 Pipelined synthesis started ({time}s after start, chars seen: {chars})",
+        'log_pipeline_reconcile': "🔄 Reconciling synthesis with the full perspective outputs",
         'log_synthesis_complete': "⏱️ Synthesis completed ({time}s, chunks: {count})",
         'log_overall_complete': "✅ Overall complete (total time: {time}s)",
         
         # AI Board Meeting related
         'log_board_workflow_building': "🔄 Building workflow (new instance, id={id})",
         'log_board_workflow_built': "✅ Workflow built (clean state with no history, id={id})",
+        'log_board_mode': "🧭 Meeting mode: {mode}",
+        'log_flow_definition_invalid': "❌ Cannot load workflow definition ({file}): {error}",
+        'log_flows_loaded': "📚 Workflow definitions loaded: {names}",
+        'log_flow_request': "🧩 Flow '{name}' request received (stages: {levels})",
+        'log_flow_complete': "✅ Flow '{name}' completed ({time}s, events: {count})",
+        'flow_synthesis_input': """
+Integrate the following two perspectives to provide a balanced analysis.
+
+Original question: {prompt}
+
+Critical perspective:
+{CriticalAnalyst}
+
+Positive perspective:
+{PositiveAdvocate}
+""",
         'log_board_workflow_start': "🌊 Planning workflow started (prompt length: {length} chars)",
         'log_board_complete': "✅ AI board meeting completed ({workflow_time}s, events: {count}, total: {total_time}s)",
         'warning_max_rounds': "⚠️ Maximum rounds ({max}) reached",
-        'warning_max_selector_calls': "⚠️ Maximum selector calls ({max}) reached",
+        'log_speakers_exhausted': "✅ Every participant has spoken",
         'log_plan_ready': "✅ Plan is ready",
+        'log_context_condensed': "🗜️ Condensed meeting history: {turns} turns summarized, latest {kept} kept ({before}→{after} tokens, {source})",
+        'log_context_summary_fallback': "⚠️ Summary model unavailable, using extractive summary: {error}",
+        'context_summary_label': "[Summary of the discussion so far] (older turns are condensed; the latest turns follow)",
+        'context_summary_instructions': "You are the secretary of a management meeting. From the summary so far and the new turns, write an updated summary of at most {max_tokens} tokens. Write one line per speaker as \"Speaker: key points\", prioritize decisions, figures, risks and open questions, and do not add new information.",
         
         # Tone settings
         'tone_formal': "\n\n【Speaking Style】Use formal and official expressions. Maintain strict honorifics and use technical terms accurately.",
@@ -0,0 +1,209 @@
+# Declarative multi-agent flows: agents, inputs and dependencies loaded from JSON/YAML definitions
+
+import json
+import logging
+import os
+import string
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from agent_templates import AgentSpec, FlowDefinition
+from dag_workflow import InputRenderer, build_dag_workflow, topological_order
+from token_budget import TokenBudget
+from translations import get_text, translations
+
+try:
+    import yaml
+except ImportError:  # PyYAML is optional; JSON definitions always work
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+
+class WorkflowDefinitionError(ValueError):
+    """A definition file that cannot be turned into a flow."""
+
+
+@dataclass(frozen=True)
+class StageSpec:
+    """One agent of a declarative flow."""
+
+    name: str
+    # translations.py key of the agent's instructions
+    instructions: str
+    description: Optional[str] = None
+    depends_on: Tuple[str, ...] = ()
+    # translations.py key of a prompt template ({prompt} plus one field per dependency);
+    # without it the agent continues the (merged) conversation of its dependencies
+    input: Optional[str] = None
+    # Token cap for the dependency outputs pasted into `input` (0 = no cap)
+    max_input_tokens: int = 0
+    tools: Tuple[str, ...] = ()
+
+
+@dataclass
+class WorkflowDefinition:
+    """
+    A flow as data. Stages only declare what they depend on; the scheduler runs each
+    stage as soon as its dependencies are done, so independent stages are concurrent.
+
+        name: perspectives
+        stages:
+          - name: CriticalAnalyst
+            instructions: agent_critical_instructions
+          - name: PositiveAdvocate
+            instructions: agent_positive_instructions
+          - name: Synthesizer
+            instructions: agent_synthesizer_instructions
+            depends_on: [CriticalAnalyst, PositiveAdvocate]
+            input: flow_synthesis_input
+    """
+
+    name: str
+    stages: List[StageSpec]
+    description: str = ""
+    # Instructions take the {tone_suffix} of the request's tone
+    uses_tone: bool = False
+    source: str = ""
+
+    @property
+    def order(self) -> List[str]:
+        return [stage.name for stage in self.stages]
+
+    @property
+    def dependencies(self) -> Dict[str, Tuple[str, ...]]:
+        return {stage.name: stage.depends_on for stage in self.stages}
+
+    def levels(self) -> List[List[str]]:
+        """Stages grouped by depth in the graph; each group runs concurrently."""
+        dependencies = self.dependencies
+        depth: Dict[str, int] = {}
+        for name in topological_order(self.order, dependencies):
+            depth[name] = 1 + max((depth[dep] for dep in dependencies[name]), default=-1)
+        levels: List[List[str]] = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+        for name in self.order:
+            levels[depth[name]].append(name)
+        return levels
+
+    def input_renderers(self, language: str) -> Dict[str, InputRenderer]:
+        renderers = {}
+        for stage in self.stages:
+            if stage.input:
+                renderers[stage.name] = _renderer(stage, language)
+        return renderers
+
+    def flow_definition(self, language: str, tools: Dict[str, Callable]) -> FlowDefinition:
+        """The FlowDefinition the agent template registry builds agents and workflows from."""
+        agents = [
+            AgentSpec(
+                stage.name,
+                stage.instructions,
+                stage.description,
+                tools=tuple(tools[tool] for tool in stage.tools),
+                parallel_tool_calls=True,
+            )
+            for stage in self.stages
+        ]
+        inputs = self.input_renderers(language)
+        return FlowDefinition(
+            agents=agents,
+            build_workflow=lambda built, state: build_dag_workflow(built, self.order, self.dependencies, inputs),
+            uses_tone=self.uses_tone,
+        )
+
+
+def _renderer(stage: StageSpec, language: str) -> InputRenderer:
+    budget = TokenBudget(stage.max_input_tokens) if stage.max_input_tokens > 0 else None
+
+    def render(prompt: str, outputs: Dict[str, str]) -> str:
+        outputs = {name: outputs.get(name, "") for name in stage.depends_on}
+        if budget is not None:
+            outputs, _ = budget.fit(outputs, query=prompt)
+        return get_text(stage.input, language, prompt=prompt, **outputs)
+
+    return render
+
+
+def parse_definition(data: dict, language: str, tools: Dict[str, Callable], source: str = "") -> WorkflowDefinition:
+    """Validate a decoded definition against the translations and known tools."""
+    if not isinstance(data, dict):
+        raise WorkflowDefinitionError(f"{source}: a definition must be a mapping")
+    name = data.get("name") or os.path.splitext(os.path.basename(source))[0]
+    if not name or not str(name).replace("_", "").replace("-", "").isalnum():
+        raise WorkflowDefinitionError(f"{source}: invalid flow name {name!r}")
+    texts = translations.get(language, translations["ja"])
+
+    stages: List[StageSpec] = []
+    for raw in data.get("stages") or []:
+        stage = StageSpec(
+            name=str(raw.get("name", "")),
+            instructions=str(raw.get("instructions", "")),
+            description=raw.get("description"),
+            depends_on=tuple(raw.get("depends_on") or ()),
+            input=raw.get("input"),
+            max_input_tokens=int(raw.get("max_input_tokens") or 0),
+            tools=tuple(raw.get("tools") or ()),
+        )
+        if not stage.name.isidentifier():
+            # Stage names double as template fields ({CriticalAnalyst}) and executor ids
+            raise WorkflowDefinitionError(f"{source}: invalid stage name {stage.name!r}")
+        if stage.instructions not in texts:
+            raise WorkflowDefinitionError(f"{source}: {stage.name}: unknown instructions key {stage.instructions!r}")
+        if stage.input:
+            if stage.input not in texts:
+                raise WorkflowDefinitionError(f"{source}: {stage.name}: unknown input key {stage.input!r}")
+            fields = {field for _, field, _, _ in string.Formatter().parse(texts[stage.input]) if field}
+            missing = fields - {"prompt", *stage.depends_on}
+            if missing:
+                raise WorkflowDefinitionError(f"{source}: {stage.name}: {stage.input!r} needs {sorted(missing)}")
+        unknown_tools = set(stage.tools) - set(tools)
+        if unknown_tools:
+            raise WorkflowDefinitionError(f"{source}: {stage.name}: unknown tools {sorted(unknown_tools)}")
+        stages.append(stage)
+
+    if not stages:
+        raise WorkflowDefinitionError(f"{source}: no stages")
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise WorkflowDefinitionError(f"{source}: duplicate stage names")
+    try:
+        topological_order(names, {stage.name: stage.depends_on for stage in stages})
+    except ValueError as exc:
+        raise WorkflowDefinitionError(f"{source}: {exc}") from exc
+
+    return WorkflowDefinition(
+        name=str(name),
+        stages=stages,
+        description=str(data.get("description") or ""),
+        uses_tone=bool(data.get("uses_tone", False)),
+        source=source,
+    )
+
+
+def load_definitions(directory: str, language: str, tools: Dict[str, Callable]) -> Dict[str, WorkflowDefinition]:
+    """Load every *.json / *.yaml / *.yml in `directory`; invalid files are logged and skipped."""
+    definitions: Dict[str, WorkflowDefinition] = {}
+    if not os.path.isdir(directory):
+        return definitions
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        extension = os.path.splitext(filename)[1].lower()
+        if extension not in (".json", ".yaml", ".yml"):
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                if extension == ".json":
+                    data = json.load(f)
+                elif yaml is None:
+                    raise WorkflowDefinitionError(f"{path}: PyYAML is not installed")
+                else:
+                    data = yaml.safe_load(f)
+            definition = parse_definition(data, language, tools, source=path)
+        except Exception as exc:  # unreadable, malformed or invalid: skip this file only
+            logger.error(get_text('log_flow_definition_invalid', language, file=filename, error=str(exc)))
+            continue
+        if definition.name in definitions:
+            logger.error(get_text('log_flow_definition_invalid', language, file=filename, error=f"duplicate flow {definition.name!r}"))
+            continue
+        definitions[definition.name] = definition
+    return definitions
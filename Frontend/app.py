@@ -4,11 +4,15 @@ import json
 import asyncio
 import time
 import logging
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Callable, Iterator, Optional
 import os
 from dotenv import load_dotenv
 
+import metrics
+from stream_protocol import StreamDecoder
+
 load_dotenv()
 
 # Logging configuration
@@ -32,10 +36,30 @@ def _env_bool(name: str, default: bool = False) -> bool:
 
 
 app.config['ENABLE_DI_LINK'] = _env_bool('ENABLE_DI_LINK', False)
+# Model names used as the `model` metrics label; any other requested model is labelled "other"
+app.config['METRICS_MODELS'] = {
+    name.strip()
+    for name in os.getenv('METRICS_MODELS', 'gpt-4.1,gpt-4.1-mini,gpt-4.1-nano,gpt-5.2,gpt-5.2-chat').split(',')
+    if name.strip()
+}
 
 # Session storage (use Redis in production)
 messages_store = {}
 
+# Stored message field of each agent's text
+MULTI_AGENT_FIELDS = {
+    'CriticalAnalyst': 'critical_content',
+    'PositiveAdvocate': 'positive_content',
+    'Synthesizer': 'synthesis_content',
+}
+# Backend (/api/phase1/stream) returns CEO/CTO/CFO/COO
+BOARD_FIELDS = {
+    'CEO': 'planning_content',
+    'CTO': 'tech_content',
+    'CFO': 'business_content',
+    'COO': 'synthesis_content',
+}
+
 
 FRONT_TEXT = {
     "ja": {
@@ -54,6 +78,7 @@ FRONT_TEXT = {
         "label_idobata": "🗣️ [井戸端会議]",
         "error_block": "\n\n❌ エラー: {error}",
         "error_inline": "❌ エラー: {error}",
+        "log_front_upstream_closed": "🔌 ブラウザが切断したため、バックエンドのストリームを閉じます ({path})",
     },
     "en": {
         "log_front_request_received": "📨 Frontend: Request received (model={model})",
@@ -71,6 +96,7 @@ FRONT_TEXT = {
         "label_idobata": "🗣️ [AI Board Meeting]",
         "error_block": "\n\n❌ Error: {error}",
         "error_inline": "❌ Error: {error}",
+        "log_front_upstream_closed": "🔌 Browser disconnected; closing the backend stream ({path})",
     },
 }
 
@@ -83,6 +109,124 @@ def front_text(key: str, **kwargs) -> str:
     return template.format(**kwargs)
 
 
+def metrics_model(model: Optional[str]) -> str:
+    """Bounded `model` label for the relay metrics (the model name comes from the browser)."""
+    return model if model in app.config['METRICS_MODELS'] else 'other'
+
+
+@contextmanager
+def backend_stream(
+    path: str, payload: Optional[dict], timeout: float, headers: Optional[dict] = None, method: str = 'POST'
+) -> Iterator[httpx.Response]:
+    """
+    Streamed request to the backend. The response is closed on every way out of the
+    relay generator, including the GeneratorExit raised when the browser goes away,
+    so the backend sees the disconnect and cancels the run behind the stream.
+    """
+    with httpx.Client(timeout=timeout) as client:
+        upstream = client.build_request(method, f"{app.config['BACKEND_URL']}{path}", json=payload, headers=headers)
+        response = client.send(upstream, stream=True)
+        try:
+            yield response
+        except GeneratorExit:
+            logger.info(front_text('log_front_upstream_closed', path=path))
+            raise
+        finally:
+            response.close()
+
+
+def wants_sse() -> bool:
+    """Whether the browser asked for the backend's resumable SSE mode (same test as the backend's)."""
+    return 'text/event-stream' in request.headers.get('Accept', '') or request.args.get('transport') == 'sse'
+
+
+def sse_lines(response: httpx.Response, on_data: Callable[[str], None]) -> Iterator[str]:
+    """Relay an SSE response line by line, unchanged; `on_data` gets the payload of every plain data event."""
+    event, data = None, []
+    for line in response.iter_lines():
+        yield line + '\n'
+        if not line:
+            if data and event is None:
+                on_data('\n'.join(data))
+            event, data = None, []
+        elif line.startswith('data:'):
+            data.append(line[6:] if line.startswith('data: ') else line[5:])
+        elif line.startswith('event:'):
+            event = line[6:].strip()
+
+
+def relay_sse(
+    path: str,
+    payload: Optional[dict],
+    timeout: float,
+    stream_metrics: metrics.StreamMetrics,
+    on_data: Optional[Callable[[str], None]] = None,
+    on_done: Optional[Callable[[], None]] = None,
+    method: str = 'POST',
+    headers: Optional[dict] = None,
+):
+    """
+    Pass a backend SSE stream through to the browser as-is. The backend is called
+    before the response starts so its X-Stream-Id / Content-Location headers reach
+    the browser, which resumes a broken stream via /api/streams/<id> (Last-Event-ID).
+    """
+    stack = ExitStack()
+    try:
+        upstream = stack.enter_context(backend_stream(
+            path, payload, timeout, headers={**(headers or {}), 'Accept': 'text/event-stream'}, method=method
+        ))
+    except httpx.HTTPError as e:
+        stack.close()
+        stream_metrics.error(type(e).__name__)
+        return jsonify({'error': str(e)}), 502
+    if upstream.status_code >= 400:
+        body = upstream.read()
+        stack.close()
+        return Response(body, status=upstream.status_code, content_type=upstream.headers.get('content-type'))
+    passed = {
+        name: upstream.headers[name]
+        for name in ('X-Stream-Id', 'Content-Location', 'Cache-Control', 'X-Stream-Protocol')
+        if name in upstream.headers
+    }
+
+    def generate():
+        with stack:
+            try:
+                yield from sse_lines(upstream, on_data or (lambda data: None))
+            except httpx.HTTPError as e:
+                # No error frame: the browser reconnects to /api/streams/<id> and picks up from its Last-Event-ID
+                stream_metrics.error(type(e).__name__)
+        if on_done is not None:
+            on_done()
+
+    response = Response(
+        stream_with_context(stream_metrics.observe(generate())),
+        content_type=upstream.headers.get('content-type', 'text/event-stream'),
+        headers=passed,
+    )
+    # Also closes the backend stream when the response is dropped before the generator ever ran
+    response.call_on_close(stack.close)
+    return response
+
+
+def track_agents(stream_metrics: metrics.StreamMetrics, ai_message: dict, fields: dict) -> Callable[[str], None]:
+    """`on_data` for relayed NDJSON agent events: adds each agent's text to its field of `ai_message`."""
+    decoder = StreamDecoder()
+
+    def on_data(line: str) -> None:
+        try:
+            delta = decoder.delta(line)
+        except ValueError:
+            return
+        if delta is not None:
+            agent, content = delta
+            stream_metrics.chunk(agent)
+            if agent in fields:
+                ai_message[fields[agent]] += content
+
+    return on_data
+
+
 @app.route('/')
 def index():
     """Main page"""
@@ -91,6 +235,13 @@ def index():
     return render_template('index.html', language=language, enable_di_link=enable_di_link)
 
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics of the streaming relay"""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
 @app.route('/api/messages', methods=['GET'])
 def get_messages():
     """Get message history"""
@@ -134,6 +285,24 @@ def chat_stream():
         'timestamp': datetime.now().isoformat()
     }
     messages_store[session_id].append(user_message)
+    stream_metrics = metrics.StreamMetrics('/api/chat/stream', metrics_model(model))
+
+    if wants_sse():
+        parts = []
+
+        def on_data(text):
+            stream_metrics.chunk()
+            parts.append(text)
+
+        def on_done():
+            messages_store[session_id].append({
+                'is_user': False,
+                'content': ''.join(parts),
+                'timestamp': datetime.now().isoformat(),
+                'is_streaming': False
+            })
+
+        return relay_sse('/api/stream', {'prompt': prompt, 'model': model}, 60.0, stream_metrics, on_data, on_done)
     
     def generate():
         """Generate streaming response"""
@@ -141,25 +310,21 @@ def chat_stream():
         try:
             backend_request_start = time.time()
             logger.info(f"[{request_id}] {front_text('log_front_send_backend', model=model)}")
-            with httpx.Client(timeout=60.0) as client:
-                with client.stream(
-                    'POST',
-                    f"{app.config['BACKEND_URL']}/api/stream",
-                    json={'prompt': prompt, 'model': model}
-                ) as response:
-                    response.raise_for_status()
-                    first_chunk = True
-                    chunk_count = 0
-                    for chunk in response.iter_text():
-                        if chunk:
-                            if first_chunk:
-                                logger.info(
-                                    f"[{request_id}] {front_text('log_front_first_chunk', ms=f'{(time.time() - backend_request_start)*1000:.2f}') }"
-                                )
-                                first_chunk = False
-                            chunk_count += 1
-                            ai_content += chunk
-                            yield chunk
+            with backend_stream('/api/stream', {'prompt': prompt, 'model': model}, timeout=60.0) as response:
+                response.raise_for_status()
+                first_chunk = True
+                chunk_count = 0
+                for chunk in response.iter_text():
+                    if chunk:
+                        if first_chunk:
+                            logger.info(
+                                f"[{request_id}] {front_text('log_front_first_chunk', ms=f'{(time.time() - backend_request_start)*1000:.2f}') }"
+                            )
+                            first_chunk = False
+                        chunk_count += 1
+                        stream_metrics.chunk()
+                        ai_content += chunk
+                        yield chunk
             
             total_time = time.time() - start_time
             logger.info(
@@ -176,6 +341,7 @@ def chat_stream():
             messages_store[session_id].append(ai_message)
             
         except Exception as e:
+            stream_metrics.error(type(e).__name__)
             error_msg = front_text('error_block', error=str(e))
             yield error_msg
             
@@ -187,7 +353,7 @@ def chat_stream():
             }
             messages_store[session_id].append(ai_message)
     
-    return Response(stream_with_context(generate()), content_type='text/plain')
+    return Response(stream_with_context(stream_metrics.observe(generate())), content_type='text/plain')
 
 
 @app.route('/api/rag/stream', methods=['POST'])
@@ -202,26 +368,27 @@ def guideline_stream():
     
     if not prompt:
         return jsonify({'error': 'prompt required'}), 400
+    stream_metrics = metrics.StreamMetrics('/api/rag/stream', metrics_model(model))
+
+    if wants_sse():
+        return relay_sse('/api/rag/stream', {'prompt': prompt, 'model': model}, 60.0, stream_metrics, lambda text: stream_metrics.chunk())
     
     def generate():
         """Generate streaming response"""
         try:
-            with httpx.Client(timeout=60.0) as client:
-                with client.stream(
-                    'POST',
-                    f"{app.config['BACKEND_URL']}/api/rag/stream",
-                    json={'prompt': prompt, 'model': model}
-                ) as response:
-                    response.raise_for_status()
-                    for chunk in response.iter_text():
-                        if chunk:
-                            yield chunk
+            with backend_stream('/api/rag/stream', {'prompt': prompt, 'model': model}, timeout=60.0) as response:
+                response.raise_for_status()
+                for chunk in response.iter_text():
+                    if chunk:
+                        stream_metrics.chunk()
+                        yield chunk
             
         except Exception as e:
+            stream_metrics.error(type(e).__name__)
             error_msg = front_text('error_block', error=str(e))
             yield error_msg
     
-    return Response(stream_with_context(generate()), content_type='text/plain')
+    return Response(stream_with_context(stream_metrics.observe(generate())), content_type='text/plain')
 
 
 @app.route('/api/chat/multi-agent-stream', methods=['POST'])
@@ -234,6 +401,7 @@ def multi_agent_stream():
     prompt = data.get('prompt', '')
     session_id = data.get('session_id', 'default')
     model = data.get('model', 'gpt-4.1-mini')
+    protocol = data.get('protocol', 1)
     
     logger.info(f"[{request_id}] {front_text('log_front_multi_request_received', model=model)}")
     
@@ -250,6 +418,22 @@ def multi_agent_stream():
         'timestamp': datetime.now().isoformat()
     }
     messages_store[session_id].append(user_message)
+    stream_metrics = metrics.StreamMetrics('/api/chat/multi-agent-stream', metrics_model(model))
+
+    if wants_sse():
+        ai_message = {
+            'is_user': False,
+            'is_multi_agent': True,
+            'timestamp': datetime.now().isoformat(),
+            'critical_content': '',
+            'positive_content': '',
+            'synthesis_content': ''
+        }
+        return relay_sse(
+            '/api/multi-agent-stream', {'prompt': prompt, 'model': model, 'protocol': protocol}, 120.0, stream_metrics,
+            track_agents(stream_metrics, ai_message, MULTI_AGENT_FIELDS),
+            lambda: messages_store[session_id].append(ai_message),
+        )
     
     def generate():
         """Generate multi-agent streaming response"""
@@ -267,39 +451,31 @@ def multi_agent_stream():
             logger.info(f"[{request_id}] {front_text('log_front_send_multi_backend', model=model)}")
             first_response = True
             line_count = 0
-            with httpx.Client(timeout=120.0) as client:
-                with client.stream(
-                    'POST',
-                    f"{app.config['BACKEND_URL']}/api/multi-agent-stream",
-                    json={'prompt': prompt, 'model': model}
-                ) as response:
-                    response.raise_for_status()
-                    for line in response.iter_lines():
-                        if line.strip():
-                            try:
-                                if first_response:
-                                    logger.info(
-                                        f"[{request_id}] {front_text('log_front_first_response', ms=f'{(time.time() - backend_request_start)*1000:.2f}') }"
-                                    )
-                                    first_response = False
-                                line_count += 1
-                                # Send in JSON-Lines format
-                                yield line + '\n'
+            with backend_stream('/api/multi-agent-stream', {'prompt': prompt, 'model': model, 'protocol': protocol}, timeout=120.0) as response:
+                response.raise_for_status()
+                decoder = StreamDecoder()
+                for line in response.iter_lines():
+                    if line.strip():
+                        try:
+                            if first_response:
+                                logger.info(
+                                    f"[{request_id}] {front_text('log_front_first_response', ms=f'{(time.time() - backend_request_start)*1000:.2f}') }"
+                                )
+                                first_response = False
+                            line_count += 1
+                            # Send in JSON-Lines format (in the protocol version the browser asked for)
+                            yield line + '\n'
+                            
+                            # Update message store
+                            delta = decoder.delta(line)
+                            if delta is not None:
+                                agent, content = delta
+                                stream_metrics.chunk(agent)
                                 
-                                # Update message store
-                                data = json.loads(line)
-                                if 'agent' in data and 'content' in data:
-                                    agent = data['agent']
-                                    content = data['content']
-                                    
-                                    if agent == 'CriticalAnalyst':
-                                        ai_message['critical_content'] += content
-                                    elif agent == 'PositiveAdvocate':
-                                        ai_message['positive_content'] += content
-                                    elif agent == 'Synthesizer':
-                                        ai_message['synthesis_content'] += content
-                            except json.JSONDecodeError:
-                                continue
+                                if agent in MULTI_AGENT_FIELDS:
+                                    ai_message[MULTI_AGENT_FIELDS[agent]] += content
+                        except ValueError:
+                            continue
             
             total_time = time.time() - start_time
             logger.info(
@@ -310,13 +486,14 @@ def multi_agent_stream():
             messages_store[session_id].append(ai_message)
             
         except Exception as e:
+            stream_metrics.error(type(e).__name__)
             error_data = {'type': 'error', 'message': str(e)}
             yield json.dumps(error_data) + '\n'
             
             ai_message['synthesis_content'] = front_text('error_inline', error=str(e))
             messages_store[session_id].append(ai_message)
     
-    return Response(stream_with_context(generate()), content_type='text/plain')
+    return Response(stream_with_context(stream_metrics.observe(generate())), content_type='text/plain')
 
 
 @app.route('/api/chat/idobata-stream', methods=['POST'])
@@ -330,6 +507,9 @@ def idobata_stream():
     session_id = data.get('session_id', 'idobata')
     model = data.get('model', 'gpt-4.1-mini')
     tone = data.get('tone', 'balanced')
+    protocol = data.get('protocol', 1)
+    # Board execution mode (group_chat / dag); the backend's BOARD_MODE applies when omitted
+    mode = data.get('mode')
 
     logger.info(
         f"[{request_id}] {front_text('log_front_board_request_received', model=model, tone=tone)}"
@@ -347,6 +527,26 @@ def idobata_stream():
         'timestamp': datetime.now().isoformat()
     }
     messages_store[session_id].append(user_message)
+    stream_metrics = metrics.StreamMetrics('/api/chat/idobata-stream', metrics_model(model))
+
+    if wants_sse():
+        ai_message = {
+            'is_user': False,
+            'is_planning': True,
+            'timestamp': datetime.now().isoformat(),
+            'planning_content': '',
+            'tech_content': '',
+            'business_content': '',
+            'synthesis_content': ''
+        }
+        return relay_sse(
+            '/api/phase1/stream',
+            {'prompt': prompt, 'model': model, 'tone': tone, 'protocol': protocol, 'mode': mode},
+            180.0,
+            stream_metrics,
+            track_agents(stream_metrics, ai_message, BOARD_FIELDS),
+            lambda: messages_store[session_id].append(ai_message),
+        )
 
     def generate():
         ai_message = {
@@ -366,40 +566,29 @@ def idobata_stream():
             )
             first_response = True
             line_count = 0
-            with httpx.Client(timeout=180.0) as client:
-                with client.stream(
-                    'POST',
-                    f"{app.config['BACKEND_URL']}/api/phase1/stream",
-                    json={'prompt': prompt, 'model': model, 'tone': tone}
-                ) as response:
-                    response.raise_for_status()
-                    for line in response.iter_lines():
-                        if line.strip():
-                            try:
-                                if first_response:
-                                    logger.info(
-                                        f"[{request_id}] {front_text('log_front_first_response', ms=f'{(time.time() - backend_request_start)*1000:.2f}') }"
-                                    )
-                                    first_response = False
-                                line_count += 1
-                                yield line + '\n'
-
-                                data = json.loads(line)
-                                if 'agent' in data and 'content' in data:
-                                    agent = data['agent']
-                                    content = data['content']
-
-                                    # Backend (/api/phase1/stream) returns CEO/CTO/CFO/COO
-                                    if agent == 'CEO':
-                                        ai_message['planning_content'] += content
-                                    elif agent == 'CTO':
-                                        ai_message['tech_content'] += content
-                                    elif agent == 'CFO':
-                                        ai_message['business_content'] += content
-                                    elif agent == 'COO':
-                                        ai_message['synthesis_content'] += content
-                            except json.JSONDecodeError:
-                                continue
+            with backend_stream('/api/phase1/stream', {'prompt': prompt, 'model': model, 'tone': tone, 'protocol': protocol, 'mode': mode}, timeout=180.0) as response:
+                response.raise_for_status()
+                decoder = StreamDecoder()
+                for line in response.iter_lines():
+                    if line.strip():
+                        try:
+                            if first_response:
+                                logger.info(
+                                    f"[{request_id}] {front_text('log_front_first_response', ms=f'{(time.time() - backend_request_start)*1000:.2f}') }"
+                                )
+                                first_response = False
+                            line_count += 1
+                            yield line + '\n'
+
+                            delta = decoder.delta(line)
+                            if delta is not None:
+                                agent, content = delta
+                                stream_metrics.chunk(agent)
+
+                                if agent in BOARD_FIELDS:
+                                    ai_message[BOARD_FIELDS[agent]] += content
+                        except ValueError:
+                            continue
 
             total_time = time.time() - start_time
             logger.info(
@@ -409,15 +598,27 @@ def idobata_stream():
             messages_store[session_id].append(ai_message)
 
         except Exception as e:
+            stream_metrics.error(type(e).__name__)
             error_data = {'type': 'error', 'message': str(e)}
             yield json.dumps(error_data) + '\n'
 
             ai_message['synthesis_content'] = front_text('error_inline', error=str(e))
             messages_store[session_id].append(ai_message)
 
-    return Response(stream_with_context(generate()), content_type='text/plain')
+    return Response(stream_with_context(stream_metrics.observe(generate())), content_type='text/plain')
 
 
+
+@app.route('/api/streams/<stream_id>', methods=['GET'])
+def resume_stream(stream_id):
+    """Resume an SSE-mode stream after its Last-Event-ID (replayed from the backend's buffer)"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    stream_metrics = metrics.StreamMetrics('/api/streams', None)
+    return relay_sse(
+        f"/api/streams/{stream_id}", None, 180.0, stream_metrics, lambda data: stream_metrics.chunk(),
+        method='GET', headers={'Last-Event-ID': last_event_id} if last_event_id else None,
+    )
+
 if __name__ == '__main__':
     port = int(os.getenv("PORT", "5000"))
     debug = os.getenv("FLASK_DEBUG", "0").lower() in ("1", "true", "yes", "on")
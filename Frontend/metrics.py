@@ -0,0 +1,134 @@
+# Prometheus metrics for the Flask streaming relay (TTFT, inter-chunk gaps, throughput)
+
+import time
+from typing import Dict, Iterator, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+
+REGISTRY = CollectorRegistry(auto_describe=True)
+
+_STREAM_LABELS = ["endpoint", "model"]
+_AGENT_LABELS = _STREAM_LABELS + ["agent"]
+
+STREAM_TTFT = Histogram(
+    "frontend_stream_ttft_seconds",
+    "Time from request start to the first relayed chunk of each agent",
+    _AGENT_LABELS,
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8, 13, 20, 30, 60),
+    registry=REGISTRY,
+)
+STREAM_CHUNK_GAP = Histogram(
+    "frontend_stream_chunk_gap_seconds",
+    "Gap between consecutive relayed chunks of the same agent",
+    _AGENT_LABELS,
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10),
+    registry=REGISTRY,
+)
+STREAM_CHUNKS = Counter(
+    "frontend_stream_chunks_total",
+    "Relayed chunks",
+    _AGENT_LABELS,
+    registry=REGISTRY,
+)
+STREAM_DURATION = Histogram(
+    "frontend_stream_duration_seconds",
+    "Total duration of completed relayed streams",
+    _STREAM_LABELS,
+    buckets=(0.5, 1, 2, 3, 5, 8, 13, 20, 30, 45, 60, 90, 120, 180, 300),
+    registry=REGISTRY,
+)
+STREAM_THROUGHPUT = Histogram(
+    "frontend_stream_chunks_per_second",
+    "Chunks per second over the lifetime of completed relayed streams",
+    _STREAM_LABELS,
+    buckets=(1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 200, 350, 500),
+    registry=REGISTRY,
+)
+STREAM_IN_FLIGHT = Gauge(
+    "frontend_streams_in_flight",
+    "Streams currently being relayed",
+    _STREAM_LABELS,
+    registry=REGISTRY,
+)
+STREAM_ERRORS = Counter(
+    "frontend_stream_errors_total",
+    "Relayed streams that ended with an error, by kind",
+    _STREAM_LABELS + ["kind"],
+    registry=REGISTRY,
+)
+STREAM_CANCELLED = Counter(
+    "frontend_stream_cancelled_total",
+    "Relayed streams abandoned by the browser; closing the upstream request cancels the backend run",
+    _STREAM_LABELS,
+    registry=REGISTRY,
+)
+STREAM_CANCELLED_WORK = Histogram(
+    "frontend_stream_cancelled_work_seconds",
+    "How long a relayed stream had been running when the browser went away",
+    _STREAM_LABELS,
+    buckets=(0.5, 1, 2, 3, 5, 8, 13, 20, 30, 45, 60, 90, 120, 180, 300),
+    registry=REGISTRY,
+)
+
+
+class StreamMetrics:
+    """
+    Per-request recorder for one relayed stream.
+
+    Create it when the request arrives, call `chunk(agent)` for every content chunk
+    and wrap the response generator with `observe()`.
+    """
+
+    def __init__(self, endpoint: str, model: Optional[str]):
+        self._labels = (endpoint, model or "")
+        self._start = time.perf_counter()
+        self._last_chunk: Dict[str, float] = {}
+        self.chunks = 0
+        self.failed = False
+
+    def chunk(self, agent: str = "") -> None:
+        now = time.perf_counter()
+        labels = self._labels + (agent,)
+        last = self._last_chunk.get(agent)
+        if last is None:
+            STREAM_TTFT.labels(*labels).observe(now - self._start)
+        else:
+            STREAM_CHUNK_GAP.labels(*labels).observe(now - last)
+        self._last_chunk[agent] = now
+        STREAM_CHUNKS.labels(*labels).inc()
+        self.chunks += 1
+
+    def error(self, kind: str) -> None:
+        self.failed = True
+        STREAM_ERRORS.labels(*self._labels, kind).inc()
+
+    def observe(self, stream: Iterator) -> Iterator:
+        """Pass a response generator through, recording in-flight, duration, throughput and errors."""
+        in_flight = STREAM_IN_FLIGHT.labels(*self._labels)
+        in_flight.inc()
+        try:
+            yield from stream
+        except GeneratorExit:
+            # Browser went away before the stream finished; leaving the relay's `with client.stream(...)`
+            # closes the backend connection, which cancels the run there
+            self.error("disconnected")
+            STREAM_CANCELLED.labels(*self._labels).inc()
+            STREAM_CANCELLED_WORK.labels(*self._labels).observe(time.perf_counter() - self._start)
+            raise
+        except Exception as exc:
+            self.error(type(exc).__name__)
+            raise
+        else:
+            if self.failed:
+                return
+            duration = time.perf_counter() - self._start
+            STREAM_DURATION.labels(*self._labels).observe(duration)
+            if duration > 0:
+                STREAM_THROUGHPUT.labels(*self._labels).observe(self.chunks / duration)
+        finally:
+            in_flight.dec()
+
+
+def render() -> tuple:
+    """Current metrics in the Prometheus text exposition format, with its content type."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
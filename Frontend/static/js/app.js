@@ -769,12 +769,31 @@ async function streamNormalChat(prompt, aiMessage) {
     }
 }
 
+// Agent stream protocol: v2 sends a header frame {"v":2,"agents":[...]} and then
+// [agentIndex, delta] arrays; control events stay {"type": ...} objects.
+const STREAM_PROTOCOL = 2;
+
+function createStreamDecoder() {
+    let agents = [];
+    return function decode(line) {
+        const data = JSON.parse(line);
+        if (Array.isArray(data)) {
+            return { agent: agents[data[0]], content: data[1] };
+        }
+        if (data.v === 2 && Array.isArray(data.agents)) {
+            agents = data.agents;
+            return {};
+        }
+        return data;
+    };
+}
+
 async function streamMultiAgentChat(prompt, aiMessage) {
     const selectedModel = modelSelect.value;
     const response = await fetch('/api/chat/multi-agent-stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ prompt, session_id: sessionId, model: selectedModel })
+        body: JSON.stringify({ prompt, session_id: sessionId, model: selectedModel, protocol: STREAM_PROTOCOL })
     });
     
     if (!response.ok) {
@@ -783,6 +802,7 @@ async function streamMultiAgentChat(prompt, aiMessage) {
     
     const reader = response.body.getReader();
     const decoder = new TextDecoder();
+    const decodeFrame = createStreamDecoder();
     let buffer = '';
     
     while (true) {
@@ -796,7 +816,7 @@ async function streamMultiAgentChat(prompt, aiMessage) {
         for (const line of lines) {
             if (line.trim()) {
                 try {
-                    const data = JSON.parse(line);
+                    const data = decodeFrame(line);
                     
                     if (data.type === 'synthesis_start') {
                         aiMessage.synthesis_streaming = true;
@@ -842,7 +862,7 @@ async function streamIdobataChat(prompt, aiMessage) {
     const response = await fetch('/api/chat/idobata-stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ prompt, session_id: sessionIdIdobata, model: selectedModel, tone: selectedTone })
+        body: JSON.stringify({ prompt, session_id: sessionIdIdobata, model: selectedModel, tone: selectedTone, protocol: STREAM_PROTOCOL })
     });
 
     if (!response.ok) {
@@ -851,6 +871,7 @@ async function streamIdobataChat(prompt, aiMessage) {
 
     const reader = response.body.getReader();
     const decoder = new TextDecoder();
+    const decodeFrame = createStreamDecoder();
     let buffer = '';
 
     while (true) {
@@ -864,7 +885,7 @@ async function streamIdobataChat(prompt, aiMessage) {
         for (const line of lines) {
             if (line.trim()) {
                 try {
-                    const data = JSON.parse(line);
+                    const data = decodeFrame(line);
                     if (data.agent && data.content) {
                         updatePlanningContent(aiMessage, data.agent, data.content);
                         scrollToBottomIdobata();
@@ -0,0 +1,39 @@
+# Decoding of the backend's NDJSON agent streams (v1 objects or compact v2 frames)
+
+import json
+from typing import List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib decoder
+    orjson = None
+
+
+def loads(line):
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+class StreamDecoder:
+    """Turns each line of either protocol version into (agent, content) deltas."""
+
+    def __init__(self):
+        self.agents: List[str] = []
+
+    def delta(self, line: str) -> Optional[Tuple[str, str]]:
+        """Return (agent, content) for content frames, None for headers/control events; raises ValueError on bad JSON."""
+        data = loads(line)
+        if isinstance(data, list):
+            index, content = data[0], data[1]
+            if 0 <= index < len(self.agents):
+                return self.agents[index], content
+            return None
+        if not isinstance(data, dict):
+            return None
+        if data.get("v") == 2 and "agents" in data:
+            self.agents = list(data["agents"])
+            return None
+        if 'agent' in data and 'content' in data:
+            return data['agent'], data['content']
+        return None
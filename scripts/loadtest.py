@@ -0,0 +1,454 @@
+#!/usr/bin/env python
+"""
+Load generator for the streaming endpoints, directly against the Backend and/or through the
+Flask Frontend relay. Reports TTFT, duration and per-stream throughput percentiles, error
+counts, and the CPU / memory of each tier.
+
+Offline run (servers started here, every LLM call served by the mock client):
+
+    python scripts/loadtest.py --spawn --via both --concurrency 20 --duration 60
+
+Against running servers (give their PIDs to sample CPU / memory):
+
+    python scripts/loadtest.py --via frontend --rate 5 --duration 120 --frontend-pid 4242
+
+Extra backend settings for --spawn, e.g. a slow, rate-limited deployment:
+
+    python scripts/loadtest.py --spawn --env MOCK_LLM_TTFT_MS=800 --env MOCK_LLM_RATE_LIMIT_RATE=0.1
+
+Benchmark corpus: record real runs with RECORD_DIR set on the Backend, then replay them
+(the Backend serves each recorded prompt from its recording, at REPLAY_SPEED):
+
+    python scripts/loadtest.py --spawn --via both --recordings ./recordings --env REPLAY_SPEED=4
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+
+try:
+    import psutil
+except ImportError:  # psutil is optional; /proc is read instead (Linux only)
+    psutil = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (Backend path, Frontend path, NDJSON)
+ENDPOINTS = {
+    "chat": ("/api/stream", "/api/chat/stream", False),
+    "rag": ("/api/rag/stream", "/api/rag/stream", False),
+    "multi_agent": ("/api/multi-agent-stream", "/api/chat/multi-agent-stream", True),
+    "board": ("/api/phase1/stream", "/api/chat/idobata-stream", True),
+}
+
+# Plain-text streams report failures in-band: the Backend's error_stream_processing text and the
+# Frontend's error_block, in either language
+TEXT_ERROR_MARKERS = (
+    "応答の生成中にエラーが発生しました: ",
+    "An error occurred while generating the response: ",
+    "❌ エラー: ",
+    "❌ Error: ",
+)
+
+PROMPTS = [
+    "Should we expand our subscription product to the European market next year?",
+    "What are the risks of moving our on-premises data platform to the cloud?",
+    "How should a 20-person startup prioritise security work?",
+    "Is it worth building our own recommendation engine instead of buying one?",
+]
+
+
+@dataclass
+class Sample:
+    endpoint: str
+    tier: str
+    status: int = 0
+    ttft: Optional[float] = None
+    duration: float = 0.0
+    chars: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class TierUsage:
+    cpu: List[float] = field(default_factory=list)
+    rss_mb: List[float] = field(default_factory=list)
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _delta(line: str):
+    """Content of one NDJSON line (v1 object or v2 frame), or an error message."""
+    try:
+        event = json.loads(line)
+    except ValueError:
+        return None, None
+    if isinstance(event, list) and len(event) >= 2 and isinstance(event[1], str):
+        return event[1], None
+    if isinstance(event, dict):
+        if event.get("type") == "error":
+            return None, event.get("message") or "error event"
+        if "type" not in event and isinstance(event.get("content"), str):
+            return event["content"], None
+    return None, None
+
+
+def load_recordings(directory: str) -> List[tuple]:
+    """(endpoint, prompt, model) of every recording in `directory` made on one of ENDPOINTS."""
+    by_path = {backend_path: name for name, (backend_path, _, _) in ENDPOINTS.items()}
+    requests = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".jsonl.gz"):
+            continue
+        with gzip.open(os.path.join(directory, name), "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+        endpoint = by_path.get(header.get("endpoint"))
+        if endpoint and header.get("prompt"):
+            requests.append((endpoint, header["prompt"], header.get("model")))
+    return requests
+
+
+async def one_request(client: httpx.AsyncClient, base_url: str, tier: str, endpoint: str, prompt: str, model: str) -> Sample:
+    backend_path, frontend_path, ndjson = ENDPOINTS[endpoint]
+    path = backend_path if tier == "backend" else frontend_path
+    body = {"prompt": prompt, "model": model, "session_id": "loadtest"}
+    sample = Sample(endpoint, tier)
+    start = time.perf_counter()
+    try:
+        async with client.stream("POST", base_url + path, json=body) as response:
+            sample.status = response.status_code
+            if response.status_code != 200:
+                await response.aread()
+                sample.error = f"HTTP {response.status_code}"
+                return sample
+            if ndjson:
+                async for line in response.aiter_lines():
+                    content, error = _delta(line) if line.strip() else (None, None)
+                    if error:
+                        sample.error = error[:120]
+                    if content:
+                        if sample.ttft is None:
+                            sample.ttft = time.perf_counter() - start
+                        sample.chars += len(content)
+            else:
+                tail = ""
+                async for text in response.aiter_text():
+                    if text:
+                        if sample.ttft is None:
+                            sample.ttft = time.perf_counter() - start
+                        sample.chars += len(text)
+                        tail = (tail + text)[-2000:]
+                for marker in TEXT_ERROR_MARKERS:
+                    if marker in tail:
+                        sample.error = tail.rsplit(marker, 1)[1].strip()[:120] or "error text"
+                        break
+    except Exception as exc:
+        sample.error = type(exc).__name__
+    finally:
+        sample.duration = time.perf_counter() - start
+    return sample
+
+
+class ProcessSampler:
+    """CPU % and RSS of a process and its children (e.g. uvicorn workers), sampled periodically."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self._last: Dict[int, float] = {}
+        self._last_time = time.monotonic()
+
+    def _pids(self) -> List[int]:
+        if psutil is not None:
+            try:
+                parent = psutil.Process(self.pid)
+                return [parent.pid] + [child.pid for child in parent.children(recursive=True)]
+            except psutil.Error:
+                return []
+        pids = [self.pid]
+        for pid in pids:
+            try:
+                with open(f"/proc/{pid}/task/{pid}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+            except OSError:
+                pass
+        return pids
+
+    @staticmethod
+    def _read(pid: int):
+        """(cpu seconds, rss bytes) of one process."""
+        if psutil is not None:
+            process = psutil.Process(pid)
+            times = process.cpu_times()
+            return times.user + times.system, process.memory_info().rss
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        cpu = (int(fields[11]) + int(fields[12])) / ticks
+        return cpu, int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+
+    def sample(self):
+        now = time.monotonic()
+        elapsed = max(now - self._last_time, 1e-6)
+        cpu_percent, rss, current = 0.0, 0, {}
+        for pid in self._pids():
+            try:
+                cpu, memory = self._read(pid)
+            except (OSError, ValueError, IndexError) if psutil is None else (psutil.Error, OSError):
+                continue
+            current[pid] = cpu
+            rss += memory
+            if pid in self._last:
+                cpu_percent += (cpu - self._last[pid]) / elapsed * 100
+        self._last, self._last_time = current, now
+        return cpu_percent, rss / (1024 * 1024)
+
+
+async def sample_resources(samplers: Dict[str, ProcessSampler], usage: Dict[str, TierUsage], stop: asyncio.Event, interval: float):
+    for sampler in samplers.values():
+        sampler.sample()  # baseline for the first CPU delta
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        for tier, sampler in samplers.items():
+            cpu, rss = sampler.sample()
+            usage[tier].cpu.append(cpu)
+            usage[tier].rss_mb.append(rss)
+
+
+async def run_load(args, targets: Dict[str, str]) -> List[Sample]:
+    samples: List[Sample] = []
+    endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    if args.recordings:
+        corpus = [(endpoint, prompt, model or args.model) for endpoint, prompt, model in load_recordings(args.recordings) if endpoint in endpoints]
+        if not corpus:
+            raise SystemExit(f"no recordings of {args.endpoints} in {args.recordings}")
+    else:
+        corpus = [(endpoint, None, args.model) for endpoint in endpoints]
+    jobs = [(tier, url, *request) for tier, url in targets.items() for request in corpus]
+    deadline = time.monotonic() + args.duration
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=args.concurrency or 100)
+    timeout = httpx.Timeout(args.timeout, connect=10)
+    counter = {"started": 0}
+
+    def next_job():
+        if time.monotonic() >= deadline or (args.requests and counter["started"] >= args.requests):
+            return None
+        counter["started"] += 1
+        return jobs[counter["started"] % len(jobs)]
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        if args.rate:
+            # Open loop: Poisson arrivals at --rate requests/second, whatever the latency
+            tasks = []
+            while True:
+                job = next_job()
+                if job is None:
+                    break
+                tier, url, endpoint, prompt, model = job
+                tasks.append(asyncio.create_task(one_request(client, url, tier, endpoint, prompt or random.choice(PROMPTS), model)))
+                await asyncio.sleep(random.expovariate(args.rate))
+            samples.extend(await asyncio.gather(*tasks))
+        else:
+            # Closed loop: --concurrency virtual users, each sending its next request when the last ends
+            async def user():
+                while True:
+                    job = next_job()
+                    if job is None:
+                        return
+                    tier, url, endpoint, prompt, model = job
+                    samples.append(await one_request(client, url, tier, endpoint, prompt or random.choice(PROMPTS), model))
+
+            await asyncio.gather(*[user() for _ in range(args.concurrency)])
+    return samples
+
+
+def report(samples: List[Sample], usage: Dict[str, TierUsage], elapsed: float) -> dict:
+    def stats(values: List[float], scale: float = 1.0) -> dict:
+        return {
+            name: None if percentile(values, q) is None else round(percentile(values, q) * scale, 2)
+            for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))
+        }
+
+    groups: Dict[str, List[Sample]] = {}
+    for sample in samples:
+        groups.setdefault(f"{sample.tier}:{sample.endpoint}", []).append(sample)
+    result = {"elapsed_s": round(elapsed, 2), "requests": len(samples), "endpoints": {}, "tiers": {}}
+    for name, group in sorted(groups.items()):
+        ok = [s for s in group if s.error is None]
+        errors: Dict[str, int] = {}
+        for s in group:
+            if s.error is not None:
+                errors[s.error] = errors.get(s.error, 0) + 1
+        result["endpoints"][name] = {
+            "requests": len(group),
+            "rps": round(len(group) / elapsed, 2) if elapsed else None,
+            "error_rate": round(1 - len(ok) / len(group), 4),
+            "errors": errors,
+            "ttft_ms": stats([s.ttft for s in ok if s.ttft is not None], 1000),
+            "duration_ms": stats([s.duration for s in ok], 1000),
+            "chars_per_s": stats([s.chars / s.duration for s in ok if s.duration > 0]),
+        }
+    for tier, tier_usage in usage.items():
+        result["tiers"][tier] = {
+            "cpu_percent": {
+                "avg": round(sum(tier_usage.cpu) / len(tier_usage.cpu), 1) if tier_usage.cpu else None,
+                **stats(tier_usage.cpu),
+            },
+            "rss_mb": {"max": round(max(tier_usage.rss_mb), 1) if tier_usage.rss_mb else None, **stats(tier_usage.rss_mb)},
+        }
+    return result
+
+
+def print_report(result: dict) -> None:
+    print(f"\n{result['requests']} requests in {result['elapsed_s']}s")
+    header = f"{'endpoint':34} {'req':>6} {'rps':>7} {'err%':>6} {'ttft p50/p90/p99 ms':>24} {'dur p50/p99 ms':>18} {'chars/s p50':>12}"
+    print(header)
+    print("-" * len(header))
+    for name, row in result["endpoints"].items():
+        ttft = "/".join("-" if v is None else f"{v:.0f}" for v in row["ttft_ms"].values())
+        duration = f"{row['duration_ms']['p50'] or 0:.0f}/{row['duration_ms']['p99'] or 0:.0f}"
+        print(
+            f"{name:34} {row['requests']:>6} {row['rps'] or 0:>7.2f} {row['error_rate'] * 100:>6.1f} "
+            f"{ttft:>24} {duration:>18} {row['chars_per_s']['p50'] or 0:>12.0f}"
+        )
+        if row["errors"]:
+            print(f"{'':34} errors: {row['errors']}")
+    for tier, row in result["tiers"].items():
+        print(f"{tier:10} CPU avg {row['cpu_percent']['avg']}% p99 {row['cpu_percent']['p99']}%  RSS max {row['rss_mb']['max']} MB")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=2)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.3)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def spawn_servers(args) -> Dict[str, subprocess.Popen]:
+    """Start the Backend (mock LLM) and, when needed, the Frontend on free local ports."""
+    env = {**os.environ, "MOCK_LLM": "true", "AZURE_OPENAI_POOL_WARMUP": "false"}
+    if args.recordings:
+        env["REPLAY_DIR"] = os.path.abspath(args.recordings)
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    processes = {}
+    backend_port = _free_port()
+    processes["backend"] = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(backend_port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=os.path.join(ROOT, "Backend"), env=env,
+        stdout=subprocess.DEVNULL if not args.server_logs else None, stderr=subprocess.DEVNULL if not args.server_logs else None,
+    )
+    args.backend_url = f"http://127.0.0.1:{backend_port}"
+    if args.via in ("frontend", "both"):
+        frontend_port = _free_port()
+        processes["frontend"] = subprocess.Popen(
+            [sys.executable, "app.py"],
+            cwd=os.path.join(ROOT, "Frontend"),
+            env={**env, "PORT": str(frontend_port), "HOST": "127.0.0.1", "BACKEND_URL": args.backend_url},
+            stdout=subprocess.DEVNULL if not args.server_logs else None, stderr=subprocess.DEVNULL if not args.server_logs else None,
+        )
+        args.frontend_url = f"http://127.0.0.1:{frontend_port}"
+    _wait_ready(args.backend_url + "/")
+    if "frontend" in processes:
+        _wait_ready(args.frontend_url + "/")
+    return processes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--via", choices=("backend", "frontend", "both"), default="backend")
+    parser.add_argument("--backend-url", default="http://localhost:8000")
+    parser.add_argument("--frontend-url", default="http://localhost:5000")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help=f"comma-separated subset of {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", type=int, default=10, help="closed loop: concurrent virtual users")
+    parser.add_argument("--rate", type=float, default=0, help="open loop: requests per second (overrides --concurrency)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to keep starting requests")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests (0 = no limit)")
+    parser.add_argument("--timeout", type=float, default=180)
+    parser.add_argument("--model", default="gpt-4.1-mini")
+    parser.add_argument("--recordings", help="replay the prompts of these recordings (with --spawn: also REPLAY_DIR)")
+    parser.add_argument("--spawn", action="store_true", help="start the servers here with MOCK_LLM=true")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for --spawn")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra Backend setting for --spawn")
+    parser.add_argument("--server-logs", action="store_true", help="show the spawned servers' output")
+    parser.add_argument("--backend-pid", type=int, help="sample this Backend process (with --spawn: automatic)")
+    parser.add_argument("--frontend-pid", type=int, help="sample this Frontend process (with --spawn: automatic)")
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+    for name in args.endpoints.split(","):
+        if name.strip() and name.strip() not in ENDPOINTS:
+            parser.error(f"unknown endpoint {name!r}")
+
+    processes = spawn_servers(args) if args.spawn else {}
+    try:
+        targets = {}
+        if args.via in ("backend", "both"):
+            targets["backend"] = args.backend_url
+        if args.via in ("frontend", "both"):
+            targets["frontend"] = args.frontend_url
+        pids = {"backend": args.backend_pid, "frontend": args.frontend_pid}
+        pids.update({tier: process.pid for tier, process in processes.items()})
+        samplers = {tier: ProcessSampler(pid) for tier, pid in pids.items() if pid}
+        usage = {tier: TierUsage() for tier in samplers}
+
+        async def run():
+            stop = asyncio.Event()
+            sampler_task = asyncio.create_task(sample_resources(samplers, usage, stop, args.sample_interval))
+            start = time.perf_counter()
+            samples = await run_load(args, targets)
+            elapsed = time.perf_counter() - start
+            stop.set()
+            await sampler_task
+            return samples, elapsed
+
+        load = "rate %.2f/s" % args.rate if args.rate else "concurrency %d" % args.concurrency
+        print(f"Load test: {', '.join(targets)} | {args.endpoints} | {load} | {args.duration:.0f}s")
+        samples, elapsed = asyncio.run(run())
+        result = report(samples, usage, elapsed)
+        print_report(result)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()